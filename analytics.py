@@ -0,0 +1,249 @@
+# analytics.py
+"""
+ניצולת כיתות לצוות: אילו כיתות עומדות ריקות ומתי.
+
+- מפת חום לכל כיתה: יום בשבוע × שעה -> אחוז תפוסה בטווח תאריכים.
+- שריונים פעילים מול מבוטלים לכל כיתה.
+
+שריונים: מה-rollups המחושבים מראש (room_usage_daily / room_usage_hourly),
+שמתרעננים רק ל-(תאריך, כיתה) שהשתנו — כך טווח של שנים לא סורק את reservations.
+ה-request רק קורא את ה-rollups + צעד ריענון חסום (refresh_step); השלמה של
+backlog גדול (למשל אחרי מיגרציה) — ב-RollupCatchup ברקע או ב-python migrations.py upgrade.
+מערכת שבועית: bitmap אחד לכל (כיתה, יום) כפול מספר הפעמים שהיום מופיע בטווח.
+
+KPI תחזוקה: פתיחות, סגירות, ממוצע ו-p90 של זמן טיפול לכל כיתה
+וקטגוריה — מ-report_kpi_daily שמתעדכן מיומן מעברי הסטטוס.
+"""
+import json
+import threading
+from datetime import datetime
+
+import availability
+import db
+
+HOURS = list(range(availability.OPEN_MIN // 60, availability.CLOSE_MIN // 60))
+WORK_WEEKDAYS = (0, 1, 2, 3, 4)     # ראשון-חמישי; ימים אחרים מוצגים רק אם היה בהם שימוש
+
+# צעד הריענון שמותר בתוך request (batch אחד לכל rollup)
+REQUEST_USAGE_BATCH = 200
+REQUEST_KPI_BATCH = 1000
+
+
+def refresh_step() -> bool:
+    """ריענון חסום של ה-rollups. מחזיר True אם נשאר backlog (צריך השלמה ברקע)."""
+    db.refresh_room_usage(batch=REQUEST_USAGE_BATCH, max_batches=1)
+    db.refresh_report_kpis(batch=REQUEST_KPI_BATCH, max_batches=1)
+    return db.rollups_pending()
+
+
+class RollupCatchup:
+    """thread רקע אחד שמשלים את כל ה-rollups (db.refresh_rollups) ויוצא."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._runs = 0
+        self._last_error = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def kick(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._runs += 1
+            self._thread = threading.Thread(target=self._run, name="rollup-catchup", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            db.refresh_rollups()
+            self._last_error = None
+        except Exception as e:
+            self._last_error = str(e)
+            print("Rollup catch-up failed:", e)
+        finally:
+            db.close_connection()
+
+    def stats(self) -> dict:
+        return {"running": self.running, "runs": self._runs, "last_error": self._last_error}
+
+
+def weekday_counts(date_from: str, date_to: str) -> list[int]:
+    """כמה פעמים כל יום בשבוע (0=ראשון) מופיע בטווח (כולל)."""
+    start = datetime.strptime(date_from, "%Y-%m-%d").date()
+    end = datetime.strptime(date_to, "%Y-%m-%d").date()
+    if end < start:
+        raise ValueError("date_to is before date_from")
+    days = (end - start).days + 1
+    first = availability.weekday_of(date_from)
+    return [days // 7 + ((wd - first) % 7 < days % 7) for wd in range(7)]
+
+
+def _schedule_masks() -> dict[tuple[str, int], int]:
+    masks = {}
+    for r in db.get_weekly_schedule():
+        key = (r["room_code"], r["weekday"])
+        masks[key] = masks.get(key, 0) | availability.interval_mask(
+            availability.to_min(r["start_time"]), availability.to_min(r["end_time"])
+        )
+    return masks
+
+
+def room_utilization(date_from: str, date_to: str) -> dict:
+    """
+    {"weekdays": [...], "hours": [...], "rooms": [...], "campus": [[%]]}
+    כל כיתה: utilization (%), דקות מערכת/שריונים, active/cancelled/cancel_rate,
+    ו-heatmap[weekday][hour] באחוזים. ממוין מהכיתה הכי פחות מנוצלת.
+    """
+    counts = weekday_counts(date_from, date_to)
+
+    rooms = db.get_active_rooms()
+    n_hours = len(HOURS)
+    minutes = {r["code"]: [[0] * n_hours for _ in range(7)] for r in rooms}
+    schedule_minutes = dict.fromkeys(minutes, 0)
+
+    for (code, weekday), mask in _schedule_masks().items():
+        if code not in minutes or not counts[weekday]:
+            continue
+        per_hour = availability.hour_minutes(mask)
+        for h in range(n_hours):
+            minutes[code][weekday][h] += per_hour[h] * counts[weekday]
+        schedule_minutes[code] += mask.bit_count() * counts[weekday]
+
+    for r in db.get_room_usage_hourly(date_from, date_to):
+        grid = minutes.get(r["room"])
+        if grid is not None:
+            grid[r["weekday"]][r["hour"] - HOURS[0]] += r["minutes"]
+
+    totals = {r["room"]: r for r in db.get_room_usage_totals(date_from, date_to)}
+
+    weekdays = [
+        wd for wd in range(7)
+        if counts[wd] and (wd in WORK_WEEKDAYS or any(any(g[wd]) for g in minutes.values()))
+    ]
+    open_minutes = sum(counts[wd] for wd in weekdays) * n_hours * 60
+
+    result_rooms = []
+    campus = [[0] * n_hours for _ in range(7)]
+    for room in rooms:
+        code = room["code"]
+        grid = minutes[code]
+        t = totals.get(code)
+        active = t["active"] if t else 0
+        cancelled = t["cancelled"] if t else 0
+        reserved = t["minutes"] if t else 0
+
+        for wd in weekdays:
+            for h in range(n_hours):
+                campus[wd][h] += grid[wd][h]
+
+        result_rooms.append({
+            "code": code,
+            "name": room["name"] or code,
+            "seats": room["seats"],
+            "room_type": room["room_type"],
+            "utilization": _pct(schedule_minutes[code] + reserved, open_minutes),
+            "schedule_minutes": schedule_minutes[code],
+            "reservation_minutes": reserved,
+            "active": active,
+            "cancelled": cancelled,
+            "cancel_rate": _pct(cancelled, active + cancelled),
+            "heatmap": {wd: [_pct(m, counts[wd] * 60) for m in grid[wd]] for wd in weekdays},
+        })
+
+    result_rooms.sort(key=lambda r: (r["utilization"], r["code"]))
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "weekdays": weekdays,
+        "hours": HOURS,
+        "rooms": result_rooms,
+        "campus": {
+            wd: [_pct(m, counts[wd] * 60 * len(rooms)) for m in campus[wd]] for wd in weekdays
+        },
+    }
+
+
+def _pct(part: int, whole: int) -> float:
+    return round(100.0 * part / whole, 1) if whole else 0.0
+
+
+# -------------------------
+# Maintenance KPIs
+# -------------------------
+def hist_percentile(hist: list[list], q: float) -> float | None:
+    """
+    אחוזון (בשניות) מהיסטוגרמה של db.RESOLVE_BUCKETS_MIN.
+    אינטרפולציה בתוך הדלי, אבל רק בין המינימום למקסימום שנצפו בו —
+    כך שדיווח יחיד שטופל בשנייה לא מקבל p90 של 13 דקות.
+    """
+    total = sum(b[0] for b in hist)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for count, low, high in hist:
+        if count and seen + count >= target:
+            return low + (high - low) * (target - seen) / count
+        seen += count
+    return float(max(b[2] for b in hist if b[0]))
+
+
+def _kpi_summary(acc: dict) -> dict:
+    timed = sum(b[0] for b in acc["hist"])
+    p90 = hist_percentile(acc["hist"], 0.9)
+    return {
+        "opened": acc["opened"],
+        "started": acc["started"],
+        "resolved": acc["resolved"],
+        "reopened": acc["reopened"],
+        "open_now": acc["open_now"],
+        "mean_hours": round(acc["seconds"] / timed / 3600, 1) if timed else None,
+        "p90_hours": round(p90 / 3600, 1) if p90 is not None else None,
+    }
+
+
+def report_kpis(date_from: str, date_to: str) -> dict:
+    """
+    {"total": {...}, "rooms": [...], "categories": [...]}
+    פתיחות/סגירות בטווח, זמן טיפול ממוצע ו-p90 (שעות), ופתוחים כרגע.
+    הכל מ-rollups יומיים — בלי לסרוק את reports.
+    """
+    weekday_counts(date_from, date_to)   # ולידציה של הטווח
+
+    def empty():
+        return {"opened": 0, "started": 0, "resolved": 0, "reopened": 0, "open_now": 0,
+                "seconds": 0.0, "hist": db.empty_resolve_hist()}
+
+    total = empty()
+    by_room = {}
+    by_category = {}
+
+    for r in db.get_report_kpi_rows(date_from, date_to):
+        hist = json.loads(r["resolve_hist"])
+        for acc in (total, by_room.setdefault(r["room"], empty()),
+                    by_category.setdefault(r["category_user"], empty())):
+            for col in ("opened", "started", "resolved", "reopened"):
+                acc[col] += r[col]
+            acc["seconds"] += r["resolve_seconds"]
+            acc["hist"] = db.merge_resolve_hist(acc["hist"], hist)
+
+    for r in db.get_open_report_counts():
+        for acc in (total, by_room.setdefault(r["room"], empty()),
+                    by_category.setdefault(r["category_user"], empty())):
+            acc["open_now"] += r["open_now"]
+
+    return {
+        "total": _kpi_summary(total),
+        "rooms": sorted(
+            ({"room": k, **_kpi_summary(v)} for k, v in by_room.items()),
+            key=lambda x: (-x["opened"], -x["open_now"], x["room"]),
+        ),
+        "categories": sorted(
+            ({"category": k, **_kpi_summary(v)} for k, v in by_category.items()),
+            key=lambda x: (-x["opened"], x["category"]),
+        ),
+    }
@@ -1,99 +1,151 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort
+from flask import Flask, render_template, request, redirect, url_for, session, flash, abort, Response, jsonify
 import db
 
 from dotenv import load_dotenv
 
+import hashlib
 import os
-from openai import OpenAI
-import json
-from datetime import date, datetime, timezone
+import threading
+from datetime import datetime, timedelta, timezone
 
 from zoneinfo import ZoneInfo  # Python 3.9+
 
 load_dotenv()
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
-# ------------------- AI TRIAGE -------------------
+import triage
+import analytics
+import availability
+import catalog
+import events
 
+# -------------------------
+# Lazy resources
+# -------------------------
+# נוצרים בפעם הראשונה שצריך אותם ולא ב-import: import של app.py זול,
+# ו-worker שלא מטפל בדיווחים לא טוען מודל ולא מרים threads.
+_resources = {}
+_resources_lock = threading.RLock()     # RLock: ה-factory של triage_pool צריך את triage_cache
+_ready = False
+
+
+def _resource(name: str, factory):
+    obj = _resources.get(name)
+    if obj is None:
+        with _resources_lock:
+            obj = _resources.get(name)
+            if obj is None:
+                obj = _resources[name] = factory()
+    return obj
+
+
+def get_triage_cache() -> triage.TriageCache:
+    # מטמון לדיווחים כמעט זהים (אותה כיתה + קטגוריה + תיאור מנורמל)
+    return _resource("triage_cache", lambda: triage.TriageCache(
+        max_size=int(os.environ.get("TRIAGE_CACHE_SIZE", 1000)),
+        ttl=float(os.environ.get("TRIAGE_CACHE_TTL", 3600)),
+        persistent=os.environ.get("TRIAGE_CACHE_PERSIST", "1") == "1",
+    ))
+
+
+def _make_triage_pool() -> triage.TriageWorkerPool:
+    import triage_model
+    return triage.TriageWorkerPool(
+        workers=int(os.environ.get("TRIAGE_WORKERS", 2)),
+        max_pending=int(os.environ.get("TRIAGE_MAX_PENDING", 500)),
+        cache=get_triage_cache(),
+        batch_size=int(os.environ.get("TRIAGE_BATCH_SIZE", 1)),
+        batch_window=float(os.environ.get("TRIAGE_BATCH_WINDOW", 0.5)),
+        # נוצר ע"י: python triage_model.py train
+        local_model=triage_model.load_model(os.environ.get("TRIAGE_MODEL_PATH", triage_model.MODEL_PATH)),
+        local_threshold=float(os.environ.get("TRIAGE_LOCAL_THRESHOLD", 0.85)),
+    )
 
-CATEGORY_TO_RANK = {
-    "מקרן": 1,
-    "מחשב": 2,
-    "תאורה": 3,
-    "מיזוג": 4,
-    "אחר": 5
-}
 
-_JSON_SCHEMA = {
-    "name": "fault_triage",
-    "schema": {
-        "type": "object",
-        "additionalProperties": False,
-        "properties": {
-            "severity_rank": {"type": "integer", "minimum": 1, "maximum": 5},
-            "confidence": {"type": "number", "minimum": 0, "maximum": 1},
-            "rationale": {"type": "string", "maxLength": 220}
-        },
-        "required": ["severity_rank", "confidence", "rationale"]
-    }
-}
+def get_triage_pool() -> triage.TriageWorkerPool:
+    # טריאז' AI ברקע: הדיווח נשמר מיד, הסיווג מתעדכן כשה-worker מסיים
+    return _resource("triage_pool", _make_triage_pool)
 
-def ai_triage(category_user: str, room: str, description: str) -> dict:
-    # fallback: לפי הבחירה מה-dropdown
-    fallback_rank = CATEGORY_TO_RANK.get(category_user, 5)
 
-    prompt = f"""
-את סוכנת טריאז' לתקלות בכיתות.
-סולם חומרה (1 הכי חמור, 5 הכי פחות חמור) לפי קטגוריה:
-מקרן=1, מחשב=2, תאורה=3, מיזוג=4, אחר=5.
+def get_rollup_catchup() -> analytics.RollupCatchup:
+    return _resource("rollup_catchup", analytics.RollupCatchup)
 
-כללים:
-- ברירת מחדל: דירוג לפי הקטגוריה שנבחרה.
-- מותר לשנות לכל היותר בדרגה אחת (±1) אם התיאור מצביע על השפעה חריגה.
-- לעולם לא לצאת מהטווח 1..5.
 
-דיווח:
-קטגוריה: {category_user}
-כיתה: {room}
-תיאור: {description}
+def get_change_bus() -> events.ChangeBus:
+    # פיד שינויים לצוות (SSE). thread אחד לכל תהליך, משותף לכל הלקוחות.
+    # תחת gunicorn צריך worker class שמחזיק חיבורים פתוחים (gthread / gevent).
+    return _resource("change_bus", lambda: events.ChangeBus(
+        poll_interval=float(os.environ.get("EVENTS_POLL_INTERVAL", 1.0)),
+    ))
 
-החזירי JSON בלבד.
-""".strip()
 
-    try:
-        resp = client.responses.create(
-            model="gpt-4.1-mini",
-            input=prompt,
-            temperature=0,
-            timeout=15,
-            text={"format": {"type": "json_schema", "json_schema": _JSON_SCHEMA}},
+app = Flask(__name__)
+app.secret_key = "dev-secret-key"
+# אורך סלוט בחיפוש סטודנט (דקות) + האפשרויות שמוצגות בטופס
+app.config["RESERVATION_SLOT_MINUTES"] = int(
+    os.environ.get("RESERVATION_SLOT_MINUTES", db.DEFAULT_SLOT_MINUTES)
+)
+app.config["RESERVATION_SLOT_CHOICES"] = (60, 90, 120, 180)
+db.init_app(app)
+
+
+def create_app(preload: bool = False) -> Flask:
+    """
+    Factory (gunicorn: "app:create_app()"). בטוח לקרוא כמה פעמים.
+
+    preload=True — ל-gunicorn עם preload_app (ראו gunicorn.conf.py): ה-master
+    בונה מראש את קטלוג הכיתות והמערכת השבועית, וה-workers מקבלים אותם
+    ב-fork (copy-on-write) במקום לבנות כל אחד לעצמו.
+    """
+    global _ready
+    with _resources_lock:
+        if _ready:
+            return app
+
+        # circuit breaker סביב OpenAI: בזמן תקלה הדיווחים מקבלים fallback מיד
+        triage.breaker = triage.CircuitBreaker(
+            failure_threshold=int(os.environ.get("OPENAI_BREAKER_FAILURES", 5)),
+            cooldown=float(os.environ.get("OPENAI_BREAKER_COOLDOWN", 30)),
+            max_timeout=float(os.environ.get("OPENAI_MAX_TIMEOUT", triage.REQUEST_TIMEOUT)),
         )
 
-        data = json.loads(resp.output_text)
+        # רק בדיקת PRAGMA user_version; מיגרציות: python migrations.py upgrade
+        db.ensure_schema(auto_upgrade=os.environ.get("AUTO_MIGRATE", "1") == "1")
 
-        rank = int(data.get("severity_rank", fallback_rank))
-        if rank < 1 or rank > 5:
-            rank = fallback_rank
+        if preload:
+            db.warm_caches()
+            # חיבורים לא עוברים fork
+            db.close_all_connections()
 
-        conf = float(data.get("confidence", 0.5))
-        if conf < 0 or conf > 1:
-            conf = 0.5
+        _ready = True
+    return app
 
-        rationale = str(data.get("rationale", "")).strip()
-        if not rationale:
-            rationale = "סווג לפי הקטגוריה שנבחרה."
 
-        return {"severity_rank": rank, "confidence": conf, "rationale": rationale}
+_triage_checked_pid = None
 
-    except Exception as e:
-        print("AI triage failed:", e)
-        return {"severity_rank": fallback_rank, "confidence": 0.0, "rationale": "סווג אוטומטית לפי הקטגוריה (fallback)."}
 
+def _start_pending_triage() -> None:
+    """
+    פעם אחת לכל תהליך (אחרי fork): אם נשארו עבודות ב-triage_jobs מריסטארט,
+    מרימים את ה-workers כבר עכשיו ולא מחכים לדיווח הבא.
+    """
+    global _triage_checked_pid
+    with _resources_lock:
+        if _triage_checked_pid == os.getpid():
+            return
+        _triage_checked_pid = os.getpid()
+    if db.count_pending_triage_jobs():
+        get_triage_pool().start()
+
+
+@app.before_request
+def _ensure_ready():
+    # "app:app" / flask run בלי factory -> מאתחלים בבקשה הראשונה
+    if not _ready:
+        create_app()
+    if _triage_checked_pid != os.getpid():
+        _start_pending_triage()
 
 
-app = Flask(__name__)
-app.secret_key = "dev-secret-key"
-db.init_db()
 #db.seed_rooms_if_empty()
 
 from db import (
@@ -119,6 +171,11 @@ def _parse_sqlite_dt(s: str) -> datetime | None:
     except Exception:
         return None
 
+def _today_local() -> str:
+    """התאריך של היום בשעון ישראל ('YYYY-MM-DD')."""
+    return datetime.now(IL_TZ).strftime("%Y-%m-%d")
+
+
 @app.template_filter("localdt")
 def localdt_filter(value, fmt="%d-%m-%Y %H:%M"):
     """
@@ -269,19 +326,45 @@ def home_student():
 
     user_id = session.get("national_id")
 
-    my_taken = db.get_user_reservations(user_id)          # שריונים
-    my_reports = db.get_reports_by_reporter(user_id)      # דיווחים
+    # שריונים קרובים + דיווחים אחרונים; ההיסטוריה נטענת לפי בקשה
+    home = db.get_home_data(user_id, _today_local())
 
     return render_template(
         "home_student.html",
         user_name=session.get("full_name", ""),
         role="סטודנט",
-        taken=my_taken,
-        reports=my_reports
+        **home
     )
 
 
 
+@app.get("/home/history/reservations")
+def home_reservation_history():
+    """עמוד נוסף מהיסטוריית השריונים (JSON, נטען מכפתור "הצג עוד")."""
+    if not require_roles("student", "lecturer"):
+        abort(403)
+
+    try:
+        rows, next_cursor = db.get_reservation_history(
+            session["national_id"], _today_local(), cursor=request.args.get("cursor") or None
+        )
+    except ValueError:
+        abort(400)
+    return {"items": [dict(r) for r in rows], "next_cursor": next_cursor}
+
+
+@app.get("/home/history/reports")
+def home_reports_history():
+    """עמוד נוסף מהדיווחים של המשתמש (JSON)."""
+    if not require_roles("student", "lecturer"):
+        abort(403)
+
+    rows, next_cursor = db.get_reports_page(
+        session["national_id"], cursor=request.args.get("cursor", type=int)
+    )
+    return {"items": [dict(r) for r in rows], "next_cursor": next_cursor}
+
+
 @app.route("/home/lecturer")
 def home_lecturer():
     if not require_roles("lecturer"):
@@ -289,15 +372,14 @@ def home_lecturer():
 
     user_id = session.get("national_id")
 
-    my_taken = db.get_user_reservations(user_id)
-    my_reports = db.get_reports_by_reporter(user_id)
+    # שריונים קרובים + דיווחים אחרונים; ההיסטוריה נטענת לפי בקשה
+    home = db.get_home_data(user_id, _today_local())
 
     return render_template(
         "home_lecturer.html",
         user_name=session.get("full_name", ""),
         role="מרצה",
-        taken=my_taken,
-        reports=my_reports
+        **home
     )
 
 
@@ -310,21 +392,98 @@ def home_lecturer():
         #user_name=session.get("full_name", ""),
         #role="צוות תחזוקה"
    # )
+def _report_queue_page(strict: bool = False):
+    """
+    קורא פילטרים + cursor מה-query string ומחזיר עמוד מהתור.
+    מחזיר (reports, next_cursor, filters) — filters חוזרים לטופס ולקישור "טען עוד".
+    strict (API): פילטר לא תקין -> ValueError במקום חזרה לברירת המחדל.
+    """
+    filters = {
+        "status": request.args.get("status", "open"),
+        "room": request.args.get("room", "").strip(),
+        "category": request.args.get("category", "").strip(),
+        "severity": request.args.get("severity", "").strip(),
+        "date_from": request.args.get("date_from", "").strip(),
+        "date_to": request.args.get("date_to", "").strip(),
+    }
+    limit = request.args.get("limit", default=db.REPORT_PAGE_SIZE, type=int)
+
+    try:
+        reports, next_cursor = db.get_report_queue(
+            status=filters["status"],
+            room=filters["room"] or None,
+            category_user=filters["category"] or None,
+            severity_rank=int(filters["severity"]) if filters["severity"] else None,
+            date_from=filters["date_from"] or None,
+            date_to=filters["date_to"] or None,
+            cursor=request.args.get("cursor") or None,
+            limit=limit,
+        )
+    except ValueError:
+        if strict:
+            raise
+        flash("סינון לא תקין")
+        filters = {"status": "open"}
+        reports, next_cursor = db.get_report_queue(limit=limit)
+
+    filters = {k: v for k, v in filters.items() if v}
+    return reports, next_cursor, filters
+
+
 @app.route("/home/staff")
 def home_staff():
     if not require_roles("staff"):
         return redirect(url_for("entry"))
 
-    reports = db.get_all_reports()  # מביא את כל הדיווחים
+    reports, next_cursor, filters = _report_queue_page()
 
     return render_template(
         "home_staff.html",
         user_name=session.get("full_name", ""),
         role="צוות תחזוקה",
-        reports=reports
+        reports=reports,
+        next_cursor=next_cursor,
+        filters=filters,
+        categories=list(triage.CATEGORY_TO_RANK),
+    )
+
+
+
+ROOM_TYPES = ("regular", "computers", "lab")
+
+
+def _room_requirements(form) -> catalog.RoomRequirements:
+    """דרישות מהכיתה מטופס החיפוש (שדות ריקים = לא משנה)."""
+    room_type = form.get("room_type") or None
+    return catalog.RoomRequirements(
+        min_seats=form.get("min_seats", type=int),
+        projector=form.get("projector") == "1",
+        min_stations=form.get("min_stations", type=int),
+        room_type=room_type if room_type in ROOM_TYPES else None,
     )
 
 
+def _range_search_error(date_from, date_to, start_time, end_time) -> str | None:
+    """בדיקת טופס חיפוש לפי טווח; מחזיר הודעת שגיאה או None."""
+    if not date_from or not start_time or not end_time:
+        return "נא למלא תאריך ושעות."
+    try:
+        first = datetime.strptime(date_from, "%Y-%m-%d").date()
+        last = datetime.strptime(date_to, "%Y-%m-%d").date()
+    except ValueError:
+        return "תאריך לא תקין."
+    try:
+        start_m, end_m = availability.to_min(start_time), availability.to_min(end_time)
+    except ValueError:
+        return "שעה לא תקינה."
+    if end_m <= start_m:
+        return "טווח שעות לא תקין: שעת סיום חייבת להיות אחרי שעת התחלה."
+    if last < first:
+        return "טווח תאריכים לא תקין: תאריך הסיום חייב להיות אחרי תאריך ההתחלה."
+    if (last - first).days + 1 > db.MAX_RANGE_DAYS:
+        return f"אפשר לחפש עד {db.MAX_RANGE_DAYS} ימים בבת אחת."
+    return None
+
 
 ###############תהילה
 @app.route("/reservations/lecturer", methods=["GET", "POST"])
@@ -338,20 +497,21 @@ def lecturer_reservations():
     if request.method == "POST":
         searched = True
         date_selected = request.form.get("date")
+        date_to = request.form.get("date_to") or date_selected
         start_time = request.form.get("start_time")
         end_time = request.form.get("end_time")
+        min_minutes = request.form.get("min_minutes", default=1, type=int) or 1
 
-        if not date_selected or not start_time or not end_time:
-            error_msg = "נא למלא תאריך ושעות."
-            return render_template("lecturer_reservations.html", searched=searched, error_msg=error_msg)
-
-        if end_time <= start_time:
-            error_msg = "טווח שעות לא תקין: שעת סיום חייבת להיות אחרי שעת התחלה."
+        error_msg = _range_search_error(date_selected, date_to, start_time, end_time)
+        if error_msg:
             return render_template("lecturer_reservations.html", searched=searched, error_msg=error_msg)
 
         try:
-            from db import get_room_free_blocks
-            free_blocks = get_room_free_blocks(date_selected, start_time, end_time)
+            from db import get_room_free_blocks_range
+            free_blocks = get_room_free_blocks_range(
+                date_selected, date_to, start_time, end_time, min_minutes=min_minutes,
+                requirements=_room_requirements(request.form),
+            )
 
             return render_template(
                 "search_results.html",
@@ -368,6 +528,67 @@ def lecturer_reservations():
 
 
 
+# סיבת דחייה (db.BOOKING_*) -> הודעה למשתמש
+BOOKING_REASON_TEXT = {
+    db.BOOKING_INVALID: "פרטים לא תקינים",
+    db.BOOKING_UNKNOWN_ROOM: "כיתה לא קיימת",
+    db.BOOKING_SCHEDULE_CONFLICT: "יש שיעור קבוע בכיתה",
+    db.BOOKING_RESERVATION_CONFLICT: "הכיתה כבר שמורה",
+    db.BOOKING_QUOTA: "כבר יש שריון פעיל ביום הזה",
+    db.BOOKING_BUSY: "המערכת עמוסה, נסה/י שוב",
+    db.BOOKING_DUPLICATE: "חופף למועד אחר באותה הזמנה",
+}
+
+
+@app.route("/reservations/recurring", methods=["POST"])
+def book_recurring():
+    """מרצה: אותה כיתה ואותן שעות כל שבוע (או כל כמה שבועות) עד תאריך."""
+    if not require_roles("lecturer"):
+        return redirect(url_for("entry"))
+
+    room = request.form.get("room", "").strip()
+    first_date = request.form.get("first_date")
+    until_date = request.form.get("until_date")
+    start_time = request.form.get("start_time")
+    end_time = request.form.get("end_time")
+    interval_weeks = request.form.get("interval_weeks", default=1, type=int) or 1
+    mode = request.form.get("mode", db.BULK_ALL_OR_NOTHING)
+
+    def error(msg):
+        return render_template("lecturer_reservations.html", error_msg=msg)
+
+    if not room or not first_date or not until_date or not start_time or not end_time:
+        return error("חסרים פרטים להזמנה קבועה.")
+    if mode not in (db.BULK_ALL_OR_NOTHING, db.BULK_BEST_EFFORT):
+        return error("סוג הזמנה לא תקין.")
+    if interval_weeks < 1:
+        return error("מרווח השבועות חייב להיות לפחות 1.")
+    try:
+        first = datetime.strptime(first_date, "%Y-%m-%d").date()
+        until = datetime.strptime(until_date, "%Y-%m-%d").date()
+    except ValueError:
+        return error("תאריך לא תקין.")
+    if until < first:
+        return error("תאריך הסיום לפני תאריך ההתחלה.")
+    try:
+        start_m, end_m = availability.to_min(start_time), availability.to_min(end_time)
+    except ValueError:
+        return error("שעה לא תקינה.")
+    if end_m <= start_m:
+        return error("שעת הסיום חייבת להיות אחרי שעת ההתחלה.")
+
+    dates = db.recurring_dates(first_date, until_date, interval_weeks)
+    if len(dates) > db.MAX_BULK_OCCURRENCES:
+        return error(f"עד {db.MAX_BULK_OCCURRENCES} מופעים בהזמנה קבועה אחת.")
+
+    result = db.book_reservations_bulk(
+        session["national_id"], "lecturer", room,
+        [(d, start_time, end_time) for d in dates], mode=mode,
+    )
+    return render_template("lecturer_reservations.html", bulk_result=result, bulk_room=room,
+                           reason_text=BOOKING_REASON_TEXT)
+
+
 @app.route("/reservations/book", methods=["POST"])
 def book_room():
     if "national_id" not in session:
@@ -382,38 +603,32 @@ def book_room():
     user_id = session.get("national_id")
     role = session.get("role")  # role של המשתמש המחובר
 
-    # ✅ חסימה בשרת: סטודנט יכול לשריין רק פעם אחת להיום
-    if role == "student":
-        conn = db.get_connection()
-        row = conn.execute("""
-            SELECT 1
-            FROM reservations
-            WHERE user_national_id = ?
-              AND role = 'student'
-              AND date = ?
-              AND status = 'active'
-            LIMIT 1
-        """, (user_id, date_selected)).fetchone()
-        conn.close()
-
-        if row:
-            flash("כבר יש לך שריון פעיל להיום. בטל אותו לפני יצירת שריון חדש.")
-            return redirect(url_for("entry"))
-
-    # ✅ בדיקה בסיסית לטווח שעות
+    # ✅ בדיקה בסיסית (פורמט וטווח שעות נבדקים ב-db.book_reservation)
     if not room or not date_selected or not start_time or not end_time:
         return "חסרים פרטים להזמנה", 400
 
-    if end_time <= start_time:
-        return "טווח שעות לא תקין", 400
+    # בדיקת התנגשויות + מכסה + שמירה בטרנזקציה אחת
+    result = db.book_reservation(user_id, role, room, date_selected, start_time, end_time)
 
-    from db import create_reservation
-    success = create_reservation(user_id, role, room, date_selected, start_time, end_time)
-
-    if success:
+    if result.ok:
         flash("השריון בוצע בהצלחה ✅ אנא בטל אותו במידה והנך לא מתכוון להגיע.")
         return redirect(url_for("entry"))
 
+    if result.reason == db.BOOKING_QUOTA:
+        # ✅ חסימה בשרת: סטודנט יכול לשריין רק פעם אחת להיום
+        flash("כבר יש לך שריון פעיל להיום. בטל אותו לפני יצירת שריון חדש.")
+        return redirect(url_for("entry"))
+
+    if result.reason in (db.BOOKING_RESERVATION_CONFLICT, db.BOOKING_SCHEDULE_CONFLICT):
+        flash("החלון הזה כבר נתפס. בחר/י חלון אחר.")
+        return redirect(url_for("entry"))
+
+    if result.reason == db.BOOKING_BUSY:
+        return "המערכת עמוסה כרגע, נסה/י שוב", 503
+
+    if result.reason == db.BOOKING_INVALID:
+        return "טווח שעות לא תקין (08:00-20:00)", 400
+
     return "שגיאה בביצוע ההזמנה", 400
 
 
@@ -433,105 +648,73 @@ def student_reservations():
 
     searched = False
 
-    # YYYY-MM-DD (ל-DB)
-    today_date = date.today().strftime('%Y-%m-%d')
+    # YYYY-MM-DD (ל-DB), לפי שעון ישראל
+    today_date = _today_local()
     # DD-MM-YYYY (לתצוגה)
-    today_date_display = date.today().strftime('%d-%m-%Y')
+    today_date_display = datetime.strptime(today_date, "%Y-%m-%d").strftime("%d-%m-%Y")
 
     if request.method == "POST":
         searched = True
         start_time = request.form.get("start_time")
         end_time = request.form.get("end_time")
+        slot_minutes = request.form.get("slot_minutes", type=int)
+        if slot_minutes not in app.config["RESERVATION_SLOT_CHOICES"]:
+            slot_minutes = app.config["RESERVATION_SLOT_MINUTES"]
 
-        if not start_time or not end_time:
-            flash("נא לבחור שעת התחלה ושעת סיום.")
-            return render_template(
-                "student_reservations.html",
-                today_date=today_date,
-                today_date_display=today_date_display,
-                searched=searched
-            )
-
-        if end_time <= start_time:
-            flash("טווח שעות לא תקין: שעת סיום חייבת להיות אחרי שעת התחלה.")
+        def search_form(message: str):
+            flash(message)
             return render_template(
                 "student_reservations.html",
                 today_date=today_date,
                 today_date_display=today_date_display,
+                slot_minutes=slot_minutes,
                 searched=searched
             )
 
-        from db import get_detailed_available_rooms
+        if not start_time or not end_time:
+            return search_form("נא לבחור שעת התחלה ושעת סיום.")
 
         try:
-            def to_minutes(t: str) -> int:
-                h, m = t.split(":")
-                return int(h) * 60 + int(m)
-
-            def to_hhmm(total_min: int) -> str:
-                h = total_min // 60
-                m = total_min % 60
-                return f"{h:02d}:{m:02d}"
-
-            start_min = to_minutes(start_time)
-            end_min = to_minutes(end_time)
-
-            # ✅ שעות פתיחה/סגירה
-            OPEN_MIN = 8 * 60     # 08:00
-            CLOSE_MIN = 20 * 60   # 20:00
-
-            # אם המשתמש בחר התחלה לפני 08:00 – נרים ל-08:00
-            if start_min < OPEN_MIN:
-                start_min = OPEN_MIN
-
-            # אם המשתמש בחר סוף אחרי 20:00 – נחתוך ל-20:00
-            if end_min > CLOSE_MIN:
-                end_min = CLOSE_MIN
-
-            # אם אחרי החיתוך אין בכלל טווח
-            if end_min <= start_min:
-                flash("אפשר לשריין רק בין 08:00 ל-20:00. אנא בחר טווח שעות תקין.")
-                return render_template(
-                    "student_reservations.html",
-                    today_date=today_date,
-                    today_date_display=today_date_display,
-                    searched=searched
-                )
-
-            # בניית סלוטים של שעתיים בתוך הטווח
-            slots = []
-            cur = start_min
-
-            while cur + 120 <= end_min:
-                slot_start = to_hhmm(cur)
-                slot_end = to_hhmm(cur + 120)
-
-                rooms_for_slot = get_detailed_available_rooms(today_date, slot_start, slot_end)
-
-                if rooms_for_slot and len(rooms_for_slot) > 0:
-                    slots.append({
-                        "start": slot_start,
-                        "end": slot_end,
-                        "rooms": rooms_for_slot
-                    })
-
-                cur += 120
+            start_min = availability.to_min(start_time)
+            end_min = availability.to_min(end_time)
+        except ValueError:
+            return search_form("שעה לא תקינה.")
 
-            return render_template(
-                "search_results.html",
-                slots=slots,
-                today_date=today_date,
-                today_date_display=today_date_display  # ✅ זה השינוי החשוב
-            )
+        if end_min <= start_min:
+            return search_form("טווח שעות לא תקין: שעת סיום חייבת להיות אחרי שעת התחלה.")
 
+        # חיתוך לשעות הפתיחה (08:00-20:00)
+        start_min = max(start_min, availability.OPEN_MIN)
+        end_min = min(end_min, availability.CLOSE_MIN)
+        if end_min <= start_min:
+            return search_form("אפשר לשריין רק בין 08:00 ל-20:00. אנא בחר טווח שעות תקין.")
+
+        try:
+            # כל הסלוטים בתוך הטווח נבדקים בקריאה אחת
+            all_slots = db.get_available_rooms_by_slot(
+                today_date,
+                start_t=availability.to_hhmm(start_min),
+                end_t=availability.to_hhmm(end_min),
+                slot_minutes=slot_minutes,
+            )
         except Exception as e:
             print(f"SQL Error: {e}")
-            return f"יש בעיה בבסיס הנתונים: {e}", 500
+            return "יש בעיה בבסיס הנתונים. נסו שוב מאוחר יותר.", 500
+
+        slots = [s for s in all_slots if s["rooms"]]
+        return render_template(
+            "search_results.html",
+            slots=slots,
+            slot_minutes=slot_minutes,
+            today_date=today_date,
+            today_date_display=today_date_display
+        )
 
     return render_template(
         "student_reservations.html",
         today_date=today_date,
         today_date_display=today_date_display,
+        slot_minutes=app.config["RESERVATION_SLOT_MINUTES"],
         searched=searched
     )
 
@@ -575,48 +758,62 @@ def reports_new():
 
         if not room or not category_user or not description:
             flash("נא למלא כיתה, קטגוריה ותיאור")
-            return render_template("report_new.html")
+            return render_template("report_new.html", form=request.form)
 
         # ✅ בדיקה חדשה: הכיתה חייבת להיות קיימת במערכת (rooms)
-        # מאחדים רווחים כפולים כדי לתפוס הקלדה כמו "ספרא   102"
-        room_norm = " ".join(room.split())
-        if not db.room_exists(room_norm):
+        # מנרמלים רווחים כפולים כדי לתפוס הקלדה כמו "ספרא   102",
+        # ושומרים את ה-code הקנוני (גם אם הוקלד name) כדי שהקיבוץ יעבוד
+        room_code = db.resolve_room(room)
+        if room_code is None:
+            # "האם התכוונת ל..." — הטופס נשמר, כך שמספיק ללחוץ על הצעה ולשלוח
             flash("הכיתה שהוזנה לא קיימת במערכת. נא לתקן את שם הכיתה.")
-            return render_template("report_new.html")
+            return render_template(
+                "report_new.html",
+                form=request.form,
+                suggestions=db.suggest_rooms(room, limit=3),
+            )
 
         reporter_national_id = session.get("national_id", "TEMP_USER")
         role = session.get("role", "student")
 
-        # fallback: דירוג לפי הבחירה מה-dropdown
-        severity_rank = CATEGORY_TO_RANK.get(category_user, 5)
-        ai_confidence = 0.0
-        ai_rationale = "סווג לפי הקטגוריה שנבחרה (fallback)."
-
-        try:
-            triage = ai_triage(category_user, room_norm, description)
-            severity_rank = triage["severity_rank"]
-            ai_confidence = triage["confidence"]
-            ai_rationale = triage["rationale"]
-        except Exception as e:
-            print("AI triage failed (route):", e)
+        # מודל מקומי בטוח -> זה הדירוג הסופי.
+        # אחרת: נשמר מיד עם דירוג לפי הבחירה מה-dropdown, וה-AI יעדכן ברקע
+        local = get_triage_pool().local_triage(category_user, description)
+        initial = local or triage.fallback_triage(category_user)
 
-        db.create_report(
+        report_id = db.create_report(
             reporter_national_id=reporter_national_id,
             role=role,
-            room=room_norm,
+            room=room_code,
             category_user=category_user,
             description=description,
-            severity_rank=severity_rank,
-            ai_confidence=ai_confidence,
-            ai_rationale=ai_rationale
+            severity_rank=initial["severity_rank"],
+            ai_confidence=initial["confidence"],
+            ai_rationale=initial["rationale"]
         )
 
+        if local is None:
+            try:
+                get_triage_pool().submit(report_id)
+            except Exception as e:
+                print("AI triage enqueue failed (route):", e)
+
         flash("הדיווח נשלח בהצלחה ✅")
         return redirect(url_for("entry"))
 
     return render_template("report_new.html")
 
 
+@app.get("/rooms/autocomplete")
+def rooms_autocomplete():
+    """הצעות כיתה תוך כדי הקלדה (JSON). מהקטלוג בזיכרון — בלי שאילתה על rooms."""
+    if not require_login():
+        abort(403)
+
+    q = request.args.get("q", "")[:80]
+    return {"items": db.suggest_rooms(q)}
+
+
 #  >!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!_________________________________<
 
 # -------------------------
@@ -627,8 +824,114 @@ def maintenance_reports():
     if not require_roles("staff"):
         return redirect(url_for("entry"))
 
-    reports = db.get_all_reports()
-    return render_template("maintenance_reports.html", reports=reports)
+    reports, next_cursor, filters = _report_queue_page()
+    return render_template(
+        "maintenance_reports.html",
+        reports=reports,
+        next_cursor=next_cursor,
+        filters=filters,
+        categories=list(triage.CATEGORY_TO_RANK),
+    )
+
+
+ANALYTICS_DEFAULT_DAYS = 28
+
+
+@app.get("/maintenance/analytics")
+def maintenance_analytics():
+    """
+    ניצולת כיתות (מפת חום יום×שעה, ביטולים) ו-KPI של דיווחי תקלות,
+    לטווח תאריכים (ברירת מחדל: 4 שבועות אחרונים).
+    """
+    if not require_roles("staff"):
+        abort(403)
+
+    today = _today_local()
+    default_from = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)).strftime("%Y-%m-%d")
+    date_from = request.args.get("date_from") or default_from
+    date_to = request.args.get("date_to") or today
+
+    # בתוך ה-request רק צעד חסום; backlog גדול (למשל אחרי מיגרציה) ממשיך ברקע
+    catching_up = analytics.refresh_step()
+    if catching_up:
+        get_rollup_catchup().kick()
+
+    try:
+        usage = analytics.room_utilization(date_from, date_to)
+    except ValueError:
+        flash("טווח תאריכים לא תקין")
+        date_from, date_to = default_from, today
+        usage = analytics.room_utilization(date_from, date_to)
+    kpis = analytics.report_kpis(date_from, date_to)
+
+    if request.args.get("format") == "json":
+        return {**usage, "kpis": kpis, "catching_up": catching_up}
+
+    selected = request.args.get("room") or ""
+    room = next((r for r in usage["rooms"] if r["code"] == selected), None)
+
+    return render_template(
+        "analytics.html",
+        usage=usage,
+        kpis=kpis,
+        catching_up=catching_up,
+        selected=room,
+        heatmap=room["heatmap"] if room else usage["campus"],
+        weekday_names=["ראשון", "שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת"],
+    )
+
+
+@app.get("/maintenance/stats")
+def maintenance_stats():
+    if not require_roles("staff"):
+        abort(403)
+
+    return {
+        "triage_queue": get_triage_pool().stats(),
+        "triage_cache": get_triage_cache().stats(),
+        "openai": triage.breaker.stats(),
+        "change_bus": get_change_bus().stats(),
+        "room_catalog": db.get_room_catalog_stats(),
+        "rollup_catchup": get_rollup_catchup().stats(),
+    }
+
+
+@app.get("/maintenance/events")
+def maintenance_events():
+    """
+    Server-Sent Events: report_created / group_incremented / status_changed /
+    group_closed / triage_completed. הדפדפן שולח Last-Event-ID אחרי ניתוק,
+    ומקבל קודם את מה שפספס.
+    """
+    if not require_roles("staff"):
+        abort(403)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+
+    missed = []
+    if last_id is None:
+        last_id = get_change_bus().last_id()
+    else:
+        missed = get_change_bus().missed_since(last_id)
+        if missed:
+            last_id = missed[-1]["id"]
+
+    bus = get_change_bus()
+
+    def generate():
+        for event in missed:
+            yield events.format_sse(event)
+        yield from bus.stream(last_id)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/maintenance/reports/<int:report_id>")
@@ -682,6 +985,269 @@ def maintenance_report_update_status(report_id):
 
 
 
+# -------------------------
+# JSON API (v1)
+# -------------------------
+# לכל תשובה ETag חזק שנגזר ממוני data_versions של הטבלאות שהיא תלויה בהן
+# (+ המשתמש והפרמטרים). If-None-Match תואם -> 304 בלי שאילתה על הטבלאות:
+# db.get_data_versions מחזיר מהזיכרון כל עוד PRAGMA data_version לא השתנה.
+API_AVAILABILITY_TABLES = ("rooms", "weekly_schedule", "reservations")
+API_REPORT_TABLES = db.REPORT_VERSIONED_TABLES
+
+
+def _api_etag(resource: str, tables, *key) -> str:
+    versions = db.get_data_versions()
+    raw = repr((resource, session.get("national_id"), key, [versions.get(t) for t in tables]))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def _api_response(resource: str, tables, key: tuple, build):
+    """build() נקרא רק כשהלקוח לא מחזיק כבר את הגרסה הנוכחית."""
+    etag = _api_etag(resource, tables, *key)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        try:
+            resp = jsonify(build())
+        except ApiArgError as e:
+            return jsonify({"error": str(e)}), 400
+    resp.set_etag(etag)
+    # private: תשובות לפי משתמש; no-cache: מותר לשמור, אבל לאמת כל פעם (זול — 304)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.vary.add("Cookie")
+    return resp
+
+
+def _api_args(*names) -> tuple:
+    return tuple(request.args.get(n, "") for n in names)
+
+
+_REQUIREMENT_ARGS = ("min_seats", "projector", "min_stations", "room_type")
+
+
+class ApiArgError(ValueError):
+    """פרמטר לא תקין ב-query string; ההודעה נכתבת כאן ונשלחת ללקוח כמו שהיא (400)."""
+
+
+def _is_date(value: str) -> bool:
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def _is_time(value: str) -> bool:
+    try:
+        availability.to_min(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _api_date(name: str, default: str) -> str:
+    value = request.args.get(name) or default
+    if not _is_date(value):
+        raise ApiArgError(f"Invalid {name}: expected YYYY-MM-DD")
+    return value
+
+
+def _api_int(name: str, default: int | None = None, minimum: int = 1) -> int | None:
+    raw = request.args.get(name, "")
+    if not raw:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ApiArgError(f"Invalid {name}: expected an integer") from None
+    if value < minimum:
+        raise ApiArgError(f"Invalid {name}: must be at least {minimum}")
+    return value
+
+
+def _api_time_range() -> tuple[str, str]:
+    """?start&end (ברירת מחדל 08:00-20:00) — HH:MM תקינים ו-start < end."""
+    start_t = request.args.get("start") or "08:00"
+    end_t = request.args.get("end") or "20:00"
+    for name, value in (("start", start_t), ("end", end_t)):
+        if not _is_time(value):
+            raise ApiArgError(f"Invalid {name}: expected HH:MM between 00:00 and 23:59")
+    if availability.to_min(end_t) <= availability.to_min(start_t):
+        raise ApiArgError("Invalid time range: end must be after start")
+    return start_t, end_t
+
+
+def _api_date_range() -> tuple[str, str]:
+    date_from = _api_date("date_from", _today_local())
+    date_to = _api_date("date_to", date_from)
+    if date_to < date_from:
+        raise ApiArgError("Invalid date range: date_to must not be before date_from")
+    days = (datetime.strptime(date_to, "%Y-%m-%d") - datetime.strptime(date_from, "%Y-%m-%d")).days + 1
+    if days > db.MAX_RANGE_DAYS:
+        raise ApiArgError(f"Invalid date range: at most {db.MAX_RANGE_DAYS} days")
+    return date_from, date_to
+
+
+def _api_requirements() -> catalog.RoomRequirements:
+    """כמו _room_requirements, אבל ערך לא תקין -> 400 במקום להתעלם ממנו."""
+    projector = request.args.get("projector", "")
+    if projector not in ("", "0", "1"):
+        raise ApiArgError("Invalid projector: expected 0 or 1")
+    room_type = request.args.get("room_type", "")
+    if room_type and room_type not in ROOM_TYPES:
+        raise ApiArgError(f"Invalid room_type: expected one of {', '.join(ROOM_TYPES)}")
+    return catalog.RoomRequirements(
+        min_seats=_api_int("min_seats"),
+        projector=projector == "1",
+        min_stations=_api_int("min_stations"),
+        room_type=room_type or None,
+    )
+
+
+def _api_history_cursor() -> str | None:
+    """cursor של היסטוריית שריונים: 'YYYY-MM-DD|HH:MM|id' (כמו שמוחזר ב-next_cursor)."""
+    cursor = request.args.get("cursor") or None
+    if cursor:
+        parts = cursor.split("|")
+        if not (len(parts) == 3 and _is_date(parts[0]) and _is_time(parts[1]) and parts[2].isdigit()):
+            raise ApiArgError("Invalid cursor: pass next_cursor from the previous page")
+    return cursor
+
+
+def _api_report_queue_args() -> None:
+    """בדיקה מפורשת של פילטרי תור הדיווחים לפני _report_queue_page(strict=True)."""
+    if request.args.get("status", "open") not in ("open", "done"):
+        raise ApiArgError("Invalid status: expected open or done")
+    _api_int("severity")
+    _api_int("limit")
+    for name in ("date_from", "date_to"):
+        if request.args.get(name) and not _is_date(request.args[name]):
+            raise ApiArgError(f"Invalid {name}: expected YYYY-MM-DD")
+    cursor = request.args.get("cursor")
+    if cursor:
+        parts = cursor.split("|")
+        if not (len(parts) == 3 and parts[0].isdigit() and parts[2].isdigit()):
+            raise ApiArgError("Invalid cursor: pass next_cursor from the previous page")
+
+
+@app.get("/api/v1/rooms")
+def api_rooms():
+    if not require_login():
+        abort(403)
+    return _api_response("rooms", ("rooms",), (), lambda: {"items": db.get_active_rooms()})
+
+
+@app.get("/api/v1/rooms/free-blocks")
+def api_free_blocks():
+    """?date_from&date_to&start&end&min_minutes + דרישות (min_seats, projector, ...)."""
+    if not require_login():
+        abort(403)
+
+    key = _api_args("date_from", "date_to", "start", "end", "min_minutes", *_REQUIREMENT_ARGS)
+
+    def build():
+        date_from, date_to = _api_date_range()
+        start_t, end_t = _api_time_range()
+        blocks = db.get_room_free_blocks_range(
+            date_from,
+            date_to,
+            start_t,
+            end_t,
+            min_minutes=_api_int("min_minutes", default=1),
+            requirements=_api_requirements(),
+        )
+        return {"items": blocks}
+
+    return _api_response("free-blocks", API_AVAILABILITY_TABLES, (_today_local(), *key), build)
+
+
+@app.get("/api/v1/rooms/free-for")
+def api_rooms_free_for():
+    """?date_from&date_to&min_minutes&start&end + דרישות -> {כיתה: [תאריכים עם רצף פנוי]}."""
+    if not require_login():
+        abort(403)
+
+    key = _api_args("date_from", "date_to", "start", "end", "min_minutes", *_REQUIREMENT_ARGS)
+
+    def build():
+        min_minutes = _api_int("min_minutes")
+        if min_minutes is None:
+            raise ApiArgError("min_minutes is required")
+        date_from, date_to = _api_date_range()
+        start_t, end_t = _api_time_range()
+        return {"items": db.get_rooms_free_for(
+            date_from,
+            date_to,
+            min_minutes,
+            start_t=start_t,
+            end_t=end_t,
+            requirements=_api_requirements(),
+        )}
+
+    return _api_response("free-for", API_AVAILABILITY_TABLES, (_today_local(), *key), build)
+
+
+@app.get("/api/v1/rooms/slots")
+def api_slots():
+    """?date&start&end&slot_minutes + דרישות -> כיתות פנויות לכל סלוט."""
+    if not require_login():
+        abort(403)
+
+    key = _api_args("date", "start", "end", "slot_minutes", *_REQUIREMENT_ARGS)
+
+    def build():
+        choices = app.config["RESERVATION_SLOT_CHOICES"]
+        slot_minutes = _api_int("slot_minutes", default=app.config["RESERVATION_SLOT_MINUTES"])
+        if slot_minutes not in choices:
+            raise ApiArgError(f"Invalid slot_minutes: expected one of {', '.join(map(str, choices))}")
+        start_t, end_t = _api_time_range()
+        slots = db.get_available_rooms_by_slot(
+            _api_date("date", _today_local()),
+            start_t=start_t,
+            end_t=end_t,
+            slot_minutes=slot_minutes,
+            requirements=_api_requirements(),
+        )
+        return {"items": slots}
+
+    return _api_response("slots", API_AVAILABILITY_TABLES, (_today_local(), *key), build)
+
+
+@app.get("/api/v1/me/reservations")
+def api_my_reservations():
+    """שריונים קרובים; ?history=1&cursor=... -> עמוד מההיסטוריה."""
+    if not require_roles("student", "lecturer"):
+        abort(403)
+
+    today = _today_local()
+    key = (today, *_api_args("history", "cursor"))
+
+    def build():
+        user_id = session["national_id"]
+        if request.args.get("history") == "1":
+            rows, next_cursor = db.get_reservation_history(user_id, today, cursor=_api_history_cursor())
+            return {"items": [dict(r) for r in rows], "next_cursor": next_cursor}
+        return {"items": [dict(r) for r in db.get_upcoming_reservations(user_id, today)]}
+
+    return _api_response("my-reservations", ("reservations",), key, build)
+
+
+@app.get("/api/v1/reports/groups")
+def api_report_groups():
+    """תור הדיווחים לצוות — אותם פילטרים ו-cursor כמו במסך הבית של הצוות."""
+    if not require_roles("staff"):
+        abort(403)
+
+    key = _api_args("status", "room", "category", "severity", "date_from", "date_to", "cursor", "limit")
+
+    def build():
+        _api_report_queue_args()
+        reports, next_cursor, _ = _report_queue_page(strict=True)
+        return {"items": [dict(r) for r in reports], "next_cursor": next_cursor}
+
+    return _api_response("report-groups", API_REPORT_TABLES, key, build)
+
+
 if __name__ == "__main__":
     app.run(debug=True)
 
@@ -0,0 +1,416 @@
+# availability.py
+"""
+מנוע זמינות כיתות בזיכרון.
+
+שומר לכל כיתה את המערכת השבועית (לפי יום בשבוע) ואת השריונים הפעילים
+(לפי תאריך) כרשימות ממוזגות וממוינות של אינטרוולים בדקות.
+כך "חלונות פנויים", "האם פנוי" ו"אילו כיתות פנויות" נענים בלי
+שאילתה לכל כיתה (N+1) ובלי השוואות מחרוזות 'HH:MM'.
+
+סנכרון מול ה-DB נעשה דרך טבלת data_versions (מונים שמקודמים ע"י triggers),
+כך ששינוי מ-worker אחר של gunicorn מבטל את המטמון אוטומטית.
+"""
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+
+# שעות פעילות מכללה
+OPEN_MIN = 8 * 60
+CLOSE_MIN = 20 * 60
+
+
+def to_min(t: str) -> int:
+    """'HH:MM' -> דקות מחצות. ValueError על שעה/דקה מחוץ לטווח (למשל 25:00)."""
+    h, m = t.split(":")
+    h, m = int(h), int(m)
+    if not (0 <= h <= 23 and 0 <= m <= 59):
+        raise ValueError(f"Invalid time: {t!r}")
+    return h * 60 + m
+
+
+def to_hhmm(x: int) -> str:
+    h = x // 60
+    m = x % 60
+    return f"{h:02d}:{m:02d}"
+
+
+def weekday_of(date_str: str) -> int:
+    """0=Sunday ... 6=Saturday (כמו strftime('%w') ב-SQL)"""
+    py_wd = datetime.strptime(date_str, "%Y-%m-%d").weekday()  # Mon=0..Sun=6
+    return (py_wd + 1) % 7
+
+
+def merge_intervals(intervals) -> list[tuple[int, int]]:
+    """ממזג אינטרוולים חופפים/צמודים לרשימה ממוינת."""
+    merged = []
+    for s, e in sorted(intervals):
+        if e <= s:
+            continue
+        if not merged or s > merged[-1][1]:
+            merged.append([s, e])
+        else:
+            merged[-1][1] = max(merged[-1][1], e)
+    return [(s, e) for s, e in merged]
+
+
+def invert_intervals(merged, start: int, end: int) -> list[tuple[int, int]]:
+    """היפוך -> חלונות פנויים מקסימליים בתוך [start, end]."""
+    free = []
+    cur = start
+    for s, e in merged:
+        if e <= cur:
+            continue
+        if s >= end:
+            break
+        if s > cur:
+            free.append((cur, s))
+        cur = max(cur, e)
+    if cur < end:
+        free.append((cur, end))
+    return free
+
+
+def overlaps(merged, start: int, end: int) -> bool:
+    """האם [start, end) חותך אינטרוול כלשהו ברשימה ממוזגת (חיפוש בינארי)."""
+    i = bisect_left(merged, (start, start))
+    if i > 0 and merged[i - 1][1] > start:
+        return True
+    return i < len(merged) and merged[i][0] < end
+
+
+# -------------------------
+# Minute bitmaps
+# -------------------------
+# יום פעילות (08:00-20:00) = מספר שלם של 720 ביטים, ביט לכל דקה (ביט 0 = 08:00).
+# ביט דלוק = פנוי. פעולות כמו AND בין ימים/כיתות או חיפוש רצף של k דקות
+# רצות על כל היום בבת אחת (פעולות על int), בלי לולאה לכל אינטרוול.
+
+DAY_MINUTES = CLOSE_MIN - OPEN_MIN
+FULL_DAY = (1 << DAY_MINUTES) - 1
+
+
+def interval_mask(start: int, end: int) -> int:
+    """ביטים של [start, end) (בדקות מחצות), חתוך לשעות הפעילות."""
+    s = max(start, OPEN_MIN) - OPEN_MIN
+    e = min(end, CLOSE_MIN) - OPEN_MIN
+    if e <= s:
+        return 0
+    return ((1 << (e - s)) - 1) << s
+
+
+def busy_mask(intervals) -> int:
+    mask = 0
+    for s, e in intervals:
+        mask |= interval_mask(s, e)
+    return mask
+
+
+HOUR_MASK = (1 << 60) - 1
+
+
+def hour_minutes(mask: int) -> list[int]:
+    """כמה דקות דלוקות בכל שעה של יום הפעילות (08, 09, ... 19) — popcount לכל שעה."""
+    return [(mask >> (60 * h) & HOUR_MASK).bit_count() for h in range(DAY_MINUTES // 60)]
+
+
+def mask_runs(mask: int) -> list[tuple[int, int]]:
+    """רצפים של ביטים דלוקים -> [(start, end), ...] בדקות מחצות."""
+    runs = []
+    while mask:
+        low = (mask & -mask).bit_length() - 1
+        t = mask >> low
+        length = ((t + 1) & ~t).bit_length() - 1       # כמה ביטים דלוקים ברצף
+        runs.append((OPEN_MIN + low, OPEN_MIN + low + length))
+        mask &= ~(((1 << length) - 1) << low)
+    return runs
+
+
+def min_run_mask(mask: int, k: int) -> int:
+    """
+    ביט i נשאר דלוק רק אם ביטים i..i+k-1 כולם דלוקים
+    (כלומר מתחיל שם רצף פנוי של לפחות k דקות). O(log k) פעולות.
+    """
+    if k <= 1:
+        return mask
+    result = mask
+    span = 1
+    while span < k:
+        step = min(span, k - span)
+        result &= result >> step
+        span += step
+    return result
+
+
+def make_slots(start: int, end: int, slot_minutes: int) -> list[tuple[int, int]]:
+    """סלוטים רצופים באורך slot_minutes בתוך [start, end] (שארית קצרה נזרקת)."""
+    if slot_minutes <= 0:
+        raise ValueError("slot_minutes must be positive")
+    slots = []
+    cur = start
+    while cur + slot_minutes <= end:
+        slots.append((cur, cur + slot_minutes))
+        cur += slot_minutes
+    return slots
+
+
+class AvailabilityIndex:
+    """
+    אינדקס זמינות לכל הכיתות הפעילות.
+    כל המתודות הציבוריות מקבלות conn (החיבור של ה-thread מ-db.get_connection).
+    """
+
+    MAX_CACHED_DATES = 64
+
+    def __init__(self, catalog):
+        self._catalog = catalog               # catalog.RoomCatalog (פרטי הכיתות)
+        self._lock = threading.RLock()
+        self._versions = None                 # {"rooms": n, "weekly_schedule": n, "reservations": n}
+        self._rooms = []                      # dict לכל כיתה פעילה, ממוין לפי code
+        self._weekly = {}                     # (code, weekday) -> [(s, e), ...] ממוזג
+        self._dates = OrderedDict()           # date -> {code: {res_id: (s, e)}}
+        self._busy = {}                       # (date, code) -> [(s, e), ...] ממוזג
+        self._res_loc = {}                    # res_id -> (date, code)
+
+    # -------------------------
+    # Loading / sync
+    # -------------------------
+    @staticmethod
+    def _read_versions(conn) -> dict:
+        rows = conn.execute("SELECT name, version FROM data_versions").fetchall()
+        return {r["name"]: r["version"] for r in rows}
+
+    def _load_static(self, conn) -> None:
+        self._rooms = self._catalog.rooms(conn)
+
+        weekly = {}
+        for r in conn.execute("SELECT room_code, weekday, start_time, end_time FROM weekly_schedule"):
+            weekly.setdefault((r["room_code"], r["weekday"]), []).append(
+                (to_min(r["start_time"]), to_min(r["end_time"]))
+            )
+        self._weekly = {k: merge_intervals(v) for k, v in weekly.items()}
+        self._busy.clear()
+
+    def _drop_dates(self) -> None:
+        self._dates.clear()
+        self._busy.clear()
+        self._res_loc.clear()
+
+    def sync(self, conn) -> None:
+        """בדיקת גרסה זולה (שורה אחת לכל טבלה) וטעינה מחדש רק של מה שהשתנה."""
+        versions = self._read_versions(conn)
+        with self._lock:
+            old = self._versions or {}
+            if (old.get("rooms") != versions.get("rooms")
+                    or old.get("weekly_schedule") != versions.get("weekly_schedule")):
+                self._load_static(conn)
+            if old.get("reservations") != versions.get("reservations"):
+                self._drop_dates()
+            self._versions = versions
+
+    def _day(self, conn, date_str: str) -> dict:
+        day = self._dates.get(date_str)
+        if day is not None:
+            self._dates.move_to_end(date_str)
+            return day
+        # שאילתה אחת לכל הכיתות בתאריך (במקום שאילתה לכל כיתה)
+        self._ensure_days(conn, [date_str])
+        return self._dates[date_str]
+
+    def _ensure_days(self, conn, dates) -> None:
+        """טוען בשאילתה אחת את כל התאריכים שחסרים במטמון."""
+        for d in dates:
+            if d in self._dates:
+                self._dates.move_to_end(d)
+        missing = sorted(d for d in set(dates) if d not in self._dates)
+        if not missing:
+            return
+        if len(missing) > self.MAX_CACHED_DATES:
+            raise ValueError("Too many dates requested at once")
+
+        days = {d: {} for d in missing}
+        for r in conn.execute("""
+            SELECT id, date, room, start_time, end_time
+            FROM reservations
+            WHERE date BETWEEN ? AND ?
+              AND status != 'cancelled'
+        """, (missing[0], missing[-1])):
+            day = days.get(r["date"])
+            if day is None:
+                continue  # כבר במטמון
+            day.setdefault(r["room"], {})[r["id"]] = (to_min(r["start_time"]), to_min(r["end_time"]))
+            self._res_loc[r["id"]] = (r["date"], r["room"])
+
+        for d in missing:
+            self._dates[d] = days[d]
+        while len(self._dates) > self.MAX_CACHED_DATES:
+            old_date, old_day = self._dates.popitem(last=False)
+            for room in self._rooms:
+                self._busy.pop((old_date, room["code"]), None)
+            for res in old_day.values():
+                for res_id in res:
+                    self._res_loc.pop(res_id, None)
+
+    def _busy_for(self, conn, date_str: str, weekday: int, code: str):
+        key = (date_str, code)
+        merged = self._busy.get(key)
+        if merged is None:
+            day = self._day(conn, date_str)
+            merged = merge_intervals(
+                list(self._weekly.get((code, weekday), ()))
+                + list(day.get(code, {}).values())
+            )
+            self._busy[key] = merged
+        return merged
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    # codes: סינון מוקדם לפי דרישות (catalog.RoomCatalog.matching_codes); None = כל הכיתות
+    def _selected(self, codes) -> list[dict]:
+        if codes is None:
+            return self._rooms
+        return [room for room in self._rooms if room["code"] in codes]
+
+    def rooms(self, conn) -> list[dict]:
+        self.sync(conn)
+        return list(self._rooms)
+
+    def free_blocks(self, conn, date_str: str, start: int, end: int) -> list[tuple[dict, list]]:
+        """לכל כיתה: (פרטי כיתה, רשימת חלונות פנויים מקסימליים בתוך [start, end])."""
+        self.sync(conn)
+        weekday = weekday_of(date_str)
+        with self._lock:
+            return [
+                (room, invert_intervals(self._busy_for(conn, date_str, weekday, room["code"]), start, end))
+                for room in self._rooms
+            ]
+
+    def is_free(self, conn, date_str: str, code: str, start: int, end: int) -> bool:
+        self.sync(conn)
+        weekday = weekday_of(date_str)
+        with self._lock:
+            return not overlaps(self._busy_for(conn, date_str, weekday, code), start, end)
+
+    def free_rooms(self, conn, date_str: str, start: int, end: int, codes=None) -> list[dict]:
+        """כיתות פעילות שאין להן שום חפיפה עם [start, end)."""
+        self.sync(conn)
+        weekday = weekday_of(date_str)
+        with self._lock:
+            return [
+                room for room in self._selected(codes)
+                if not overlaps(self._busy_for(conn, date_str, weekday, room["code"]), start, end)
+            ]
+
+    def free_rooms_by_slot(self, conn, date_str: str, slots, codes=None) -> list[list[dict]]:
+        """
+        לכל סלוט (s, e) -> רשימת הכיתות הפנויות בו.
+        לכל כיתה עוברים פעם אחת על האינטרוולים התפוסים (sweep), לכל הסלוטים יחד.
+        """
+        self.sync(conn)
+        weekday = weekday_of(date_str)
+        order = sorted(range(len(slots)), key=lambda i: slots[i][0])
+        result = [[] for _ in slots]
+
+        with self._lock:
+            for room in self._selected(codes):
+                busy = self._busy_for(conn, date_str, weekday, room["code"])
+                j = 0
+                for i in order:
+                    s, e = slots[i]
+                    while j < len(busy) and busy[j][1] <= s:
+                        j += 1
+                    if j == len(busy) or busy[j][0] >= e:
+                        result[i].append(room)
+        return result
+
+    def free_masks(self, conn, dates, codes=None) -> dict[str, list[tuple[dict, int]]]:
+        """לכל תאריך: [(פרטי כיתה, bitmap פנוי של היום), ...]."""
+        self.sync(conn)
+        result = {}
+        with self._lock:
+            self._ensure_days(conn, dates)
+            rooms = self._selected(codes)
+            for date_str in dates:
+                weekday = weekday_of(date_str)
+                result[date_str] = [
+                    (room, FULL_DAY & ~busy_mask(self._busy_for(conn, date_str, weekday, room["code"])))
+                    for room in rooms
+                ]
+        return result
+
+    def free_blocks_range(self, conn, dates, start: int, end: int,
+                          min_minutes: int = 1, codes=None) -> list[tuple[str, dict, list]]:
+        """
+        חלונות פנויים מקסימליים בכמה תאריכים בבת אחת.
+        מחזיר [(date, room, [(s, e), ...]), ...] — רק חלונות באורך min_minutes לפחות.
+        """
+        window = interval_mask(start, end)
+        result = []
+        for date_str, rooms in self.free_masks(conn, dates, codes).items():
+            for room, free in rooms:
+                free &= window
+                if min_minutes > 1 and not min_run_mask(free, min_minutes):
+                    continue
+                blocks = [(s, e) for s, e in mask_runs(free) if e - s >= min_minutes]
+                result.append((date_str, room, blocks))
+        return result
+
+    def rooms_free_for(self, conn, dates, min_minutes: int,
+                       start: int = OPEN_MIN, end: int = CLOSE_MIN, codes=None) -> dict[str, list[str]]:
+        """
+        אילו כיתות פנויות לפחות min_minutes ברצף (בתוך [start, end]) —
+        {code: [תאריכים שבהם יש רצף כזה]}. בדיקה = AND + shift על ה-bitmap.
+        """
+        window = interval_mask(start, end)
+        found = {}
+        for date_str, rooms in self.free_masks(conn, dates, codes).items():
+            for room, free in rooms:
+                if min_run_mask(free & window, min_minutes):
+                    found.setdefault(room["code"], []).append(date_str)
+        return found
+
+    # -------------------------
+    # Incremental updates (אחרי commit)
+    # -------------------------
+    def _apply_own_write(self, conn, apply) -> None:
+        """
+        מיישם שינוי של ה-worker הנוכחי בלי לטעון מחדש.
+        אם מונה השריונים קפץ ביותר מ-1 (כתב גם מישהו אחר) -> ביטול מטמון רגיל.
+        """
+        versions = self._read_versions(conn)
+        with self._lock:
+            known = (self._versions or {}).get("reservations")
+            current = versions.get("reservations")
+            if known is not None and current == known + 1:
+                apply()
+                self._versions["reservations"] = current
+            elif current != known:
+                self._drop_dates()
+                if self._versions is not None:
+                    self._versions["reservations"] = current
+
+    def reservation_added(self, conn, res_id: int, room: str, date_str: str,
+                          start_t: str, end_t: str) -> None:
+        def apply():
+            day = self._dates.get(date_str)
+            if day is None:
+                return  # התאריך לא במטמון -> ייטען כשיידרש
+            day.setdefault(room, {})[res_id] = (to_min(start_t), to_min(end_t))
+            self._res_loc[res_id] = (date_str, room)
+            self._busy.pop((date_str, room), None)
+
+        self._apply_own_write(conn, apply)
+
+    def reservation_removed(self, conn, res_id: int) -> None:
+        def apply():
+            loc = self._res_loc.pop(res_id, None)
+            if loc is None:
+                return
+            date_str, room = loc
+            day = self._dates.get(date_str)
+            if day is not None:
+                day.get(room, {}).pop(res_id, None)
+            self._busy.pop((date_str, room), None)
+
+        self._apply_own_write(conn, apply)
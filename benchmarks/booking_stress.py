@@ -0,0 +1,144 @@
+# benchmarks/booking_stress.py
+"""
+מבחן עומס לשריון כיתות: הרבה writers במקביל (תהליכים × threads) מנסים
+לשריין את אותם חלונות. בסוף בודקים שאין אף הזמנה כפולה.
+
+    python benchmarks/booking_stress.py
+    python benchmarks/booking_stress.py --processes 8 --threads 8 --attempts 200
+    python benchmarks/booking_stress.py --rooms 200 --days 30   # הרבה שריונים מוצלחים
+
+רץ על קובץ DB זמני — לא נוגע ב-instance/app.db.
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+SLOTS = [("08:00", "10:00"), ("09:00", "11:00"), ("10:00", "12:00"), ("12:00", "14:00")]
+
+
+def _rooms(n: int) -> list[str]:
+    return [f"R{i}" for i in range(n)]
+
+
+def _dates(n: int) -> list[str]:
+    # מתחיל ביום ראשון (2030-01-06)
+    return [f"2030-01-{6 + i:02d}" if i < 26 else f"2030-02-{i - 25:02d}" for i in range(n)]
+
+
+def _setup(path: str, rooms: list[str]) -> None:
+    db.DB_PATH = Path(path)
+    db.init_db()
+    conn = db.get_connection()
+    conn.executemany("INSERT OR IGNORE INTO rooms (code, name) VALUES (?, ?)", [(r, r) for r in rooms])
+    conn.execute(
+        "INSERT INTO weekly_schedule (room_code, weekday, start_time, end_time) VALUES ('R0', 0, '08:00', '10:00')"
+    )
+    conn.commit()
+    db.close_connection()
+
+
+def _worker(path: str, worker_id: int, threads: int, attempts: int,
+            rooms: list[str], dates: list[str], out) -> None:
+    db.DB_PATH = Path(path)
+    counts = Counter()
+    lock = threading.Lock()
+
+    def run(thread_id: int) -> None:
+        rnd = random.Random(worker_id * 1000 + thread_id)
+        local = Counter()
+        for i in range(attempts):
+            role = "student" if i % 2 else "lecturer"
+            user = f"u{worker_id}-{thread_id}-{rnd.randrange(20)}"
+            start, end = rnd.choice(SLOTS)
+            result = db.book_reservation(user, role, rnd.choice(rooms), rnd.choice(dates), start, end)
+            local[result.reason] += 1
+            local["retries"] += result.attempts - 1
+        db.close_connection()
+        with lock:
+            counts.update(local)
+
+    ts = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    out.put(dict(counts))
+
+
+def _double_bookings(path: str) -> int:
+    db.DB_PATH = Path(path)
+    conn = db.get_connection()
+    overlaps = conn.execute("""
+        SELECT COUNT(*)
+        FROM reservations a
+        JOIN reservations b
+          ON a.room = b.room AND a.date = b.date AND a.id < b.id
+         AND a.start_time < b.end_time AND b.start_time < a.end_time
+        WHERE a.status = 'active' AND b.status = 'active'
+    """).fetchone()[0]
+    quota = conn.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT user_national_id, date FROM reservations
+            WHERE role = 'student' AND status = 'active'
+            GROUP BY user_national_id, date
+            HAVING COUNT(*) > 1
+        )
+    """).fetchone()[0]
+    db.close_connection()
+    return overlaps + quota
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Booking concurrency stress test")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=100, help="booking attempts per thread")
+    parser.add_argument("--rooms", type=int, default=5, help="few rooms = heavy contention")
+    parser.add_argument("--days", type=int, default=2)
+    args = parser.parse_args()
+    rooms, dates = _rooms(args.rooms), _dates(min(args.days, 50))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "stress.db")
+        _setup(path, rooms)
+
+        out = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=_worker, args=(path, p, args.threads, args.attempts, rooms, dates, out))
+            for p in range(args.processes)
+        ]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        totals = Counter()
+        for _ in procs:
+            totals.update(out.get())
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+
+        calls = args.processes * args.threads * args.attempts
+        bad = _double_bookings(path)
+
+        print(f"writers: {args.processes} processes x {args.threads} threads")
+        print(f"booking calls: {calls} in {elapsed:.2f}s ({calls / elapsed:.0f} calls/s)")
+        print(f"bookings: {totals['ok']} ({totals['ok'] / elapsed:.0f} bookings/s)")
+        for reason, n in sorted(totals.items()):
+            print(f"  {reason}: {n}")
+        print(f"double bookings: {bad}")
+        if bad:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
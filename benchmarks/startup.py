@@ -0,0 +1,69 @@
+# benchmarks/startup.py
+"""
+זמן עליה: import של app.py, create_app(), ובקשה ראשונה / שנייה.
+כל מדידה בתהליך חדש (cold start), על DB זמני — לא נוגע ב-instance/app.db.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# רץ בתהליך נפרד בתוך תיקייה זמנית (DB_PATH יחסי -> instance/app.db שם)
+_CHILD = r"""
+import json, sys, time
+sys.path.insert(0, ROOT)
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+flask_app = app_module.create_app(preload=PRELOAD)
+t2 = time.perf_counter()
+client = flask_app.test_client()
+client.get("/")
+t3 = time.perf_counter()
+client.get("/")
+t4 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "second_request_ms": (t4 - t3) * 1000,
+}))
+"""
+
+
+def _run_once(preload: bool, workdir: str) -> dict:
+    code = _CHILD.replace("ROOT", repr(str(ROOT))).replace("PRELOAD", repr(preload))
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=workdir, capture_output=True, text=True, check=True,
+        env={"OPENAI_API_KEY": "sk-bench", "PATH": ""},
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup latency benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # הרצה ראשונה יוצרת את הסכמה; לא נספרת
+        _run_once(False, tmp)
+
+        for preload in (False, True):
+            results = [_run_once(preload, tmp) for _ in range(args.runs)]
+            print(f"preload={preload} (median of {args.runs} cold starts)")
+            for key in results[0]:
+                values = [r[key] for r in results]
+                print(f"  {key:18} {statistics.median(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# benchmarks/triage_pool.py
+"""
+בדיקת תור הטריאז' מול fake מקומי של OpenAI (בלי רשת, בלי מפתח):
+
+1. עיבוד רגיל (בודד + batch) — כל העבודות done והדירוג נכתב לדיווח.
+2. תור מלא אחרי ריסטארט — submit נדחה, אבל ה-workers עולים ומרוקנים את התור.
+3. תקלה ב-OpenAI — ה-breaker נפתח, עבודות נדחות (defer) בלי לשרוף ניסיונות,
+   ואחרי שהשירות חוזר הכל מסתיים.
+
+    python benchmarks/triage_pool.py
+    python benchmarks/triage_pool.py --reports 200 --workers 4 --batch-size 8
+
+רץ על קובץ DB זמני — לא נוגע ב-instance/app.db. יוצא עם 1 אם משהו נכשל.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import triage  # noqa: E402
+
+
+class FakeClient:
+    """מחקה את client.responses.create: מחזיר דירוג 2 לכל דיווח, או נכשל כש-down."""
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.down = False
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.responses = SimpleNamespace(create=self._create)
+
+    def _create(self, model, input, timeout=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if self.down:
+            raise ConnectionError("fake outage")
+        ids = [int(line.split(":")[1]) for line in input.splitlines() if line.startswith("report_id:")]
+        if ids:
+            data = {"results": [
+                {"report_id": i, "severity_rank": 2, "confidence": 0.9, "rationale": "fake"} for i in ids
+            ]}
+        else:
+            data = {"severity_rank": 2, "confidence": 0.9, "rationale": "fake"}
+        return SimpleNamespace(output_text=json.dumps(data))
+
+
+def _report() -> int:
+    return db.create_report("1", "student", "R1", "מקרן", "המקרן לא נדלק")
+
+
+def _wait_done(timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        counts = db.count_triage_jobs()
+        if not counts.get("queued") and not counts.get("running"):
+            return counts
+        time.sleep(0.05)
+    return db.count_triage_jobs()
+
+
+def _ranks_ok(report_ids) -> bool:
+    conn = db.get_connection()
+    marks = ",".join("?" * len(report_ids))
+    rows = conn.execute(f"SELECT severity_rank FROM reports WHERE id IN ({marks})", list(report_ids)).fetchall()
+    return len(rows) == len(report_ids) and all(r["severity_rank"] == 2 for r in rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Triage worker pool check with a fake OpenAI client")
+    parser.add_argument("--reports", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=4)
+    args = parser.parse_args()
+
+    failures = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = Path(tmp) / "app.db"
+        db.init_db()
+        fake = FakeClient()
+
+        def make_pool(**kw):
+            return triage.TriageWorkerPool(
+                workers=args.workers, client=fake, poll_interval=0.05,
+                batch_size=args.batch_size, batch_window=0.05, **kw,
+            )
+
+        # 1. עיבוד רגיל
+        triage.breaker = triage.CircuitBreaker(failure_threshold=3, cooldown=0.3)
+        pool = make_pool()
+        t0 = time.perf_counter()
+        ids = [_report() for _ in range(args.reports)]
+        for rid in ids:
+            pool.submit(rid)
+        counts = _wait_done(10)
+        elapsed = time.perf_counter() - t0
+        pool.stop()
+        print(f"normal: {counts} in {elapsed:.2f}s, {fake.calls} model calls")
+        if counts.get("done") != len(ids) or not _ranks_ok(ids):
+            failures.append("normal processing")
+
+        # 2. ריסטארט עם תור מלא: submit נדחה, אבל התור מתרוקן
+        backlog = [_report() for _ in range(10)]
+        for rid in backlog:
+            db.enqueue_triage_job(rid)
+        pool = make_pool(max_pending=5)
+        accepted = pool.submit(_report())
+        counts = _wait_done(10)
+        pool.stop()
+        print(f"full queue after restart: submit accepted={accepted}, {counts}")
+        if accepted or counts.get("queued") or not _ranks_ok(backlog):
+            failures.append("full queue drain")
+
+        # 3. תקלה ב-OpenAI ואז חזרה
+        fake.down = True
+        pool = make_pool(backoff_base=0.1)
+        outage = [_report() for _ in range(10)]
+        for rid in outage:
+            pool.submit(rid)
+        time.sleep(1.0)
+        stats = pool.stats()
+        print(f"outage: breaker={triage.breaker.state}, deferred={stats['deferred_circuit_open']}, "
+              f"failed={stats['failed']}")
+        if triage.breaker.state == "closed":
+            failures.append("breaker did not open")
+        fake.down = False
+        counts = _wait_done(15)
+        pool.stop()
+        print(f"recovered: {counts}")
+        if counts.get("queued") or counts.get("running") or not _ranks_ok(outage):
+            failures.append("recovery after outage")
+        db.close_connection()
+
+    if failures:
+        print("FAILED:", ", ".join(failures))
+        sys.exit(1)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
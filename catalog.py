@@ -0,0 +1,276 @@
+# catalog.py
+"""
+קטלוג כיתות בזיכרון.
+
+טבלת rooms משתנה בערך פעם בסמסטר, אבל room_exists / חיפוש זמינות
+נקראים בכל בקשה. הקטלוג מחזיק את כל הכיתות (code, name, סוג, מקומות,
+מקרן, עמדות) ומאפשר חיפוש מנורמל לפי code או name.
+
+ביטול מטמון: לפני כל שימוש קוראים את מונה 'rooms' בטבלת data_versions
+(שורה אחת לפי PK). המונה מקודם ע"י triggers על rooms — כך ש-seed.py,
+עריכה ידנית או worker אחר של gunicorn מבטלים את המטמון אוטומטית.
+
+חיפוש חופשי (autocomplete / "האם התכוונת"): אינדקס trigrams הפוך על
+code ו-name המנורמלים, נבנה יחד עם הקטלוג.
+"""
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from typing import NamedTuple
+
+# ניקוד וטעמים, גרש/גרשיים (עבריים ולטיניים) — נמחקים
+_DROP_CHARS = dict.fromkeys(
+    [*range(0x0591, 0x05C8), ord("\u05F3"), ord("\u05F4"),
+     ord("'"), ord('"'), ord("`"), ord("\u2019"), ord("\u201D")]
+)
+# אותיות סופיות -> רגילות, מפרידים -> רווח
+_FOLD_CHARS = str.maketrans("ךםןףץ-_./,", "כמנפצ     ")
+# גבול בין אות לספרה: "ספרא102" -> "ספרא 102"
+_DIGIT_BOUNDARY = re.compile(r"(?<=\D)(?=\d)|(?<=\d)(?=\D)")
+
+SUGGEST_LIMIT = 5
+SUGGEST_MIN_SCORE = 0.3
+
+
+def normalize_room_text(text: str | None) -> str:
+    """
+    נרמול לחיפוש: ניקוד וגרשיים נמחקים, אותיות סופיות -> רגילות,
+    ספרות מכל כתב -> 0-9 ומופרדות מאותיות, מפרידים -> רווח,
+    איחוד רווחים ו-casefold (לאותיות לטיניות).
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).translate(_DROP_CHARS).translate(_FOLD_CHARS)
+    text = "".join(str(unicodedata.decimal(ch)) if ch.isdecimal() else ch for ch in text)
+    text = _DIGIT_BOUNDARY.sub(" ", text)
+    return " ".join(text.split()).casefold()
+
+
+class RoomRequirements(NamedTuple):
+    """דרישות מכיתה בחיפוש זמינות. None/False = לא משנה."""
+    min_seats: int | None = None
+    projector: bool = False
+    min_stations: int | None = None
+    room_type: str | None = None
+
+    def is_empty(self) -> bool:
+        return not (self.min_seats or self.projector or self.min_stations or self.room_type)
+
+
+def room_capacity(room: dict) -> int:
+    """כמה אנשים הכיתה מכילה: seats, ובכיתת מחשבים בלי seats — מספר העמדות."""
+    if room["seats"] is not None:
+        return room["seats"]
+    return room["computer_stations"] or 0
+
+
+def room_matches(room: dict, req: RoomRequirements) -> bool:
+    """בדיקת דרישות לכיתה בודדת (בלי האינדקסים של הקטלוג)."""
+    return (
+        (not req.min_seats or room_capacity(room) >= req.min_seats)
+        and (not req.min_stations or (room["computer_stations"] or 0) >= req.min_stations)
+        and (not req.projector or bool(room["has_projector"]))
+        and (not req.room_type or room["room_type"] == req.room_type)
+    )
+
+
+def best_fit_key(room: dict, req: RoomRequirements) -> tuple:
+    """
+    מפתח מיון "הכיתה הקטנה ביותר שמתאימה": קודם כיתות בלי ציוד מיוחד שלא
+    התבקש (מחשבים/מעבדה), אחר כך כמה מקומות מתבזבזים מעבר לנדרש, ואז
+    עמדות מיותרות. כך כיתות גדולות ומיוחדות נשארות פנויות למי שצריך אותן.
+    """
+    special_unneeded = (
+        room["room_type"] != "regular"
+        and req.room_type != room["room_type"]
+        and not req.min_stations
+    )
+    return (
+        special_unneeded,
+        room_capacity(room) - (req.min_seats or 0),
+        (room["computer_stations"] or 0) - (req.min_stations or 0),
+    )
+
+
+def trigrams(norm: str) -> set[str]:
+    """trigrams של מחרוזת מנורמלת, עם ריפוד רווח בהתחלה ובסוף."""
+    padded = f" {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RoomCatalog:
+    """
+    כל המתודות הציבוריות מקבלות conn (החיבור של ה-thread מ-db.get_connection).
+    הרשימות שמוחזרות משותפות — אין לשנות אותן.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._rooms = []        # כל הכיתות הפעילות (dict), ממוין לפי code
+        self._by_code = {}      # code -> room
+        self._lookup = {}       # code/name מנורמל -> room
+        self._keys = []         # [(מחרוזת מנורמלת, room, trigrams)] — code ו-name
+        self._grams = {}        # trigram -> [אינדקסים ב-_keys]
+
+        # אינדקסים לסינון לפי דרישות (במקום מעבר על כל הכיתות)
+        self._by_capacity = []  # [(capacity, code)] ממוין
+        self._by_stations = []  # [(computer_stations, code)] ממוין
+        self._projector = set()
+        self._by_type = {}      # room_type -> {codes}
+
+        self._hits = 0
+        self._misses = 0
+
+    # -------------------------
+    # Loading / sync
+    # -------------------------
+    @staticmethod
+    def _read_version(conn):
+        row = conn.execute("SELECT version FROM data_versions WHERE name = 'rooms'").fetchone()
+        return row["version"] if row else None
+
+    def _load(self, conn) -> None:
+        rows = conn.execute("""
+            SELECT
+                code, name,
+                room_type, description, has_projector, seats, computer_stations
+            FROM rooms
+            WHERE is_active = 1
+            ORDER BY code
+        """).fetchall()
+        rooms = [dict(r) for r in rows]
+
+        lookup = {}
+        # name קודם ו-code אחריו: אם name של כיתה אחת זהה ל-code של אחרת, ה-code גובר
+        for room in rooms:
+            if room["name"]:
+                lookup.setdefault(normalize_room_text(room["name"]), room)
+        for room in rooms:
+            lookup[normalize_room_text(room["code"])] = room
+
+        keys = []
+        grams = {}
+        for norm, room in lookup.items():
+            tg = trigrams(norm)
+            for g in tg:
+                grams.setdefault(g, []).append(len(keys))
+            keys.append((norm, room, tg))
+
+        self._rooms = rooms
+        self._by_code = {room["code"]: room for room in rooms}
+        self._lookup = lookup
+        self._keys = keys
+        self._grams = grams
+
+        self._by_capacity = sorted((room_capacity(r), r["code"]) for r in rooms)
+        self._by_stations = sorted((r["computer_stations"] or 0, r["code"]) for r in rooms)
+        self._projector = {r["code"] for r in rooms if r["has_projector"]}
+        by_type = {}
+        for r in rooms:
+            by_type.setdefault(r["room_type"], set()).add(r["code"])
+        self._by_type = by_type
+
+    def sync(self, conn) -> None:
+        version = self._read_version(conn)
+        with self._lock:
+            if self._version is not None and version == self._version:
+                self._hits += 1
+                return
+            self._misses += 1
+            self._load(conn)
+            self._version = version
+
+    # -------------------------
+    # Queries
+    # -------------------------
+    def rooms(self, conn) -> list[dict]:
+        self.sync(conn)
+        return self._rooms
+
+    def codes(self, conn) -> list[str]:
+        return [room["code"] for room in self.rooms(conn)]
+
+    def get(self, conn, code: str) -> dict | None:
+        self.sync(conn)
+        return self._by_code.get(code)
+
+    def resolve(self, conn, room_text: str | None) -> dict | None:
+        """כיתה פעילה לפי code או name (אחרי נרמול), או None."""
+        key = normalize_room_text(room_text)
+        if not key:
+            return None
+        self.sync(conn)
+        return self._lookup.get(key)
+
+    def matching_codes(self, conn, req: RoomRequirements) -> set[str] | None:
+        """
+        codes של הכיתות שעומדות בדרישות (חיתוך של האינדקסים),
+        או None אם אין דרישות (= כל הכיתות).
+        """
+        if req is None or req.is_empty():
+            return None
+        self.sync(conn)
+
+        with self._lock:
+            sets = []
+            if req.min_seats:
+                i = bisect_left(self._by_capacity, (req.min_seats, ""))
+                sets.append({code for _, code in self._by_capacity[i:]})
+            if req.min_stations:
+                i = bisect_left(self._by_stations, (req.min_stations, ""))
+                sets.append({code for _, code in self._by_stations[i:]})
+            if req.projector:
+                sets.append(self._projector)
+            if req.room_type:
+                sets.append(self._by_type.get(req.room_type, set()))
+
+        sets.sort(key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    def suggest(self, conn, room_text: str | None, limit: int = SUGGEST_LIMIT,
+                min_score: float = SUGGEST_MIN_SCORE) -> list[tuple[dict, float]]:
+        """
+        כיתות דומות לטקסט חופשי: [(room, score), ...] מהטוב לגרוע.
+        score = Dice על trigrams, ותחילית של מילה (להקלדה חלקית) מקבלת לפחות 0.5.
+        """
+        q = normalize_room_text(room_text)
+        if not q:
+            return []
+        q_grams = trigrams(q)
+        self.sync(conn)
+
+        with self._lock:
+            keys = self._keys
+            shared = {}
+            for g in q_grams:
+                for i in self._grams.get(g, ()):
+                    shared[i] = shared.get(i, 0) + 1
+            if len(q) < 3:
+                # קצר מדי ל-trigram שלם: בודקים תחיליות בכל המפתחות
+                for i in range(len(keys)):
+                    shared.setdefault(i, 0)
+
+        best = {}
+        for i, n in shared.items():
+            norm, room, tg = keys[i]
+            score = 2 * n / (len(q_grams) + len(tg))
+            if norm.startswith(q) or f" {q}" in norm:
+                score = max(score, 0.5 + 0.5 * len(q) / len(norm))
+            if score >= min_score and score > best.get(room["code"], (None, 0))[1]:
+                best[room["code"]] = (room, score)
+
+        ranked = sorted(best.values(), key=lambda rs: (-rs[1], rs[0]["code"]))
+        return [(room, round(score, 3)) for room, score in ranked[:limit]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "version": self._version,
+                "rooms": len(self._rooms),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else None,
+            }
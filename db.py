@@ -1,153 +1,224 @@
 # db.py
+import json
+import os
+import random
 import sqlite3
+import threading
+import time
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+import availability
+import catalog
 
 
 DB_PATH = Path("instance") / "app.db"
 
 ROLES = ("student", "lecturer", "staff")
 
-def get_connection() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+# אורך ברירת מחדל של סלוט בחיפוש סטודנט (דקות)
+DEFAULT_SLOT_MINUTES = 120
+
+# כמה ימים לכל היותר בחיפוש לפי טווח תאריכים
+MAX_RANGE_DAYS = 14
+
+# אזור הזמן של הקמפוס (קיבוץ דיווחים לפי שעה מקומית, כולל שעון קיץ)
+LOCAL_TZ = ZoneInfo("Asia/Jerusalem")
+
+# דיווח מצטרף לקבוצה פתוחה (אותה כיתה + קטגוריה) אם הדיווח האחרון בה
+# היה לפני פחות מזה (חלון נגלל, לא שעה עגולה)
+REPORT_GROUP_WINDOW_MINUTES = 60
+
+# מסך הבית של סטודנט / מרצה: כמה שורות בכל רשימה (ההמשך נטען לפי בקשה)
+HOME_UPCOMING_LIMIT = 20
+HOME_PAGE_SIZE = 10
+
+# גודל עמוד בתור הדיווחים של הצוות
+REPORT_PAGE_SIZE = 30
+MAX_REPORT_PAGE_SIZE = 100
+
+# טבלאות שכל שינוי בהן מקדם מונה ב-data_versions
+VERSIONED_TABLES = ("rooms", "weekly_schedule", "reservations")
+# נוספו ב-migration 6 (ETag של ה-API לדיווחים)
+REPORT_VERSIONED_TABLES = ("reports", "report_groups")
+
+# -------------------------
+# Connection management
+# -------------------------
+# כל thread מקבל חיבור אחד שנשמר לכל אורך הבקשה (ובין בקשות),
+# ובסוף בקשה החיבור חוזר ל-pool במקום להיסגר.
+# כך אין connect/close על כל פונקציה ב-db.py.
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+
+_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA mmap_size = 67108864",      # 64MB
+    "PRAGMA cache_size = -16000",       # ~16MB
+    "PRAGMA temp_store = MEMORY",
+)
+
+_local = threading.local()
+_pool: list[tuple[str, sqlite3.Connection]] = []
+_pool_lock = threading.Lock()
+
+
+def _open_connection(path: str) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,   # החיבור יכול לעבור בין threads דרך ה-pool
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db() -> None:
-    conn = get_connection()
-    cur = conn.cursor()
 
+def get_connection() -> sqlite3.Connection:
+    """
+    מחזיר את החיבור של ה-thread הנוכחי (נפתח פעם אחת ונשמר).
+    אין לסגור אותו ידנית — משחררים עם release_connection() / close_connection().
+    """
+    path = str(DB_PATH)
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == path:
+        return conn
+    if conn is not None:
+        # DB_PATH השתנה (למשל בבדיקות) -> לא ממחזרים חיבור לקובץ אחר
+        release_connection()
+
+    conn = None
+    with _pool_lock:
+        while _pool:
+            pooled_path, pooled = _pool.pop()
+            if pooled_path == path:
+                conn = pooled
+                break
+            pooled.close()
+
+    if conn is None:
+        conn = _open_connection(path)
+
+    _local.conn = conn
+    _local.path = path
+    return conn
 
 
+def release_connection() -> None:
+    """
+    מחזיר את החיבור של ה-thread ל-pool (נקרא ב-teardown של Flask).
+    טרנזקציה פתוחה שנשכחה מבוטלת כדי שהחיבור יחזור נקי.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    path = _local.path
+    _local.conn = None
+    _local.path = None
 
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error:
+        conn.close()
+        return
 
+    with _pool_lock:
+        if len(_pool) < POOL_SIZE and path == str(DB_PATH):
+            _pool.append((path, conn))
+            return
+    conn.close()
 
-    # מי שמורשים להירשם (ת"ז + שם מלא + role)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS allowed_users (
-        national_id TEXT PRIMARY KEY,
-        full_name   TEXT NOT NULL,
-        role        TEXT NOT NULL CHECK(role IN ('student','lecturer','staff'))
-    );
-    """)
-
-    # משתמשים שנרשמו בפועל (ת"ז + role + password)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id          INTEGER PRIMARY KEY AUTOINCREMENT,
-        national_id TEXT UNIQUE NOT NULL,
-        role        TEXT NOT NULL CHECK(role IN ('student','lecturer','staff')),
-        password    TEXT NOT NULL,
-        created_at  TEXT DEFAULT (datetime('now'))
-    );
-    """)
-
-    # rooms (חדש)
-    cur.execute("""
-       CREATE TABLE IF NOT EXISTS rooms (
-           id        INTEGER PRIMARY KEY AUTOINCREMENT,
-           code      TEXT UNIQUE NOT NULL,   -- למשל "203" / "ספריה 100"
-           name      TEXT,                   -- אופציונלי
-           is_active INTEGER NOT NULL DEFAULT 1
-       );
-       """)
 
+def close_connection() -> None:
+    """סוגר את החיבור של ה-thread הנוכחי (לסקריפטים כמו seed.py)."""
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    _local.path = None
+    if conn is not None:
+        conn.close()
 
 
-    # --- MIGRATION: להוסיף שדות פרטים לחדרים (rooms) אם לא קיימים ---
-    cur.execute("PRAGMA table_info(rooms)")
-    rooms_cols = [row[1] for row in cur.fetchall()]
+def close_all_connections() -> None:
+    """סוגר את כל החיבורים שב-pool (למשל בסיום תהליך)."""
+    close_connection()
+    with _pool_lock:
+        while _pool:
+            _pool.pop()[1].close()
 
-    if "room_type" not in rooms_cols:
-        cur.execute("ALTER TABLE rooms ADD COLUMN room_type TEXT NOT NULL DEFAULT 'regular'")  # regular/computers/lab
 
-    if "description" not in rooms_cols:
-        cur.execute("ALTER TABLE rooms ADD COLUMN description TEXT NOT NULL DEFAULT ''")
+def _reset_after_fork() -> None:
+    """
+    בתהליך ילד (gunicorn preload_app): חיבורי SQLite של ה-master לא עוברים fork,
+    אז זורקים את ההפניות אליהם ופותחים חדשים לפי הצורך.
+    """
+    global _local, _pool, _pool_lock
+    _local = threading.local()
+    _pool = []
+    _pool_lock = threading.Lock()
 
-    if "has_projector" not in rooms_cols:
-        cur.execute("ALTER TABLE rooms ADD COLUMN has_projector INTEGER NOT NULL DEFAULT 1")   # 1/0
 
-    if "seats" not in rooms_cols:
-        cur.execute("ALTER TABLE rooms ADD COLUMN seats INTEGER")
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
-    if "computer_stations" not in rooms_cols:
-        cur.execute("ALTER TABLE rooms ADD COLUMN computer_stations INTEGER")
 
+def warm_caches() -> None:
+    """
+    בונה מראש מבנים לקריאה בלבד (קטלוג כיתות + מערכת שבועית מקומפלת באינדקס
+    הזמינות). נקרא ב-master לפני fork כדי שה-workers יחלקו אותם copy-on-write.
+    """
+    _availability_index().sync(get_connection())
 
-    # מערכת שבועית (לימודים קבועים בכיתה לפי יום בשבוע)
-    # weekday: 0=Sunday ... 6=Saturday (כמו strftime('%w') ב-SQL)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS weekly_schedule (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        room_code TEXT NOT NULL,       -- זה חייב להתאים ל-rooms.code
-        weekday INTEGER NOT NULL CHECK(weekday BETWEEN 0 AND 6),
-        start_time TEXT NOT NULL,      -- 'HH:MM'
-        end_time TEXT NOT NULL,        -- 'HH:MM'
-        title TEXT                      -- אופציונלי: שם קורס/שיעור
-    );
-    """)
-
-    # אינדקס לשיפור ביצועים
-    cur.execute("""
-    CREATE INDEX IF NOT EXISTS idx_weekly_schedule_room_weekday
-    ON weekly_schedule (room_code, weekday);
-    """)
 
-    # דוחות תקלות (כולל מה שה-AI החזיר)
-    # דוחות תקלות (כולל מה שה-AI החזיר)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS reports (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        reporter_national_id TEXT NOT NULL,
-        role TEXT NOT NULL CHECK(role IN ('student','lecturer')),
-        room TEXT NOT NULL,
-        category_user TEXT NOT NULL,
-        description TEXT NOT NULL,
-        ai_category TEXT,
-        severity TEXT CHECK(severity IN ('low','medium','high')),
-        status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open','in_progress','done')),
-        created_at TEXT DEFAULT (datetime('now'))
-    );
-    """)
-    # --- MIGRATION: אם טבלת reports כבר קיימת מגרסה ישנה בלי room, נוסיף את העמודה ---
-    cur.execute("PRAGMA table_info(reports)")
-    reports_cols = [row[1] for row in cur.fetchall()]  # row[1] = column name
-
-    if "room" not in reports_cols:
-        cur.execute("ALTER TABLE reports ADD COLUMN room TEXT NOT NULL DEFAULT ''")
-
-    # --- MIGRATION: שדות דירוג/AI ---
-    cur.execute("PRAGMA table_info(reports)")
-    reports_cols = [row[1] for row in cur.fetchall()]
-
-    if "severity_rank" not in reports_cols:
-        cur.execute("ALTER TABLE reports ADD COLUMN severity_rank INTEGER")
-
-    if "ai_confidence" not in reports_cols:
-        cur.execute("ALTER TABLE reports ADD COLUMN ai_confidence REAL")
-
-    if "ai_rationale" not in reports_cols:
-        cur.execute("ALTER TABLE reports ADD COLUMN ai_rationale TEXT")
-
-    # הזמנות כיתות (מי הזמין, איזה כיתה, ומתי)
-    # שימי לב: FK זה לא "אבטחה" — זה עקביות נתונים. אבל כדי לא להסתבך, נשאיר בלי FK.
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS reservations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_national_id TEXT NOT NULL,
-        role TEXT NOT NULL CHECK(role IN ('student','lecturer')),
-        room TEXT NOT NULL,
-        date TEXT NOT NULL,           -- 'YYYY-MM-DD'
-        start_time TEXT NOT NULL,     -- 'HH:MM'
-        end_time TEXT NOT NULL,       -- 'HH:MM'
-        status TEXT NOT NULL DEFAULT 'active' CHECK(status IN ('active','cancelled')),
-        created_at TEXT DEFAULT (datetime('now'))
-    );
-    """)
+def init_app(app) -> None:
+    """רושם את שחרור החיבור בסוף כל בקשה של Flask."""
+    @app.teardown_appcontext
+    def _release_db_connection(exc):
+        release_connection()
+
+def init_db() -> None:
+    """מעדכן את הסכמה לגרסה האחרונה (ראו migrations.py)."""
+    import migrations
+    migrations.upgrade(get_connection())
+
+
+def ensure_schema(auto_upgrade: bool = True) -> None:
+    """
+    בעליה של האפליקציה: בדיקה אחת של PRAGMA user_version.
+    אם הסכמה ישנה -> upgrade (או שגיאה, אם auto_upgrade כבוי).
+    """
+    import migrations
+    conn = get_connection()
+    if migrations.current_version(conn) >= migrations.LATEST_VERSION:
+        return
+    if not auto_upgrade:
+        raise RuntimeError("Database schema is outdated. Run: python migrations.py upgrade")
+    migrations.upgrade(conn)
+
+def get_data_versions() -> dict[str, int]:
+    """
+    מוני data_versions ({"rooms": n, "reservations": n, ...}) בלי לקרוא את הטבלה
+    כשאין צורך: PRAGMA data_version משתנה כשחיבור אחר (גם מתהליך אחר) ביצע commit,
+    ו-total_changes כשהחיבור הזה עצמו כתב. אם שניהם לא זזו — הערכים מהזיכרון.
+    """
+    conn = get_connection()
+    stamp = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+    cached = getattr(_local, "versions", None)
+    if cached is not None and cached[0] is conn and cached[1] == stamp:
+        return cached[2]
+
+    rows = conn.execute("SELECT name, version FROM data_versions").fetchall()
+    versions = {r["name"]: r["version"] for r in rows}
+    _local.versions = (conn, stamp, versions)
+    return versions
 
-    conn.commit()
-    conn.close()
 
 # -------------------------
 # Rooms helpers
@@ -183,7 +254,28 @@ def seed_rooms_if_empty() -> None:
             )
         conn.commit()
 
-    conn.close()
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def _room_catalog() -> catalog.RoomCatalog:
+    """קטלוג כיתות אחד לכל קובץ DB בתהליך (משותף גם לאינדקס הזמינות)."""
+    global _catalog
+    path = str(DB_PATH)
+    with _catalog_lock:
+        if _catalog is None or _catalog[0] != path:
+            _catalog = (path, catalog.RoomCatalog())
+        return _catalog[1]
+
+
+def resolve_room(room_text: str | None) -> str | None:
+    """
+    code של כיתה פעילה לפי code או name (אחרי נרמול רווחים/אותיות),
+    או None אם אין כזו. מהזיכרון — בלי שאילתה על rooms.
+    """
+    room = _room_catalog().resolve(get_connection(), room_text)
+    return room["code"] if room else None
 
 
 def room_exists(room_text: str) -> bool:
@@ -191,56 +283,394 @@ def room_exists(room_text: str) -> bool:
     מחזיר True אם הכיתה קיימת ופעילה בטבלת rooms.
     מאפשר התאמה לפי code או לפי name (כדי לתמוך במה שהמשתמש מקליד).
     """
-    if room_text is None:
-        return False
+    return resolve_room(room_text) is not None
 
-    # ניקוי בסיסי: רווחים בתחילה/סוף + איחוד רווחים כפולים
-    room_norm = " ".join(room_text.strip().split())
-    if not room_norm:
-        return False
 
+def suggest_rooms(room_text: str | None, limit: int = catalog.SUGGEST_LIMIT) -> list[dict]:
+    """
+    כיתות דומות לטקסט (autocomplete / "האם התכוונת ל...").
+    מחזיר [{"code", "name", "score"}, ...] מהדומה ביותר.
+    """
+    matches = _room_catalog().suggest(get_connection(), room_text, limit=limit)
+    return [
+        {"code": room["code"], "name": room["name"] or room["code"], "score": score}
+        for room, score in matches
+    ]
+
+
+def get_room_catalog_stats() -> dict:
+    return _room_catalog().stats()
+
+
+def get_active_rooms() -> list[dict]:
+    """כל הכיתות הפעילות עם הפרטים (מהקטלוג בזיכרון)."""
+    return list(_room_catalog().rooms(get_connection()))
+
+
+# -------------------------
+# Room usage rollups (analytics)
+# -------------------------
+# triggers על reservations מסמנים (תאריך, כיתה) ב-room_usage_dirty;
+# הריענון מחשב מחדש רק אותם — לא את כל ההיסטוריה.
+USAGE_REFRESH_BATCH = 2000
+
+
+def _usage_rows(conn, date_str: str, room: str) -> tuple[tuple, list[tuple]]:
+    """שורת room_usage_daily + שורות room_usage_hourly ל-(תאריך, כיתה) אחד."""
+    active = cancelled = 0
+    intervals = []
+    for r in conn.execute("""
+        SELECT start_time, end_time, status
+        FROM reservations
+        WHERE room = ? AND date = ?
+    """, (room, date_str)):
+        if r["status"] == "cancelled":
+            cancelled += 1
+        else:
+            active += 1
+            intervals.append((availability.to_min(r["start_time"]), availability.to_min(r["end_time"])))
+
+    mask = availability.busy_mask(intervals)
+    weekday = availability.weekday_of(date_str)
+    hourly = [
+        (date_str, room, availability.OPEN_MIN // 60 + h, weekday, minutes)
+        for h, minutes in enumerate(availability.hour_minutes(mask))
+        if minutes
+    ]
+    return (date_str, room, active, cancelled, mask.bit_count()), hourly
+
+
+def refresh_room_usage(batch: int = USAGE_REFRESH_BATCH, max_batches: int | None = None) -> int:
+    """
+    מרענן את ה-rollups לכל מה שסומן כמלוכלך. כל batch בטרנזקציה קצרה משלו
+    (לא מחזיקים נעילת כתיבה לאורך ריענון ראשון של שנים). מחזיר כמה זוגות רועננו.
+    max_batches: עצירה אחרי כמה batches (צעד חסום בתוך request).
+    """
     conn = get_connection()
-    row = conn.execute("""
-        SELECT 1
-        FROM rooms
-        WHERE is_active = 1
-          AND (code = ? OR name = ?)
-        LIMIT 1
-    """, (room_norm, room_norm)).fetchone()
-    conn.close()
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batches += 1
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            dirty = [
+                (r["date"], r["room"])
+                for r in conn.execute("SELECT date, room FROM room_usage_dirty LIMIT ?", (batch,))
+            ]
+            if not dirty:
+                conn.rollback()
+                return total
+
+            daily, hourly = [], []
+            for date_str, room in dirty:
+                day_row, hour_rows = _usage_rows(conn, date_str, room)
+                if day_row[2] or day_row[3]:
+                    daily.append(day_row)
+                hourly.extend(hour_rows)
+
+            conn.executemany("DELETE FROM room_usage_daily WHERE date = ? AND room = ?", dirty)
+            conn.executemany("DELETE FROM room_usage_hourly WHERE date = ? AND room = ?", dirty)
+            conn.executemany("""
+                INSERT INTO room_usage_daily (date, room, active, cancelled, minutes)
+                VALUES (?, ?, ?, ?, ?)
+            """, daily)
+            conn.executemany("""
+                INSERT INTO room_usage_hourly (date, room, hour, weekday, minutes)
+                VALUES (?, ?, ?, ?, ?)
+            """, hourly)
+            conn.executemany("DELETE FROM room_usage_dirty WHERE date = ? AND room = ?", dirty)
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        total += len(dirty)
+    return total
+
+
+def get_room_usage_totals(date_from: str, date_to: str):
+    """לכל כיתה בטווח: שריונים פעילים, מבוטלים ודקות תפוסות (מה-rollups)."""
+    conn = get_connection()
+    return conn.execute("""
+        SELECT room, SUM(active) AS active, SUM(cancelled) AS cancelled, SUM(minutes) AS minutes
+        FROM room_usage_daily
+        WHERE date BETWEEN ? AND ?
+        GROUP BY room
+    """, (date_from, date_to)).fetchall()
+
+
+def get_room_usage_hourly(date_from: str, date_to: str):
+    """דקות תפוסות לכל (כיתה, יום בשבוע, שעה) בטווח (מה-rollups)."""
+    conn = get_connection()
+    return conn.execute("""
+        SELECT room, weekday, hour, SUM(minutes) AS minutes
+        FROM room_usage_hourly
+        WHERE date BETWEEN ? AND ?
+        GROUP BY room, weekday, hour
+    """, (date_from, date_to)).fetchall()
+
+
+# -------------------------
+# Report KPI rollups
+# -------------------------
+# report_status_log נכתב ע"י triggers (append-only). הריענון עובר רק על שורות
+# חדשות מאז ה-watermark ומוסיף אותן ל-report_kpi_daily — בלי לסרוק את reports.
+KPI_REFRESH_BATCH = 5000
+
+# גבולות עליונים (בדקות) של דליי ההיסטוגרמה של זמן טיפול; הדלי האחרון = מעל 30 יום
+RESOLVE_BUCKETS_MIN = (15, 30, 60, 120, 240, 480, 1440, 2880, 4320, 10080, 20160, 43200)
+
+
+def resolve_bucket(seconds: float) -> int:
+    minutes = seconds / 60
+    for i, upper in enumerate(RESOLVE_BUCKETS_MIN):
+        if minutes <= upper:
+            return i
+    return len(RESOLVE_BUCKETS_MIN)
+
+
+def empty_resolve_hist() -> list[list]:
+    """לכל דלי [count, min_seconds, max_seconds] — min/max מגבילים את האינטרפולציה של p90."""
+    return [[0, None, None] for _ in range(len(RESOLVE_BUCKETS_MIN) + 1)]
+
+
+def merge_resolve_hist(a: list[list], b: list[list]) -> list[list]:
+    return [
+        [ca + cb,
+         min(x for x in (mina, minb) if x is not None) if ca or cb else None,
+         max(x for x in (maxa, maxb) if x is not None) if ca or cb else None]
+        for (ca, mina, maxa), (cb, minb, maxb) in zip(a, b)
+    ]
+
 
-    return row is not None
+def refresh_report_kpis(batch: int = KPI_REFRESH_BATCH, max_batches: int | None = None) -> int:
+    """מוסיף ל-report_kpi_daily את מעברי הסטטוס החדשים. מחזיר כמה שורות יומן עובדו."""
+    conn = get_connection()
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batches += 1
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            last_id = conn.execute(
+                "SELECT last_id FROM rollup_watermarks WHERE name = 'report_kpi'"
+            ).fetchone()["last_id"]
+            rows = conn.execute("""
+                SELECT l.id, l.old_status, l.new_status, l.changed_at, l.timed,
+                       r.room, r.category_user, r.created_at
+                FROM report_status_log l
+                LEFT JOIN reports r ON r.id = l.report_id
+                WHERE l.id > ?
+                ORDER BY l.id
+                LIMIT ?
+            """, (last_id, batch)).fetchall()
+            if not rows:
+                conn.rollback()
+                return total
+
+            deltas = {}
+            for r in rows:
+                if r["room"] is None:
+                    continue  # הדיווח נמחק
+                changed = _parse_utc(r["changed_at"])
+                key = (changed.astimezone(LOCAL_TZ).strftime("%Y-%m-%d"), r["room"], r["category_user"])
+                d = deltas.get(key)
+                if d is None:
+                    d = deltas[key] = {"opened": 0, "started": 0, "resolved": 0, "reopened": 0,
+                                       "seconds": 0.0, "hist": empty_resolve_hist()}
+
+                old, new = r["old_status"], r["new_status"]
+                if old is None:
+                    d["opened"] += 1
+                if new == "in_progress" and old == "open":
+                    d["started"] += 1
+                if old == "done" and new != "done":
+                    d["reopened"] += 1
+                if new == "done":
+                    d["resolved"] += 1
+                    if r["timed"]:  # 0 = זמן סגירה לא ידוע (היסטוריה מלפני היומן)
+                        seconds = max(0.0, (changed - _parse_utc(r["created_at"])).total_seconds())
+                        d["seconds"] += seconds
+                        bucket = d["hist"][resolve_bucket(seconds)]
+                        bucket[0] += 1
+                        bucket[1] = seconds if bucket[1] is None else min(bucket[1], seconds)
+                        bucket[2] = seconds if bucket[2] is None else max(bucket[2], seconds)
+
+            for (day, room, category), d in deltas.items():
+                old_row = conn.execute("""
+                    SELECT opened, started, resolved, reopened, resolve_seconds, resolve_hist
+                    FROM report_kpi_daily
+                    WHERE day = ? AND room = ? AND category_user = ?
+                """, (day, room, category)).fetchone()
+                if old_row is not None:
+                    d["hist"] = merge_resolve_hist(json.loads(old_row["resolve_hist"]), d["hist"])
+                    for col in ("opened", "started", "resolved", "reopened"):
+                        d[col] += old_row[col]
+                    d["seconds"] += old_row["resolve_seconds"]
+
+                conn.execute("""
+                    INSERT OR REPLACE INTO report_kpi_daily (
+                        day, room, category_user,
+                        opened, started, resolved, reopened, resolve_seconds, resolve_hist
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (day, room, category, d["opened"], d["started"], d["resolved"],
+                      d["reopened"], d["seconds"], json.dumps(d["hist"])))
+
+            conn.execute(
+                "UPDATE rollup_watermarks SET last_id = ? WHERE name = 'report_kpi'", (rows[-1]["id"],)
+            )
+            conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        total += len(rows)
+    return total
+
+
+def refresh_rollups() -> dict[str, int]:
+    """השלמה מלאה של כל ה-rollups (CLI של המיגרציות / thread רקע)."""
+    return {"room_usage": refresh_room_usage(), "report_kpi": refresh_report_kpis()}
 
 
+def rollups_pending() -> bool:
+    """האם נשאר משהו שה-rollups עוד לא ספגו (שתי שאילתות על אינדקס)."""
+    conn = get_connection()
+    return bool(conn.execute("""
+        SELECT EXISTS (SELECT 1 FROM room_usage_dirty)
+            OR EXISTS (
+                SELECT 1 FROM report_status_log
+                WHERE id > (SELECT last_id FROM rollup_watermarks WHERE name = 'report_kpi')
+            )
+    """).fetchone()[0])
+
+
+def get_report_kpi_rows(date_from: str, date_to: str):
+    conn = get_connection()
+    return conn.execute("""
+        SELECT day, room, category_user, opened, started, resolved, reopened,
+               resolve_seconds, resolve_hist
+        FROM report_kpi_daily
+        WHERE day BETWEEN ? AND ?
+    """, (date_from, date_to)).fetchall()
+
+
+def get_open_report_counts():
+    """דיווחים פתוחים כרגע לכל (כיתה, קטגוריה) — מסכום כל ה-rollups."""
+    conn = get_connection()
+    return conn.execute("""
+        SELECT room, category_user, SUM(opened + reopened - resolved) AS open_now
+        FROM report_kpi_daily
+        GROUP BY room, category_user
+        HAVING open_now > 0
+    """).fetchall()
 
 
-def get_all_reports():
+# -------------------------
+# Weekly schedule
+# -------------------------
+def get_weekly_schedule():
+    conn = get_connection()
+    return conn.execute("""
+        SELECT id, room_code, weekday, start_time, end_time, title
+        FROM weekly_schedule
+        ORDER BY room_code, weekday, start_time
+    """).fetchall()
+
+
+def add_weekly_schedule_bulk(rows, replace: bool = False) -> int:
     """
-    מחזיר דיווחים מאוחדים:
-    אם יש כמה דיווחים באותה כיתה + אותה קטגוריה בתוך שעה -> יוצג אחד,
-    עם שדה report_count שמספר כמה דיווחים אוחדו.
+    כתיבת מערכת שבועית שלמה (למשל מ-timetable.py) בטרנזקציה אחת עם executemany.
+    rows: [(room_code, weekday, 'HH:MM', 'HH:MM', title), ...]
+    replace=True מוחק קודם את כל המערכת הקיימת.
     """
     conn = get_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        if replace:
+            conn.execute("DELETE FROM weekly_schedule")
+        conn.executemany("""
+            INSERT INTO weekly_schedule (room_code, weekday, start_time, end_time, title)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return len(rows)
 
-    rows = conn.execute("""
-        WITH grouped AS (
-          SELECT
-            room,
-            category_user,
-            -- חלון שעה: נחתוך את created_at לשעה (YYYY-MM-DD HH)
-           strftime('%Y-%m-%d %H', datetime(created_at, '+2 hours')) AS hour_bucket,
-
-
-            MIN(id) AS min_id,
-            MAX(id) AS last_id,
-            COUNT(*) AS report_count,
-
-            MIN(COALESCE(severity_rank, 999)) AS min_severity_rank,
-            MAX(created_at) AS last_created_at
-          FROM reports
-          WHERE status != 'done'
-          GROUP BY room, category_user, hour_bucket
-        )
+
+
+
+def encode_report_cursor(row) -> str:
+    return f'{row["min_severity_rank"]}|{row["last_created_at"]}|{row["group_id"]}'
+
+
+def _decode_report_cursor(cursor: str) -> tuple[int, str, int]:
+    rank, last_created_at, group_id = cursor.split("|")
+    return int(rank), last_created_at, int(group_id)
+
+
+def _local_day_start_utc(date_str: str) -> str:
+    """'YYYY-MM-DD' (שעון ישראל) -> תחילת היום ב-UTC בפורמט של created_at."""
+    day = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=LOCAL_TZ)
+    return day.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_report_queue(
+    status: str = "open",
+    room: str | None = None,
+    category_user: str | None = None,
+    severity_rank: int | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    cursor: str | None = None,
+    limit: int = REPORT_PAGE_SIZE,
+):
+    """
+    עמוד אחד מתור הקבוצות (חומרה עולה, ואז העדכני ביותר), עם keyset pagination:
+    cursor = המפתח של השורה האחרונה בעמוד הקודם, כך שכל עמוד הוא סריקה קצרה
+    באינדקס, בלי OFFSET ובלי קשר לכמה דיווחים הצטברו.
+    מחזיר (rows, next_cursor) — next_cursor=None אם אין עוד.
+    """
+    if status not in ("open", "done"):
+        raise ValueError("Invalid status")
+    limit = max(1, min(int(limit), MAX_REPORT_PAGE_SIZE))
+
+    where = ["g.status = ?"]
+    params = [status]
+
+    if room:
+        where.append("g.room = ?")
+        params.append(room)
+    if category_user:
+        where.append("g.category_user = ?")
+        params.append(category_user)
+    if severity_rank is not None:
+        where.append("g.min_severity_rank = ?")
+        params.append(severity_rank)
+    if date_from:
+        where.append("g.last_created_at >= ?")
+        params.append(_local_day_start_utc(date_from))
+    if date_to:
+        end = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)
+        where.append("g.last_created_at < ?")
+        params.append(_local_day_start_utc(end.strftime("%Y-%m-%d")))
+    if cursor:
+        rank, last_created_at, group_id = _decode_report_cursor(cursor)
+        where.append("""(
+            g.min_severity_rank > ?
+            OR (g.min_severity_rank = ? AND (
+                g.last_created_at < ?
+                OR (g.last_created_at = ? AND g.id < ?)
+            ))
+        )""")
+        params += [rank, rank, last_created_at, last_created_at, group_id]
+
+    conn = get_connection()
+    rows = conn.execute(f"""
         SELECT
           r.id,
           r.reporter_national_id,
@@ -255,17 +685,22 @@ def get_all_reports():
           r.ai_rationale,
           r.status,
           r.created_at,
-          g.report_count
-        FROM grouped g
-        JOIN reports r ON r.id = g.last_id
-        ORDER BY
-          COALESCE(r.severity_rank, g.min_severity_rank, 999) ASC,
-          datetime(g.last_created_at) DESC,
-          r.id DESC
-    """).fetchall()
-
-    conn.close()
-    return rows
+          g.id AS group_id,
+          g.report_count,
+          g.min_severity_rank,
+          g.last_created_at
+        FROM report_groups g
+        JOIN reports r ON r.id = g.last_report_id
+        WHERE {" AND ".join(where)}
+        ORDER BY g.min_severity_rank ASC, g.last_created_at DESC, g.id DESC
+        LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_report_cursor(rows[-1])
+    return rows, next_cursor
 
 
 # -------------------------
@@ -282,7 +717,6 @@ def is_allowed_user(national_id: str, role: str) -> bool:
         (national_id, role),
     )
     ok = cur.fetchone() is not None
-    conn.close()
     return ok
 
 def user_exists(national_id: str) -> bool:
@@ -290,7 +724,6 @@ def user_exists(national_id: str) -> bool:
     cur = conn.cursor()
     cur.execute("SELECT 1 FROM users WHERE national_id=?", (national_id,))
     exists = cur.fetchone() is not None
-    conn.close()
     return exists
 
 def create_user(national_id: str, role: str, password: str) -> None:
@@ -307,7 +740,6 @@ def create_user(national_id: str, role: str, password: str) -> None:
         (national_id, role, password),
     )
     conn.commit()
-    conn.close()
 
 def authenticate(national_id: str, role: str, password: str) -> bool:
     conn = get_connection()
@@ -317,7 +749,6 @@ def authenticate(national_id: str, role: str, password: str) -> bool:
         (national_id, role, password),
     )
     ok = cur.fetchone() is not None
-    conn.close()
     return ok
 
 def get_full_name(national_id: str, role: str) -> str | None:
@@ -328,12 +759,171 @@ def get_full_name(national_id: str, role: str) -> str | None:
         (national_id, role),
     )
     row = cur.fetchone()
-    conn.close()
     return row["full_name"] if row else None
 
 #<!!!-----reports-----------------------------
 
 
+# -------------------------
+# Change events
+# -------------------------
+# כל שינוי בדיווח נרשם ל-change_events באותה טרנזקציה, ואחרי commit
+# מודיעים למאזינים בתהליך (events.ChangeBus) כדי שיקראו מיד.
+_change_listeners = []
+
+
+def add_change_listener(fn) -> None:
+    _change_listeners.append(fn)
+
+
+def _notify_change() -> None:
+    for fn in _change_listeners:
+        try:
+            fn()
+        except Exception as e:
+            print("change listener failed:", e)
+
+
+def _group_snapshot(conn, group_id: int | None) -> dict:
+    if group_id is None:
+        return {}
+    row = conn.execute("""
+        SELECT id, room, category_user, status, report_count, min_severity_rank, last_report_id
+        FROM report_groups
+        WHERE id = ?
+    """, (group_id,)).fetchone()
+    return dict(row) if row else {}
+
+
+def _record_change(conn, kind: str, report_id: int | None, group_id: int | None, **data) -> None:
+    payload = {"report_id": report_id, "group": _group_snapshot(conn, group_id), **data}
+    conn.execute("""
+        INSERT INTO change_events (kind, report_id, group_id, payload, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (kind, report_id, group_id, json.dumps(payload, ensure_ascii=False), time.time()))
+
+
+def get_change_events_since(last_id: int, limit: int = 500) -> list[dict]:
+    rows = get_connection().execute("""
+        SELECT id, kind, payload, created_at
+        FROM change_events
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    """, (last_id, limit)).fetchall()
+    return [
+        {"id": r["id"], "kind": r["kind"], "data": json.loads(r["payload"]), "created_at": r["created_at"]}
+        for r in rows
+    ]
+
+
+def get_last_change_event_id() -> int:
+    row = get_connection().execute("SELECT MAX(id) FROM change_events").fetchone()
+    return row[0] or 0
+
+
+def prune_change_events(keep: int = 10000) -> int:
+    conn = get_connection()
+    cur = conn.execute("""
+        DELETE FROM change_events
+        WHERE id <= (SELECT MAX(id) FROM change_events) - ?
+    """, (keep,))
+    conn.commit()
+    return cur.rowcount
+
+
+# -------------------------
+# Report groups
+# -------------------------
+# מחשב מחדש את נתוני הקבוצה מהדיווחים שלה (קבוצה = מעט שורות, באינדקס group_id).
+# משמש כשדיווח בודד משנה סטטוס/דירוג, וב-backfill.
+_REFRESH_GROUP_SQL = """
+    UPDATE report_groups
+    SET report_count = (
+            SELECT COUNT(*) FROM reports
+            WHERE group_id = report_groups.id AND status != 'done'
+        ),
+        min_severity_rank = COALESCE(
+            (SELECT MIN(COALESCE(severity_rank, 999)) FROM reports
+             WHERE group_id = report_groups.id AND status != 'done'),
+            (SELECT MIN(COALESCE(severity_rank, 999)) FROM reports
+             WHERE group_id = report_groups.id),
+            999
+        ),
+        last_created_at = (
+            SELECT MAX(created_at) FROM reports WHERE group_id = report_groups.id
+        ),
+        last_report_id = COALESCE(
+            (SELECT MAX(id) FROM reports WHERE group_id = report_groups.id AND status != 'done'),
+            (SELECT MAX(id) FROM reports WHERE group_id = report_groups.id)
+        ),
+        status = CASE
+            WHEN EXISTS (
+                SELECT 1 FROM reports WHERE group_id = report_groups.id AND status != 'done'
+            ) THEN 'open'
+            ELSE 'done'
+        END
+"""
+
+
+def _parse_utc(created_at: str) -> datetime:
+    try:
+        dt = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        dt = datetime.now(timezone.utc)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _attach_to_group(conn, report_id: int, room: str, category_user: str,
+                     created_at: datetime, severity_rank: int | None) -> int:
+    """מצרף דיווח חדש לקבוצה פתוחה בחלון, או פותח קבוצה חדשה. מחזיר group_id."""
+    created_str = created_at.strftime("%Y-%m-%d %H:%M:%S")
+    since = (created_at - timedelta(minutes=REPORT_GROUP_WINDOW_MINUTES)).strftime("%Y-%m-%d %H:%M:%S")
+    rank = 999 if severity_rank is None else severity_rank
+
+    row = conn.execute("""
+        SELECT id FROM report_groups
+        WHERE room = ? AND category_user = ? AND last_created_at >= ? AND status = 'open'
+        ORDER BY last_created_at DESC
+        LIMIT 1
+    """, (room, category_user, since)).fetchone()
+
+    if row is None:
+        group_id = conn.execute("""
+            INSERT INTO report_groups (
+                room, category_user, status, report_count, min_severity_rank,
+                first_created_at, last_created_at, last_report_id
+            )
+            VALUES (?, ?, 'open', 1, ?, ?, ?, ?)
+        """, (room, category_user, rank, created_str, created_str, report_id)).lastrowid
+    else:
+        group_id = row["id"]
+        conn.execute("""
+            UPDATE report_groups
+            SET report_count = report_count + 1,
+                min_severity_rank = MIN(min_severity_rank, ?),
+                last_created_at = ?,
+                last_report_id = ?
+            WHERE id = ?
+        """, (rank, created_str, report_id, group_id))
+
+    conn.execute("UPDATE reports SET group_id = ? WHERE id = ?", (group_id, report_id))
+    _record_change(
+        conn, "report_created" if row is None else "group_incremented", report_id, group_id,
+        room=room, category_user=category_user,
+    )
+    return group_id
+
+
+def _refresh_group_of_report(conn, report_id: int) -> None:
+    conn.execute(
+        _REFRESH_GROUP_SQL + "WHERE id = (SELECT group_id FROM reports WHERE id = ?)",
+        (report_id,),
+    )
+
+
 def create_report(
     reporter_national_id: str,
     role: str,
@@ -343,22 +933,36 @@ def create_report(
     severity_rank: int | None = None,
     ai_confidence: float | None = None,
     ai_rationale: str | None = None
-) -> None:
+) -> int:
     if role not in ("student", "lecturer"):
         raise ValueError("Invalid reporter role")
 
+    now = datetime.now(timezone.utc)
+
     conn = get_connection()
-    conn.execute("""
-        INSERT INTO reports (
-            reporter_national_id, role, room, category_user, description,
-            ai_category, severity, status,
-            severity_rank, ai_confidence, ai_rationale
-        )
-        VALUES (?, ?, ?, ?, ?, NULL, NULL, 'open', ?, ?, ?)
-    """, (reporter_national_id, role, room, category_user, description,
-          severity_rank, ai_confidence, ai_rationale))
-    conn.commit()
-    conn.close()
+    # IMMEDIATE: שני דיווחים במקביל לא יפתחו שתי קבוצות לאותה תקלה
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cur = conn.execute("""
+            INSERT INTO reports (
+                reporter_national_id, role, room, category_user, description,
+                ai_category, severity, status,
+                severity_rank, ai_confidence, ai_rationale,
+                created_at
+            )
+            VALUES (?, ?, ?, ?, ?, NULL, NULL, 'open', ?, ?, ?, ?)
+        """, (reporter_national_id, role, room, category_user, description,
+              severity_rank, ai_confidence, ai_rationale,
+              now.strftime("%Y-%m-%d %H:%M:%S")))
+        report_id = cur.lastrowid
+        _attach_to_group(conn, report_id, room, category_user, now, severity_rank)
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    _notify_change()
+    return report_id
 
 
 def get_reports_by_reporter(reporter_national_id: str):
@@ -372,7 +976,6 @@ def get_reports_by_reporter(reporter_national_id: str):
         ORDER BY id DESC
     """, (reporter_national_id,))
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
@@ -382,62 +985,59 @@ def update_report_status(report_id: int, new_status: str) -> None:
         raise ValueError("Invalid status")
 
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        UPDATE reports
-        SET status = ?
-        WHERE id = ?
-    """, (new_status, report_id))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute("""
+            UPDATE reports
+            SET status = ?
+            WHERE id = ?
+        """, (new_status, report_id))
+        _refresh_group_of_report(conn, report_id)
+        group = conn.execute("SELECT group_id FROM reports WHERE id = ?", (report_id,)).fetchone()
+        _record_change(conn, "status_changed", report_id, group["group_id"] if group else None,
+                       status=new_status)
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    _notify_change()
 
 
 def mark_report_group_done_by_id(report_id: int) -> int:
     """
-    מסמן כ-done את כל הדיווחים באותה קבוצה של report_id:
-    room + category_user + אותה שעה (YYYY-MM-DD HH)
-    מחזיר כמה שורות עודכנו.
+    מסמן כ-done את כל הדיווחים בקבוצה של report_id וסוגר את הקבוצה.
+    מחזיר כמה דיווחים עודכנו.
     """
     conn = get_connection()
     cur = conn.cursor()
 
-    # מפתח הקבוצה של הדיווח שעליו לחצו
-    row = cur.execute("""
-        SELECT
-            room,
-            category_user,
-            strftime('%Y-%m-%d %H', datetime(created_at, '+2 hours')) AS hour_bucket
-
-        FROM reports
-        WHERE id = ?
-    """, (report_id,)).fetchone()
-
+    row = cur.execute("SELECT group_id FROM reports WHERE id = ?", (report_id,)).fetchone()
     if row is None:
-        conn.close()
         return 0
 
-    room = row["room"]
-    category_user = row["category_user"]
-    hour_bucket = row["hour_bucket"]
-
-    # סוגרים את כל הדיווחים בקבוצה
-    cur.execute("""
-        UPDATE reports
-        SET status = 'done'
-        WHERE status != 'done'
-          AND room = ?
-          AND category_user = ?
-          AND strftime('%Y-%m-%d %H', datetime(created_at, '+2 hours')) = ?
-
-    """, (room, category_user, hour_bucket))
-
-    conn.commit()
-    n = cur.rowcount
-    conn.close()
+    try:
+        cur.execute("""
+            UPDATE reports
+            SET status = 'done'
+            WHERE group_id = ? AND status != 'done'
+        """, (row["group_id"],))
+        n = cur.rowcount
+
+        cur.execute("""
+            UPDATE report_groups
+            SET status = 'done', report_count = 0, closed_at = datetime('now')
+            WHERE id = ?
+        """, (row["group_id"],))
+        _record_change(conn, "group_closed", report_id, row["group_id"], status="done", closed=n)
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    _notify_change()
     return n
 
 
-
 def get_report_by_id(report_id: int):
     conn = get_connection()
     row = conn.execute("""
@@ -446,67 +1046,569 @@ def get_report_by_id(report_id: int):
         FROM reports
         WHERE id = ?
     """, (report_id,)).fetchone()
-    conn.close()
     return row
 
 
 
 
-########תהילה########
-########תהילה########
+# -------------------------
+# Triage jobs (AI ברקע)
+# -------------------------
 
-def get_available_rooms(date: str, start_time: str, end_time: str):
+def enqueue_triage_job(report_id: int) -> int:
+    now = time.time()
+    conn = get_connection()
+    cur = conn.execute("""
+        INSERT INTO triage_jobs (report_id, status, enqueued_at, next_attempt_at)
+        VALUES (?, 'queued', ?, ?)
+    """, (report_id, now, now))
+    conn.commit()
+    return cur.lastrowid
+
+
+def claim_triage_jobs(limit: int = 1) -> list:
     """
-    מחזיר rooms (מטבלת rooms) שלא תפוסים בטווח הזמן.
+    תופס עד limit עבודות שהגיע זמנן (queued -> running) בפקודה אטומית אחת,
+    כך ששני workers (גם בתהליכים שונים) לא יקבלו את אותה עבודה.
+    מחזיר את העבודות + פרטי הדיווח.
+    עבודה שהדיווח שלה נמחק מסומנת failed באותה טרנזקציה (אחרת הייתה נשארת running).
     """
+    now = time.time()
     conn = get_connection()
+    try:
+        claimed = conn.execute("""
+            UPDATE triage_jobs
+            SET status = 'running', attempts = attempts + 1, started_at = ?
+            WHERE id IN (
+                SELECT id FROM triage_jobs
+                WHERE status = 'queued' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            )
+            RETURNING id
+        """, (now, now, limit)).fetchall()
+        if not claimed:
+            conn.commit()
+            return []
+
+        ids = [r["id"] for r in claimed]
+        marks = ",".join("?" * len(ids))
+        jobs = conn.execute(f"""
+            SELECT
+                j.id, j.report_id, j.attempts, j.enqueued_at,
+                r.category_user, r.room, r.description
+            FROM triage_jobs j
+            JOIN reports r ON r.id = j.report_id
+            WHERE j.id IN ({marks})
+            ORDER BY j.id
+        """, ids).fetchall()
+        if len(jobs) < len(ids):
+            conn.execute(f"""
+                UPDATE triage_jobs
+                SET status = 'failed', finished_at = ?, last_error = 'report not found'
+                WHERE id IN ({marks})
+                  AND NOT EXISTS (SELECT 1 FROM reports r WHERE r.id = triage_jobs.report_id)
+            """, (now, *ids))
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    return jobs
+
+
+def complete_triage_job(
+    job_id: int,
+    report_id: int,
+    severity_rank: int,
+    ai_confidence: float,
+    ai_rationale: str,
+) -> None:
+    """מעדכן את הדיווח ואת העבודה באותה טרנזקציה."""
+    conn = get_connection()
+    try:
+        conn.execute("""
+            UPDATE reports
+            SET severity_rank = ?, ai_confidence = ?, ai_rationale = ?
+            WHERE id = ?
+        """, (severity_rank, ai_confidence, ai_rationale, report_id))
+        _refresh_group_of_report(conn, report_id)
+        group = conn.execute("SELECT group_id FROM reports WHERE id = ?", (report_id,)).fetchone()
+        _record_change(conn, "triage_completed", report_id, group["group_id"] if group else None,
+                       severity_rank=severity_rank, ai_confidence=ai_confidence)
+        conn.execute("""
+            UPDATE triage_jobs
+            SET status = 'done', finished_at = ?, last_error = NULL
+            WHERE id = ?
+        """, (time.time(), job_id))
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    _notify_change()
+
 
-    # כל החדרים הפעילים
-    all_rooms = conn.execute("""
-        SELECT code
-        FROM rooms
-        WHERE is_active = 1
-        ORDER BY code
+def retry_triage_job(job_id: int, error: str, next_attempt_at: float) -> bool:
+    """running -> queued. False אם העבודה כבר לא running (למשל הושלמה)."""
+    conn = get_connection()
+    cur = conn.execute("""
+        UPDATE triage_jobs
+        SET status = 'queued', next_attempt_at = ?, last_error = ?
+        WHERE id = ? AND status = 'running'
+    """, (next_attempt_at, error, job_id))
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def defer_triage_job(job_id: int, next_attempt_at: float) -> bool:
+    """מחזיר לתור בלי לספור ניסיון (למשל כשה-circuit breaker פתוח)."""
+    conn = get_connection()
+    cur = conn.execute("""
+        UPDATE triage_jobs
+        SET status = 'queued', attempts = MAX(attempts - 1, 0), next_attempt_at = ?
+        WHERE id = ? AND status = 'running'
+    """, (next_attempt_at, job_id))
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def fail_triage_job(job_id: int, error: str) -> bool:
+    conn = get_connection()
+    cur = conn.execute("""
+        UPDATE triage_jobs
+        SET status = 'failed', finished_at = ?, last_error = ?
+        WHERE id = ? AND status = 'running'
+    """, (time.time(), error, job_id))
+    conn.commit()
+    return cur.rowcount > 0
+
+
+def requeue_stale_triage_jobs(older_than_seconds: float) -> int:
+    """עבודות שנתקעו ב-running (למשל worker שנפל) חוזרות לתור."""
+    conn = get_connection()
+    cur = conn.execute("""
+        UPDATE triage_jobs
+        SET status = 'queued'
+        WHERE status = 'running' AND started_at < ?
+    """, (time.time() - older_than_seconds,))
+    conn.commit()
+    return cur.rowcount
+
+
+def count_pending_triage_jobs() -> int:
+    conn = get_connection()
+    return conn.execute("""
+        SELECT COUNT(*) FROM triage_jobs WHERE status IN ('queued', 'running')
+    """).fetchone()[0]
+
+
+def count_triage_jobs() -> dict:
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT status, COUNT(*) AS n FROM triage_jobs GROUP BY status
     """).fetchall()
-    all_codes = [r["code"] for r in all_rooms]
+    return {r["status"]: r["n"] for r in rows}
 
-    # חדרים תפוסים בטווח
-    taken_rows = conn.execute("""
-        SELECT DISTINCT room
-        FROM reservations
-        WHERE date = ?
-          AND status != 'cancelled'
-          AND (? < end_time AND ? > start_time)
-    """, (date, start_time, end_time)).fetchall()
-    taken = {r["room"] for r in taken_rows}
 
-    conn.close()
+def get_cached_triage(key: str, min_created_at: float):
+    conn = get_connection()
+    return conn.execute("""
+        SELECT severity_rank, confidence, rationale, created_at
+        FROM triage_cache
+        WHERE key = ? AND created_at >= ?
+    """, (key, min_created_at)).fetchone()
 
-    # זמינים = הכל - תפוסים
-    return [code for code in all_codes if code not in taken]
 
-def create_reservation(user_id, role, room, date, start_time, end_time):
-    """מוסיף הזמנה חדשה לטבלה"""
+def put_cached_triage(key: str, severity_rank: int, confidence: float,
+                      rationale: str, created_at: float) -> None:
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO triage_cache (key, severity_rank, confidence, rationale, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            severity_rank = excluded.severity_rank,
+            confidence = excluded.confidence,
+            rationale = excluded.rationale,
+            created_at = excluded.created_at
+    """, (key, severity_rank, confidence, rationale, created_at))
+    conn.commit()
 
-    # ✅ בדיקה פשוטה כדי למנוע הזמנה עם role לא חוקי
-    if role not in ("student", "lecturer"):
-        print(f"שגיאה: role לא חוקי להזמנה: {role}")
-        return False
 
+def prune_triage_cache(older_than: float) -> int:
     conn = get_connection()
+    cur = conn.execute("DELETE FROM triage_cache WHERE created_at < ?", (older_than,))
+    conn.commit()
+    return cur.rowcount
+
+
+########תהילה########
+########תהילה########
+
+# -------------------------
+# Booking
+# -------------------------
+# כמה פעמים לנסות שוב כשה-DB נעול (מעבר ל-busy_timeout של כל ניסיון)
+BOOKING_MAX_ATTEMPTS = 5
+BOOKING_RETRY_BASE = 0.05
+
+BOOKING_OK = "ok"
+BOOKING_INVALID = "invalid"
+BOOKING_UNKNOWN_ROOM = "unknown_room"
+BOOKING_SCHEDULE_CONFLICT = "schedule_conflict"
+BOOKING_RESERVATION_CONFLICT = "reservation_conflict"
+BOOKING_QUOTA = "quota"
+BOOKING_BUSY = "busy"
+
+
+class BookingResult(NamedTuple):
+    ok: bool
+    reason: str                      # אחד מ-BOOKING_*
+    reservation_id: int | None = None
+    attempts: int = 1
+
+
+def _is_busy_error(e: sqlite3.OperationalError) -> bool:
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+
+def _book_once(conn, user_id, role, room, date, start_time, end_time) -> BookingResult:
+    """בדיקות + INSERT בתוך טרנזקציה אחת. הקורא אחראי ל-BEGIN/COMMIT."""
+    if conn.execute("SELECT 1 FROM rooms WHERE code = ?", (room,)).fetchone() is None:
+        return BookingResult(False, BOOKING_UNKNOWN_ROOM)
+
+    if conn.execute("""
+        SELECT 1 FROM weekly_schedule
+        WHERE room_code = ? AND weekday = ? AND start_time < ? AND end_time > ?
+        LIMIT 1
+    """, (room, availability.weekday_of(date), end_time, start_time)).fetchone():
+        return BookingResult(False, BOOKING_SCHEDULE_CONFLICT)
+
+    if conn.execute("""
+        SELECT 1 FROM reservations
+        WHERE room = ? AND date = ? AND status = 'active'
+          AND start_time < ? AND end_time > ?
+        LIMIT 1
+    """, (room, date, end_time, start_time)).fetchone():
+        return BookingResult(False, BOOKING_RESERVATION_CONFLICT)
+
+    # סטודנט: שריון פעיל אחד ליום
+    if role == "student" and conn.execute("""
+        SELECT 1 FROM reservations
+        WHERE user_national_id = ? AND role = 'student' AND date = ? AND status = 'active'
+        LIMIT 1
+    """, (user_id, date)).fetchone():
+        return BookingResult(False, BOOKING_QUOTA)
+
+    cur = conn.execute("""
+        INSERT INTO reservations (user_national_id, role, room, date, start_time, end_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'active')
+    """, (user_id, role, room, date, start_time, end_time))
+    return BookingResult(True, BOOKING_OK, cur.lastrowid)
+
+
+def book_reservation(user_id, role, room, date, start_time, end_time) -> BookingResult:
+    """
+    שריון אטומי: בדיקת מערכת שבועית + הזמנות פעילות + מכסה, וה-INSERT,
+    באותה טרנזקציית BEGIN IMMEDIATE (נעילת כתיבה מההתחלה), כך ששני משתמשים
+    שלוחצים על אותו חלון לא יכולים להצליח שניהם — גם מתהליכים שונים.
+    """
+    if role not in ("student", "lecturer"):
+        return BookingResult(False, BOOKING_INVALID)
     try:
-        query = """
-            INSERT INTO reservations (user_national_id, role, room, date, start_time, end_time, status)
-            VALUES (?, ?, ?, ?, ?, ?, 'active')
-        """
-        conn.execute(query, (user_id, role, room, date, start_time, end_time))
-        conn.commit()
-        return True
-    except Exception as e:
-        print(f"שגיאה בשמירת הזמנה: {e}")
-        return False
-    finally:
-        conn.close()
+        datetime.strptime(date, "%Y-%m-%d")
+        start_m, end_m = availability.to_min(start_time), availability.to_min(end_time)
+    except (TypeError, ValueError):
+        return BookingResult(False, BOOKING_INVALID)
+    # אותן שעות פתיחה שהאינדקס משתמש בהן — מחוץ להן אין מה לשריין
+    if end_m <= start_m or start_m < availability.OPEN_MIN or end_m > availability.CLOSE_MIN:
+        return BookingResult(False, BOOKING_INVALID)
+    start_time, end_time = availability.to_hhmm(start_m), availability.to_hhmm(end_m)
+
+    conn = get_connection()
+    for attempt in range(1, BOOKING_MAX_ATTEMPTS + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = _book_once(conn, user_id, role, room, date, start_time, end_time)
+            if result.ok:
+                conn.commit()
+            else:
+                conn.rollback()
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not _is_busy_error(e):
+                raise
+            if attempt == BOOKING_MAX_ATTEMPTS:
+                return BookingResult(False, BOOKING_BUSY, attempts=attempt)
+            # backoff עם jitter כדי שה-writers לא ינסו שוב באותו רגע
+            time.sleep(BOOKING_RETRY_BASE * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+            continue
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+        if result.ok:
+            _availability_index().reservation_added(
+                conn, result.reservation_id, room, date, start_time, end_time
+            )
+        return result._replace(attempts=attempt)
+
+
+# -------------------------
+# Bulk / recurring booking
+# -------------------------
+MAX_BULK_OCCURRENCES = 120
+
+BULK_ALL_OR_NOTHING = "all_or_nothing"
+BULK_BEST_EFFORT = "best_effort"
+
+BOOKING_DUPLICATE = "duplicate"     # חופף למופע אחר באותה בקשה
+
+
+class BulkBookingResult(NamedTuple):
+    ok: bool                 # all_or_nothing: הכל נשמר; best_effort: לפחות מופע אחד
+    booked: list             # [(date, start, end, reservation_id), ...]
+    conflicts: list          # [(date, start, end, reason), ...]
+    attempts: int = 1
+
+
+def recurring_dates(first_date: str, until_date: str, interval_weeks: int = 1) -> list[str]:
+    """כל first_date + k*interval_weeks שבועות, עד until_date (כולל)."""
+    start = datetime.strptime(first_date, "%Y-%m-%d").date()
+    until = datetime.strptime(until_date, "%Y-%m-%d").date()
+    if until < start or interval_weeks < 1:
+        raise ValueError("Invalid recurrence")
+    step = timedelta(weeks=interval_weeks)
+    dates = []
+    d = start
+    while d <= until:
+        dates.append(d.isoformat())
+        d += step
+    return dates
+
+
+def _bulk_conflicts(conn, user_id, role, room, occurrences) -> list:
+    """
+    בדיקה אחת לכל המופעים: שאילתה אחת למערכת השבועית של הכיתה, אחת להזמנות
+    בטווח התאריכים, ואחת למכסת סטודנט — ואז בדיקת חפיפה בזיכרון (bisect).
+    מחזיר reason (או None) לכל מופע, באותו סדר.
+    """
+    dates = sorted({date for date, _, _ in occurrences})
+
+    weekly = {}
+    for row in conn.execute(
+        "SELECT weekday, start_time, end_time FROM weekly_schedule WHERE room_code = ?", (room,)
+    ):
+        weekly.setdefault(row["weekday"], []).append(
+            (availability.to_min(row["start_time"]), availability.to_min(row["end_time"]))
+        )
+
+    taken = {}
+    for row in conn.execute("""
+        SELECT date, start_time, end_time FROM reservations
+        WHERE room = ? AND status = 'active' AND date BETWEEN ? AND ?
+    """, (room, dates[0], dates[-1])):
+        taken.setdefault(row["date"], []).append(
+            (availability.to_min(row["start_time"]), availability.to_min(row["end_time"]))
+        )
+
+    quota_dates = set()
+    if role == "student":
+        quota_dates = {row["date"] for row in conn.execute("""
+            SELECT date FROM reservations
+            WHERE user_national_id = ? AND role = 'student' AND status = 'active'
+              AND date BETWEEN ? AND ?
+        """, (user_id, dates[0], dates[-1]))}
+
+    weekly = {k: availability.merge_intervals(v) for k, v in weekly.items()}
+    taken = {k: availability.merge_intervals(v) for k, v in taken.items()}
+
+    reasons = []
+    accepted = {}     # date -> [(s, e)] מהבקשה הנוכחית
+    for date, start_t, end_t in occurrences:
+        s, e = availability.to_min(start_t), availability.to_min(end_t)
+        if availability.overlaps(weekly.get(availability.weekday_of(date), []), s, e):
+            reason = BOOKING_SCHEDULE_CONFLICT
+        elif availability.overlaps(taken.get(date, []), s, e):
+            reason = BOOKING_RESERVATION_CONFLICT
+        elif date in quota_dates:
+            reason = BOOKING_QUOTA
+        elif any(s < ae and as_ < e for as_, ae in accepted.get(date, [])):
+            reason = BOOKING_DUPLICATE
+        else:
+            reason = None
+            accepted.setdefault(date, []).append((s, e))
+            if role == "student":
+                quota_dates.add(date)
+        reasons.append(reason)
+    return reasons
+
+
+def book_reservations_bulk(user_id, role, room, occurrences, mode: str = BULK_ALL_OR_NOTHING) -> BulkBookingResult:
+    """
+    שריון של הרבה מופעים (למשל כל יום שלישי בסמסטר) בטרנזקציה אחת:
+    בדיקת התנגשויות לכל המופעים במעבר אחד, ו-INSERT אחד עם executemany.
+    occurrences: [(date, start_time, end_time), ...]
+    all_or_nothing: התנגשות אחת -> לא נשמר כלום. best_effort: נשמר כל מה שפנוי.
+    """
+    if mode not in (BULK_ALL_OR_NOTHING, BULK_BEST_EFFORT):
+        raise ValueError("Invalid bulk booking mode")
+    if role not in ("student", "lecturer") or not occurrences:
+        return BulkBookingResult(False, [], [])
+    if len(occurrences) > MAX_BULK_OCCURRENCES:
+        raise ValueError(f"Too many occurrences (max {MAX_BULK_OCCURRENCES})")
+
+    normalized = []
+    invalid = []
+    for date, start_t, end_t in occurrences:
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+            s, e = availability.to_min(start_t), availability.to_min(end_t)
+        except (TypeError, ValueError):
+            invalid.append((date, start_t, end_t, BOOKING_INVALID))
+            continue
+        if e <= s or s < availability.OPEN_MIN or e > availability.CLOSE_MIN:
+            invalid.append((date, start_t, end_t, BOOKING_INVALID))
+            continue
+        normalized.append((date, availability.to_hhmm(s), availability.to_hhmm(e)))
+
+    if not normalized or (invalid and mode == BULK_ALL_OR_NOTHING):
+        return BulkBookingResult(False, [], invalid)
+
+    conn = get_connection()
+    for attempt in range(1, BOOKING_MAX_ATTEMPTS + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM rooms WHERE code = ?", (room,)).fetchone() is None:
+                conn.rollback()
+                return BulkBookingResult(
+                    False, [], [(*occ, BOOKING_UNKNOWN_ROOM) for occ in normalized] + invalid, attempt
+                )
+
+            reasons = _bulk_conflicts(conn, user_id, role, room, normalized)
+            conflicts = [(*occ, r) for occ, r in zip(normalized, reasons) if r] + invalid
+            to_book = [occ for occ, r in zip(normalized, reasons) if r is None]
+
+            if not to_book or (conflicts and mode == BULK_ALL_OR_NOTHING):
+                conn.rollback()
+                return BulkBookingResult(False, [], conflicts, attempt)
+
+            conn.executemany("""
+                INSERT INTO reservations (user_national_id, role, room, date, start_time, end_time, status)
+                VALUES (?, ?, ?, ?, ?, ?, 'active')
+            """, [(user_id, role, room, date, s, e) for date, s, e in to_book])
+            # AUTOINCREMENT + נעילת כתיבה -> המזהים רצופים
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not _is_busy_error(e):
+                raise
+            if attempt == BOOKING_MAX_ATTEMPTS:
+                return BulkBookingResult(False, [], [(*occ, BOOKING_BUSY) for occ in normalized], attempt)
+            time.sleep(BOOKING_RETRY_BASE * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+            continue
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+        first_id = last_id - len(to_book) + 1
+        booked = [(*occ, first_id + i) for i, occ in enumerate(to_book)]
+        # הרבה שורות בבת אחת -> סנכרון רגיל של אינדקס הזמינות
+        _availability_index().sync(conn)
+        return BulkBookingResult(True, booked, conflicts, attempt)
+
+
+# -------------------------
+# Home pages (student / lecturer)
+# -------------------------
+_HOME_RESERVATION_COLS = "id, room, date, start_time, end_time, status"
+
+
+def get_upcoming_reservations(user_id, today: str, limit: int = HOME_UPCOMING_LIMIT):
+    """שריונים פעילים מהיום והלאה, הקרובים קודם (idx_reservations_user_home)."""
+    return get_connection().execute(f"""
+        SELECT {_HOME_RESERVATION_COLS}
+        FROM reservations
+        WHERE user_national_id = ? AND date >= ? AND status = 'active'
+        ORDER BY date, start_time
+        LIMIT ?
+    """, (user_id, today, limit)).fetchall()
+
+
+def get_reservation_history(user_id, today: str, cursor: str | None = None,
+                            limit: int = HOME_PAGE_SIZE):
+    """
+    שריונים שכבר עברו (כל סטטוס), מהחדש לישן, עם cursor "date|start_time|id".
+    מחזיר (rows, next_cursor).
+    """
+    where = "user_national_id = ? AND date < ?"
+    params = [user_id, today]
+    if cursor:
+        c_date, c_start, c_id = cursor.split("|")
+        # date <= ? נותן גבול לסריקת האינדקס; ה-row value מסנן בתוך אותו יום
+        where += " AND date <= ? AND (date, start_time, id) < (?, ?, ?)"
+        params += [c_date, c_date, c_start, int(c_id)]
+
+    rows = get_connection().execute(f"""
+        SELECT {_HOME_RESERVATION_COLS}
+        FROM reservations
+        WHERE {where}
+        ORDER BY date DESC, start_time DESC, id DESC
+        LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f'{last["date"]}|{last["start_time"]}|{last["id"]}'
+    return rows, next_cursor
+
+
+def get_reports_page(reporter_national_id: str, cursor: int | None = None,
+                     limit: int = HOME_PAGE_SIZE):
+    """
+    הדיווחים של המשתמש מהחדש לישן (idx_reports_reporter_id), cursor = id אחרון.
+    מחזיר (rows, next_cursor).
+    """
+    where = "reporter_national_id = ?"
+    params = [reporter_national_id]
+    if cursor is not None:
+        where += " AND id < ?"
+        params.append(int(cursor))
+
+    rows = get_connection().execute(f"""
+        SELECT id, room, category_user, description, status, created_at
+        FROM reports
+        WHERE {where}
+        ORDER BY id DESC
+        LIMIT ?
+    """, (*params, limit + 1)).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    return rows, next_cursor
+
+
+def get_home_data(user_id, today: str) -> dict:
+    """כל מה שמסך הבית צריך, על אותו חיבור, בכמויות חסומות."""
+    reports, reports_cursor = get_reports_page(user_id)
+    history, history_cursor = get_reservation_history(user_id, today)
+    return {
+        "taken": get_upcoming_reservations(user_id, today),
+        "reports": reports,
+        "reports_cursor": reports_cursor,
+        "history": history,
+        "history_cursor": history_cursor,
+    }
 
 
 def get_user_reservations(user_id):
@@ -514,7 +1616,6 @@ def get_user_reservations(user_id):
     conn = get_connection()
     query = "SELECT * FROM reservations WHERE user_national_id = ? ORDER BY date DESC"
     rows = conn.execute(query, (user_id,)).fetchall()
-    conn.close()
     return rows
 
 
@@ -524,79 +1625,91 @@ def cancel_reservation(res_id, user_id):
     try:
         # אנחנו מוודאים שה-user_id תואם כדי שרק בעל ההזמנה יוכל לבטל אותה
         query = "UPDATE reservations SET status = 'cancelled' WHERE id = ? AND user_national_id = ?"
-        conn.execute(query, (res_id, user_id))
+        cur = conn.execute(query, (res_id, user_id))
         conn.commit()
-        return True
     except Exception as e:
+        conn.rollback()
         print(f"שגיאה בביטול: {e}")
         return False
-    finally:
-        conn.close()
+
+    if cur.rowcount:
+        _availability_index().reservation_removed(conn, res_id)
+    return True
 
 
 
+# -------------------------
+# Availability (in-memory index)
+# -------------------------
+_availability = None
+_availability_lock = threading.Lock()
 
 
+def _availability_index() -> availability.AvailabilityIndex:
+    """אינדקס זמינות אחד לכל קובץ DB בתהליך."""
+    global _availability
+    path = str(DB_PATH)
+    with _availability_lock:
+        if _availability is None or _availability[0] != path:
+            _availability = (path, availability.AvailabilityIndex(_room_catalog()))
+        return _availability[1]
+
 
 ######תהיךה
 
-def get_detailed_available_rooms(date_str: str, start_t: str, end_t: str):
+def _best_fit(rooms, requirements: catalog.RoomRequirements | None):
+    """בלי דרישות: סדר code כרגיל. עם דרישות: הכיתה הקטנה ביותר שמתאימה קודם."""
+    if requirements is None or requirements.is_empty():
+        return rooms
+    return sorted(rooms, key=lambda r: (catalog.best_fit_key(r, requirements), r["code"]))
+
+
+def get_available_rooms_by_slot(
+    date_str: str,
+    slots: list[tuple[str, str]] | None = None,
+    start_t: str | None = None,
+    end_t: str | None = None,
+    slot_minutes: int = DEFAULT_SLOT_MINUTES,
+    requirements: catalog.RoomRequirements | None = None,
+):
     """
-    מחזיר רשימת חדרים פנויים לפי:
-    1) מערכת שבועית weekly_schedule (לימודים קבועים)
-    2) שריונים בפועל reservations
+    זמינות לכמה סלוטים בבת אחת (מעבר אחד על הזמנים התפוסים).
+    מקבל או רשימת slots [('HH:MM','HH:MM'), ...]
+    או חלון start_t-end_t שמחולק לסלוטים רצופים באורך slot_minutes.
 
-    מחזיר גם פרטי כיתה:
-    room_type, description, has_projector, seats, computer_stations
+    מחזיר [{"start": 'HH:MM', "end": 'HH:MM', "rooms": [...]}, ...] לפי סדר הסלוטים.
     """
+    if slots is None:
+        if start_t is None or end_t is None:
+            raise ValueError("Either slots or start_t/end_t are required")
+        slot_mins = availability.make_slots(
+            availability.to_min(start_t), availability.to_min(end_t), slot_minutes
+        )
+    else:
+        slot_mins = [(availability.to_min(s), availability.to_min(e)) for s, e in slots]
 
-    # ✅ weekday בצורה בטוחה: Sunday=0 ... Saturday=6
-    # Python weekday(): Monday=0 ... Sunday=6
-    py_wd = datetime.strptime(date_str, "%Y-%m-%d").weekday()  # Mon=0..Sun=6
-    weekday = (py_wd + 1) % 7                                 # Sun=0..Sat=6
+    if not slot_mins:
+        return []
 
     conn = get_connection()
+    rooms_per_slot = _availability_index().free_rooms_by_slot(
+        conn, date_str, slot_mins, codes=_room_catalog().matching_codes(conn, requirements)
+    )
 
-    rows = conn.execute("""
-        SELECT
-            r.code,
-            r.name,
-            r.room_type,
-            r.description,
-            r.has_projector,
-            r.seats,
-            r.computer_stations
-        FROM rooms r
-        WHERE r.is_active = 1
-
-          -- לא תפוס בגלל מערכת שבועית (לימודים)
-          AND r.code NOT IN (
-              SELECT ws.room_code
-              FROM weekly_schedule ws
-              WHERE ws.weekday = ?
-                AND (? < ws.end_time AND ? > ws.start_time)
-          )
-
-          -- לא תפוס בגלל שריון קיים
-          AND r.code NOT IN (
-              SELECT DISTINCT room
-              FROM reservations
-              WHERE date = ?
-                AND status != 'cancelled'
-                AND (? < end_time AND ? > start_time)
-          )
-
-        ORDER BY r.code
-    """, (weekday, start_t, end_t,
-          date_str, start_t, end_t)).fetchall()
-
-    conn.close()
-    return rows
+    return [
+        {
+            "start": availability.to_hhmm(s),
+            "end": availability.to_hhmm(e),
+            "rooms": _best_fit(rooms, requirements),
+        }
+        for (s, e), rooms in zip(slot_mins, rooms_per_slot)
+    ]
 
 
 ######תהילה######
 
-def get_room_free_blocks(date_str: str, req_start: str, req_end: str):
+def get_room_free_blocks(date_str: str, req_start: str, req_end: str,
+                         requirements: catalog.RoomRequirements | None = None):
     """
     מחזיר חלונות פנויים *מקסימליים* לכל כיתה בתוך הטווח שביקש המרצה.
     הפנוי מחושב לפי:
@@ -606,165 +1719,95 @@ def get_room_free_blocks(date_str: str, req_start: str, req_end: str):
     מחזיר גם פרטי כיתה:
     room_type, description, has_projector, seats, computer_stations
     """
-
-    def to_min(t: str) -> int:
-        h, m = t.split(":")
-        return int(h) * 60 + int(m)
-
-    def to_hhmm(x: int) -> str:
-        h = x // 60
-        m = x % 60
-        return f"{h:02d}:{m:02d}"
-
-    # שעות פעילות מכללה
-    OPEN_MIN = 8 * 60
-    CLOSE_MIN = 20 * 60
-
-    rs = max(to_min(req_start), OPEN_MIN)
-    re = min(to_min(req_end), CLOSE_MIN)
+    return get_room_free_blocks_range(date_str, date_str, req_start, req_end,
+                                      requirements=requirements)
+
+
+def _date_range(date_from: str, date_to: str) -> list[str]:
+    start = datetime.strptime(date_from, "%Y-%m-%d").date()
+    end = datetime.strptime(date_to, "%Y-%m-%d").date()
+    if end < start:
+        raise ValueError("date_to is before date_from")
+    days = (end - start).days + 1
+    if days > MAX_RANGE_DAYS:
+        raise ValueError(f"Date range is limited to {MAX_RANGE_DAYS} days")
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+
+
+def get_room_free_blocks_range(
+    date_from: str,
+    date_to: str,
+    req_start: str,
+    req_end: str,
+    min_minutes: int = 1,
+    requirements: catalog.RoomRequirements | None = None,
+):
+    """
+    כמו get_room_free_blocks, אבל לכל התאריכים בטווח date_from..date_to (כולל),
+    ורק חלונות באורך min_minutes לפחות. החישוב על bitmap של דקות לכל כיתה/יום.
+    ממוין לפי תאריך ואז לפי code; עם requirements — לפי תאריך, הכיתה הקטנה
+    ביותר שמתאימה, ואז החלון הארוך ביותר.
+    """
+    rs = max(availability.to_min(req_start), availability.OPEN_MIN)
+    re = min(availability.to_min(req_end), availability.CLOSE_MIN)
     if re <= rs:
         return []
 
     conn = get_connection()
-
-    # 1) כל הכיתות הפעילות + פרטים
-    rooms = conn.execute("""
-        SELECT
-            code, name,
-            room_type, description, has_projector, seats, computer_stations
-        FROM rooms
-        WHERE is_active = 1
-        ORDER BY code
-    """).fetchall()
-
-    # 2) יום בשבוע לפי SQLite: 0=Sunday ... 6=Saturday
-    weekday = conn.execute(
-        "SELECT CAST(strftime('%w', ?) AS INTEGER) AS wd",
-        (date_str,)
-    ).fetchone()["wd"]
-
     result = []
 
-    for room in rooms:
-        code = room["code"]
-        name = room["name"] or code
-
-        # 3) להביא כל "הזמנים התפוסים" של הכיתה (מערכת שבועית + שריונים)
-        busy_rows = conn.execute("""
-            SELECT start_time, end_time FROM weekly_schedule
-            WHERE room_code = ?
-              AND weekday = ?
-              AND (? < end_time AND ? > start_time)
-
-            UNION ALL
-
-            SELECT start_time, end_time FROM reservations
-            WHERE room = ?
-              AND date = ?
-              AND status != 'cancelled'
-              AND (? < end_time AND ? > start_time)
-        """, (code, weekday, req_start, req_end,
-              code, date_str, req_start, req_end)).fetchall()
-
-        busy = []
-        for b in busy_rows:
-            bs = max(to_min(b["start_time"]), rs)
-            be = min(to_min(b["end_time"]), re)
-            if be > bs:
-                busy.append((bs, be))
-
-        # 4) מיזוג חפיפות
-        busy.sort()
-        merged = []
-        for s, e in busy:
-            if not merged or s > merged[-1][1]:
-                merged.append([s, e])
-            else:
-                merged[-1][1] = max(merged[-1][1], e)
-
-        # 5) היפוך -> פנוי מקסימלי בתוך [rs,re]
-        free = []
-        cur = rs
-        for s, e in merged:
-            if s > cur:
-                free.append((cur, s))
-            cur = max(cur, e)
-        if cur < re:
-            free.append((cur, re))
-
-        # 6) להוסיף לרשימה: כל חלון פנוי מקסימלי + פרטים
+    blocks = _availability_index().free_blocks_range(
+        conn, _date_range(date_from, date_to), rs, re, max(1, min_minutes),
+        codes=_room_catalog().matching_codes(conn, requirements),
+    )
+    ranked = requirements is not None and not requirements.is_empty()
+    if ranked:
+        blocks = [
+            (date_str, room, sorted(free, key=lambda b: b[0] - b[1]))
+            for date_str, room, free in sorted(
+                blocks,
+                key=lambda b: (b[0], catalog.best_fit_key(b[1], requirements),
+                               -max((fe - fs for fs, fe in b[2]), default=0), b[1]["code"]),
+            )
+        ]
+
+    for date_str, room, free in blocks:
         for fs, fe in free:
-            if fe > fs:
-                result.append({
-                    "code": code,
-                    "name": name,
-                    "free_start": to_hhmm(fs),
-                    "free_end": to_hhmm(fe),
-                    "date": date_str,
-
-                    "room_type": room["room_type"],
-                    "description": room["description"],
-                    "has_projector": room["has_projector"],
-                    "seats": room["seats"],
-                    "computer_stations": room["computer_stations"],
-                })
+            result.append({
+                "code": room["code"],
+                "name": room["name"] or room["code"],
+                "free_start": availability.to_hhmm(fs),
+                "free_end": availability.to_hhmm(fe),
+                "date": date_str,
+
+                "room_type": room["room_type"],
+                "description": room["description"],
+                "has_projector": room["has_projector"],
+                "seats": room["seats"],
+                "computer_stations": room["computer_stations"],
+            })
 
-    conn.close()
     return result
 
 
-def is_room_available(date_str: str, room_code: str, start_t: str, end_t: str) -> bool:
+def get_rooms_free_for(
+    date_from: str,
+    date_to: str,
+    min_minutes: int,
+    start_t: str = "08:00",
+    end_t: str = "20:00",
+    requirements: catalog.RoomRequirements | None = None,
+) -> dict[str, list[str]]:
     """
-    מחזיר True אם הכיתה פנויה בטווח:
-    - לא מתנגש עם weekly_schedule
-    - לא מתנגש עם reservations פעילים
-    - וגם בתוך שעות פתיחה 08:00-20:00
+    אילו כיתות פנויות לפחות min_minutes ברצף בטווח השעות, בכל יום בטווח התאריכים.
+    מחזיר {room_code: [תאריכים]} (כיתה בלי אף יום מתאים לא מופיעה).
     """
-
-    def to_min(t: str) -> int:
-        h, m = t.split(":")
-        return int(h) * 60 + int(m)
-
-    OPEN_MIN = 8 * 60
-    CLOSE_MIN = 20 * 60
-
-    s = to_min(start_t)
-    e = to_min(end_t)
-
-    if e <= s:
-        return False
-    if s < OPEN_MIN or e > CLOSE_MIN:
-        return False
-
     conn = get_connection()
-
-    weekday = conn.execute(
-        "SELECT CAST(strftime('%w', ?) AS INTEGER) AS wd",
-        (date_str,)
-    ).fetchone()["wd"]
-
-    row = conn.execute("""
-        SELECT 1
-        WHERE EXISTS (
-            SELECT 1 FROM weekly_schedule
-            WHERE room_code = ?
-              AND weekday = ?
-              AND (? < end_time AND ? > start_time)
-        )
-        OR EXISTS (
-            SELECT 1 FROM reservations
-            WHERE room = ?
-              AND date = ?
-              AND status != 'cancelled'
-              AND (? < end_time AND ? > start_time)
-        )
-    """, (room_code, weekday, start_t, end_t,
-          room_code, date_str, start_t, end_t)).fetchone()
-
-    conn.close()
-
-    # אם מצאנו התנגשות => לא פנוי
-    return row is None
-
-
-
+    return _availability_index().rooms_free_for(
+        conn,
+        _date_range(date_from, date_to),
+        min_minutes,
+        availability.to_min(start_t),
+        availability.to_min(end_t),
+        codes=_room_catalog().matching_codes(conn, requirements),
+    )
@@ -0,0 +1,169 @@
+# events.py
+"""
+פיד שינויים חי לצוות התחזוקה (Server-Sent Events).
+
+- כל שינוי בדיווח נרשם ב-db לטבלת change_events (באותה טרנזקציה).
+- ChangeBus: thread אחד בתהליך קורא אירועים חדשים ומפיץ לכל הלקוחות
+  (fan-out משותף — לא שאילתה לכל לקוח).
+- בתוך התהליך: db מודיע אחרי commit -> קריאה מיידית.
+- בין workers של gunicorn: בודקים PRAGMA data_version על חיבור ייעודי,
+  שמשתנה כשחיבור אחר (גם מתהליך אחר) ביצע commit.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+import db
+
+
+class ChangeBus:
+    def __init__(self, poll_interval: float = 1.0, buffer_size: int = 1000,
+                 heartbeat: float = 15.0, prune_every: float = 600.0, keep: int = 10000):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.prune_every = prune_every
+        self.keep = keep
+
+        self._buffer = deque(maxlen=buffer_size)   # אירועים אחרונים (לפי id עולה)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._subscribers = 0
+        self._polls = 0
+        self._fetches = 0
+        self._errors = 0
+
+        db.add_change_listener(self._wake.set)
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            if self._last_id is None:
+                self._last_id = db.get_last_change_event_id()
+            self._thread = threading.Thread(target=self._run, name="change-bus", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        try:
+            data_version = None
+            last_prune = time.monotonic()
+
+            while not self._stop.is_set():
+                woke = self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                self._polls += 1
+
+                try:
+                    # commit מחיבור אחר -> data_version משתנה (בלי לקרוא טבלאות)
+                    current = db.get_connection().execute("PRAGMA data_version").fetchone()[0]
+                    if woke or current != data_version:
+                        self._fetch()
+                        data_version = current
+
+                    if time.monotonic() - last_prune >= self.prune_every:
+                        last_prune = time.monotonic()
+                        db.prune_change_events(self.keep)
+                except Exception as e:
+                    # למשל database is locked: ה-thread היחיד של ה-fan-out לא נופל,
+                    # data_version נשאר ישן -> הסבב הבא מנסה שוב
+                    self._errors += 1
+                    print("Change bus error:", e)
+                    self._stop.wait(self.poll_interval)
+        finally:
+            db.close_connection()
+
+    def _fetch(self) -> None:
+        # בעמודים עד שאין עוד — אחרי פרץ של יותר מעמוד אחד לא מחכים ל-commit הבא
+        while True:
+            events = db.get_change_events_since(self._last_id)
+            if not events:
+                return
+            self._fetches += 1
+            with self._cond:
+                self._buffer.extend(events)
+                self._last_id = events[-1]["id"]
+                self._cond.notify_all()
+
+    # -------------------------
+    # Consumers
+    # -------------------------
+    def last_id(self) -> int:
+        self.start()
+        return self._last_id
+
+    def _buffered_since(self, last_id: int) -> list[dict] | None:
+        """אירועים אחרי last_id מהזיכרון; None אם חלק כבר נפלט מה-buffer."""
+        if self._buffer and self._buffer[0]["id"] > last_id + 1:
+            return None
+        return [e for e in self._buffer if e["id"] > last_id]
+
+    def missed_since(self, last_id: int) -> list[dict]:
+        """להשלמה אחרי reconnect (Last-Event-ID). נקרא בתוך ה-request (יש חיבור DB)."""
+        with self._cond:
+            events = self._buffered_since(last_id)
+        if events is None:
+            events = db.get_change_events_since(last_id, limit=self._buffer.maxlen)
+        return events
+
+    def stream(self, last_id: int):
+        """
+        generator של הודעות SSE. לא נוגע ב-DB — רק מחכה על ה-buffer המשותף.
+        """
+        self.start()
+        with self._cond:
+            self._subscribers += 1
+        try:
+            yield "retry: 3000\n\n"
+            while not self._stop.is_set():
+                with self._cond:
+                    events = self._buffered_since(last_id)
+                    if not events:
+                        self._cond.wait(self.heartbeat)
+                        events = self._buffered_since(last_id)
+
+                if events is None:
+                    # הלקוח פספס יותר מה-buffer: שיתחבר מחדש ויקבל השלמה מה-DB
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                for event in events:
+                    yield format_sse(event)
+                    last_id = event["id"]
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "subscribers": self._subscribers,
+                "last_event_id": self._last_id,
+                "buffered": len(self._buffer),
+                "polls": self._polls,
+                "fetches": self._fetches,
+                "errors": self._errors,
+            }
+
+
+def format_sse(event: dict) -> str:
+    data = json.dumps(event["data"], ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {data}\n\n"
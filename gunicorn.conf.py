@@ -0,0 +1,15 @@
+# gunicorn.conf.py
+# הרצה: gunicorn   (הקובץ נטען אוטומטית מהתיקייה הנוכחית)
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+
+# gthread: פיד ה-SSE מחזיק חיבור פתוח, אז צריך כמה threads לכל worker
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# ה-master טוען את האפליקציה פעם אחת ובונה מראש מבנים לקריאה בלבד,
+# וה-workers נוצרים ב-fork וחולקים אותם (copy-on-write)
+preload_app = True
+wsgi_app = "app:create_app(preload=True)"
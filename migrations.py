@@ -0,0 +1,623 @@
+# migrations.py
+"""
+מיגרציות סכמה לפי PRAGMA user_version.
+
+כל צעד רץ פעם אחת, לפי הסדר, בטרנזקציה משלו (BEGIN IMMEDIATE),
+ו-user_version מתעדכן באותה טרנזקציה — כך שגם כמה workers שעולים יחד
+לא יריצו את אותו צעד פעמיים.
+
+בעליה (app.py) יש רק בדיקה אחת של user_version (db.ensure_schema).
+עדכון ידני:
+    python migrations.py status
+    python migrations.py upgrade
+"""
+import argparse
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import db
+
+
+# -------------------------
+# Frozen helpers
+# -------------------------
+# צעד שכבר שוחרר לא תלוי בקוד החי של db.py: שינוי בחלון הקיבוץ או ברשימת
+# הטבלאות שם לא משנה מה צעד 1 עושה ל-DB ישן.
+_M001_GROUP_WINDOW = timedelta(minutes=60)
+
+_M001_REFRESH_GROUP_SQL = """
+    UPDATE report_groups
+    SET report_count = (
+            SELECT COUNT(*) FROM reports
+            WHERE group_id = report_groups.id AND status != 'done'
+        ),
+        min_severity_rank = COALESCE(
+            (SELECT MIN(COALESCE(severity_rank, 999)) FROM reports
+             WHERE group_id = report_groups.id AND status != 'done'),
+            (SELECT MIN(COALESCE(severity_rank, 999)) FROM reports
+             WHERE group_id = report_groups.id),
+            999
+        ),
+        last_created_at = (
+            SELECT MAX(created_at) FROM reports WHERE group_id = report_groups.id
+        ),
+        last_report_id = COALESCE(
+            (SELECT MAX(id) FROM reports WHERE group_id = report_groups.id AND status != 'done'),
+            (SELECT MAX(id) FROM reports WHERE group_id = report_groups.id)
+        ),
+        status = CASE
+            WHEN EXISTS (
+                SELECT 1 FROM reports WHERE group_id = report_groups.id AND status != 'done'
+            ) THEN 'open'
+            ELSE 'done'
+        END
+"""
+
+
+def _m001_parse_utc(created_at: str) -> datetime:
+    try:
+        dt = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        dt = datetime.now(timezone.utc)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _m001_backfill_report_groups(cur) -> None:
+    """דיווחים ישנים בלי group_id -> קבוצות לפי אותו חלון נגלל."""
+    rows = cur.execute("""
+        SELECT id, room, category_user, created_at
+        FROM reports
+        WHERE group_id IS NULL
+        ORDER BY created_at, id
+    """).fetchall()
+    if not rows:
+        return
+
+    current = {}   # (room, category) -> (group_id, last_dt)
+    assignments = []
+    for report_id, room, category_user, created_at in rows:
+        dt = _m001_parse_utc(created_at)
+        key = (room, category_user)
+        group = current.get(key)
+        if group is None or dt - group[1] > _M001_GROUP_WINDOW:
+            group_id = cur.execute("""
+                INSERT INTO report_groups (room, category_user, first_created_at, last_created_at)
+                VALUES (?, ?, ?, ?)
+            """, (room, category_user, created_at, created_at)).lastrowid
+        else:
+            group_id = group[0]
+        current[key] = (group_id, dt)
+        assignments.append((group_id, report_id))
+
+    cur.executemany("UPDATE reports SET group_id = ? WHERE id = ?", assignments)
+    cur.executemany(
+        _M001_REFRESH_GROUP_SQL + "WHERE id = ?",
+        [(group_id,) for group_id in {g for g, _ in assignments}],
+    )
+
+
+def _m001_baseline(cur) -> None:
+    """
+    הסכמה כפי שהייתה לפני המיגרציות (CREATE IF NOT EXISTS + בדיקות עמודות),
+    כדי ש-DB קיים מכל גרסה קודמת יגיע לאותו מצב.
+    """
+    # מי שמורשים להירשם (ת"ז + שם מלא + role)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS allowed_users (
+        national_id TEXT PRIMARY KEY,
+        full_name   TEXT NOT NULL,
+        role        TEXT NOT NULL CHECK(role IN ('student','lecturer','staff'))
+    );
+    """)
+
+    # משתמשים שנרשמו בפועל (ת"ז + role + password)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id          INTEGER PRIMARY KEY AUTOINCREMENT,
+        national_id TEXT UNIQUE NOT NULL,
+        role        TEXT NOT NULL CHECK(role IN ('student','lecturer','staff')),
+        password    TEXT NOT NULL,
+        created_at  TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    # rooms (חדש)
+    cur.execute("""
+       CREATE TABLE IF NOT EXISTS rooms (
+           id        INTEGER PRIMARY KEY AUTOINCREMENT,
+           code      TEXT UNIQUE NOT NULL,   -- למשל "203" / "ספריה 100"
+           name      TEXT,                   -- אופציונלי
+           is_active INTEGER NOT NULL DEFAULT 1
+       );
+       """)
+
+
+
+    # --- MIGRATION: להוסיף שדות פרטים לחדרים (rooms) אם לא קיימים ---
+    cur.execute("PRAGMA table_info(rooms)")
+    rooms_cols = [row[1] for row in cur.fetchall()]
+
+    if "room_type" not in rooms_cols:
+        cur.execute("ALTER TABLE rooms ADD COLUMN room_type TEXT NOT NULL DEFAULT 'regular'")  # regular/computers/lab
+
+    if "description" not in rooms_cols:
+        cur.execute("ALTER TABLE rooms ADD COLUMN description TEXT NOT NULL DEFAULT ''")
+
+    if "has_projector" not in rooms_cols:
+        cur.execute("ALTER TABLE rooms ADD COLUMN has_projector INTEGER NOT NULL DEFAULT 1")   # 1/0
+
+    if "seats" not in rooms_cols:
+        cur.execute("ALTER TABLE rooms ADD COLUMN seats INTEGER")
+
+    if "computer_stations" not in rooms_cols:
+        cur.execute("ALTER TABLE rooms ADD COLUMN computer_stations INTEGER")
+
+
+    # מערכת שבועית (לימודים קבועים בכיתה לפי יום בשבוע)
+    # weekday: 0=Sunday ... 6=Saturday (כמו strftime('%w') ב-SQL)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS weekly_schedule (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_code TEXT NOT NULL,       -- זה חייב להתאים ל-rooms.code
+        weekday INTEGER NOT NULL CHECK(weekday BETWEEN 0 AND 6),
+        start_time TEXT NOT NULL,      -- 'HH:MM'
+        end_time TEXT NOT NULL,        -- 'HH:MM'
+        title TEXT                      -- אופציונלי: שם קורס/שיעור
+    );
+    """)
+
+    # אינדקס לשיפור ביצועים
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_weekly_schedule_room_weekday
+    ON weekly_schedule (room_code, weekday);
+    """)
+
+    # דוחות תקלות (כולל מה שה-AI החזיר)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reports (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reporter_national_id TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('student','lecturer')),
+        room TEXT NOT NULL,
+        category_user TEXT NOT NULL,
+        description TEXT NOT NULL,
+        ai_category TEXT,
+        severity TEXT CHECK(severity IN ('low','medium','high')),
+        status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open','in_progress','done')),
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+    # --- MIGRATION: אם טבלת reports כבר קיימת מגרסה ישנה בלי room, נוסיף את העמודה ---
+    cur.execute("PRAGMA table_info(reports)")
+    reports_cols = [row[1] for row in cur.fetchall()]  # row[1] = column name
+
+    if "room" not in reports_cols:
+        cur.execute("ALTER TABLE reports ADD COLUMN room TEXT NOT NULL DEFAULT ''")
+
+    # --- MIGRATION: שדות דירוג/AI ---
+    cur.execute("PRAGMA table_info(reports)")
+    reports_cols = [row[1] for row in cur.fetchall()]
+
+    if "severity_rank" not in reports_cols:
+        cur.execute("ALTER TABLE reports ADD COLUMN severity_rank INTEGER")
+
+    if "ai_confidence" not in reports_cols:
+        cur.execute("ALTER TABLE reports ADD COLUMN ai_confidence REAL")
+
+    if "ai_rationale" not in reports_cols:
+        cur.execute("ALTER TABLE reports ADD COLUMN ai_rationale TEXT")
+
+    # יומן שינויים בדיווחים (לפיד החי של הצוות, /maintenance/events)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        report_id INTEGER,
+        group_id INTEGER,
+        payload TEXT NOT NULL,     -- JSON
+        created_at REAL NOT NULL
+    );
+    """)
+
+    # הוחלף ב-report_groups
+    cur.execute("DROP INDEX IF EXISTS idx_reports_group")
+
+    # קבוצות דיווחים (מתעדכנות ב-create_report, הדאשבורד קורא רק מכאן)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS report_groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room TEXT NOT NULL,
+        category_user TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open','done')),
+        report_count INTEGER NOT NULL DEFAULT 0,      -- דיווחים שעוד לא טופלו
+        min_severity_rank INTEGER NOT NULL DEFAULT 999,
+        first_created_at TEXT NOT NULL,
+        last_created_at TEXT NOT NULL,
+        last_report_id INTEGER,
+        closed_at TEXT
+    );
+    """)
+
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_report_groups_attach
+    ON report_groups (room, category_user, last_created_at);
+    """)
+
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_report_groups_queue
+    ON report_groups (status, min_severity_rank, last_created_at DESC, id DESC);
+    """)
+
+    # סינון לפי כיתה / קטגוריה בלי לאבד את סדר התור
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_report_groups_room_queue
+    ON report_groups (status, room, min_severity_rank, last_created_at DESC, id DESC);
+    """)
+
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_report_groups_category_queue
+    ON report_groups (status, category_user, min_severity_rank, last_created_at DESC, id DESC);
+    """)
+
+    cur.execute("PRAGMA table_info(reports)")
+    if "group_id" not in [row[1] for row in cur.fetchall()]:
+        cur.execute("ALTER TABLE reports ADD COLUMN group_id INTEGER")
+
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_reports_group_id
+    ON reports (group_id);
+    """)
+
+    _m001_backfill_report_groups(cur)
+
+    # הזמנות כיתות (מי הזמין, איזה כיתה, ומתי)
+    # שימי לב: FK זה לא "אבטחה" — זה עקביות נתונים. אבל כדי לא להסתבך, נשאיר בלי FK.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reservations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_national_id TEXT NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('student','lecturer')),
+        room TEXT NOT NULL,
+        date TEXT NOT NULL,           -- 'YYYY-MM-DD'
+        start_time TEXT NOT NULL,     -- 'HH:MM'
+        end_time TEXT NOT NULL,       -- 'HH:MM'
+        status TEXT NOT NULL DEFAULT 'active' CHECK(status IN ('active','cancelled')),
+        created_at TEXT DEFAULT (datetime('now'))
+    );
+    """)
+
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_reservations_date
+    ON reservations (date);
+    """)
+
+    # תור טריאז' AI ברקע (זמנים ב-epoch seconds)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS triage_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        report_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued','running','done','failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        enqueued_at REAL NOT NULL,
+        next_attempt_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        last_error TEXT
+    );
+    """)
+
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_triage_jobs_status_next
+    ON triage_jobs (status, next_attempt_at);
+    """)
+
+    # מטמון תוצאות טריאז' (שורד ריסטארט)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS triage_cache (
+        key TEXT PRIMARY KEY,
+        severity_rank INTEGER NOT NULL,
+        confidence REAL NOT NULL,
+        rationale TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """)
+
+    # מוני גרסה לטבלאות שמשפיעות על זמינות (מטמון בזיכרון יודע מתי להיטען מחדש,
+    # גם כשהשינוי הגיע מ-worker אחר)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name    TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    for table in ("rooms", "weekly_schedule", "reservations"):
+        cur.execute("INSERT OR IGNORE INTO data_versions (name) VALUES (?)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+            END;
+            """)
+
+
+def _m002_hot_path_indexes(cur) -> None:
+    # בדיקת התנגשויות בשריון + זמינות כיתה בתאריך
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_reservations_room_date_status
+    ON reservations (room, date, status);
+    """)
+
+    # "ההזמנות שלי" + מכסת סטודנט ליום
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_reservations_user_date
+    ON reservations (user_national_id, date);
+    """)
+
+    # "הדיווחים שלי"
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_reports_reporter_id
+    ON reports (reporter_national_id, id);
+    """)
+
+
+def _m003_home_covering_indexes(cur) -> None:
+    # מסך הבית: שריונים קרובים + היסטוריה של משתמש, בלי לגשת לטבלה עצמה.
+    # מחליף את idx_reservations_user_date (אותה תחילית)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_reservations_user_home
+    ON reservations (user_national_id, date, start_time, status, end_time, room, role);
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_reservations_user_date")
+
+
+def _m004_usage_rollups(cur) -> None:
+    # ניצולת כיתות (analytics.py): סיכומים מחושבים מראש לכל (תאריך, כיתה),
+    # כך ששאילתה על שנים של היסטוריה לא סורקת את reservations.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS room_usage_daily (
+        date      TEXT NOT NULL,
+        room      TEXT NOT NULL,
+        active    INTEGER NOT NULL,     -- שריונים פעילים
+        cancelled INTEGER NOT NULL,     -- שריונים שבוטלו
+        minutes   INTEGER NOT NULL,     -- דקות תפוסות (שריונים פעילים, בשעות הפעילות)
+        PRIMARY KEY (date, room)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS room_usage_hourly (
+        date    TEXT NOT NULL,
+        room    TEXT NOT NULL,
+        hour    INTEGER NOT NULL,       -- 8..19
+        weekday INTEGER NOT NULL,       -- 0=ראשון (נשמר כדי לא לחשב strftime בכל שאילתה)
+        minutes INTEGER NOT NULL,       -- 1..60
+        PRIMARY KEY (date, room, hour)
+    ) WITHOUT ROWID;
+    """)
+
+    # (תאריך, כיתה) שהשריונים שלהם השתנו מאז הריענון האחרון — ממולא ע"י triggers
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS room_usage_dirty (
+        date TEXT NOT NULL,
+        room TEXT NOT NULL,
+        PRIMARY KEY (date, room)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_usage_insert
+    AFTER INSERT ON reservations
+    BEGIN
+        INSERT OR IGNORE INTO room_usage_dirty (date, room) VALUES (NEW.date, NEW.room);
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_usage_update
+    AFTER UPDATE OF date, room, start_time, end_time, status ON reservations
+    BEGIN
+        INSERT OR IGNORE INTO room_usage_dirty (date, room) VALUES (OLD.date, OLD.room);
+        INSERT OR IGNORE INTO room_usage_dirty (date, room) VALUES (NEW.date, NEW.room);
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_reservations_usage_delete
+    AFTER DELETE ON reservations
+    BEGIN
+        INSERT OR IGNORE INTO room_usage_dirty (date, room) VALUES (OLD.date, OLD.room);
+    END;
+    """)
+
+    # היסטוריה קיימת: הכל מסומן, והחישוב נעשה בהדרגה בריענון הראשון
+    cur.execute("""
+    INSERT OR IGNORE INTO room_usage_dirty (date, room)
+    SELECT DISTINCT date, room FROM reservations
+    """)
+
+
+def _m005_report_status_log(cur) -> None:
+    # יומן מעברי סטטוס (append-only). נכתב ע"י triggers — כלומר תמיד באותה
+    # טרנזקציה של ה-INSERT/UPDATE על reports, לא משנה מי עדכן.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS report_status_log (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        report_id  INTEGER NOT NULL,
+        old_status TEXT,                -- NULL = יצירת הדיווח
+        new_status TEXT NOT NULL,
+        changed_at TEXT NOT NULL        -- UTC, 'YYYY-MM-DD HH:MM:SS'
+    );
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS idx_report_status_log_report
+    ON report_status_log (report_id, id);
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_reports_status_log_insert
+    AFTER INSERT ON reports
+    BEGIN
+        INSERT INTO report_status_log (report_id, old_status, new_status, changed_at)
+        VALUES (NEW.id, NULL, NEW.status, COALESCE(NEW.created_at, datetime('now')));
+    END;
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_reports_status_log_update
+    AFTER UPDATE OF status ON reports
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        INSERT INTO report_status_log (report_id, old_status, new_status, changed_at)
+        VALUES (NEW.id, OLD.status, NEW.status, datetime('now'));
+    END;
+    """)
+
+    # KPI יומיים לכל (יום מקומי, כיתה, קטגוריה) — מתעדכנים מהיומן לפי watermark
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS report_kpi_daily (
+        day            TEXT NOT NULL,   -- תאריך מקומי (Asia/Jerusalem)
+        room           TEXT NOT NULL,
+        category_user  TEXT NOT NULL,
+        opened         INTEGER NOT NULL DEFAULT 0,
+        started        INTEGER NOT NULL DEFAULT 0,   -- -> in_progress
+        resolved       INTEGER NOT NULL DEFAULT 0,   -- -> done
+        reopened       INTEGER NOT NULL DEFAULT 0,   -- done -> open/in_progress
+        resolve_seconds REAL NOT NULL DEFAULT 0,     -- סכום זמני הטיפול (לממוצע)
+        resolve_hist   TEXT NOT NULL DEFAULT '[]',   -- היסטוגרמה (ל-p90)
+        PRIMARY KEY (day, room, category_user)
+    ) WITHOUT ROWID;
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_watermarks (
+        name    TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    cur.execute("INSERT OR IGNORE INTO rollup_watermarks (name) VALUES ('report_kpi')")
+
+    # היסטוריה קיימת: פתיחה לפי created_at; סגירה לפי closed_at של הקבוצה,
+    # ואם לא ידוע מתי נסגר — באותו זמן כמו הפתיחה (נספר כטופל, בלי זמן טיפול)
+    cur.execute("""
+    INSERT INTO report_status_log (report_id, old_status, new_status, changed_at)
+    SELECT id, NULL, 'open', COALESCE(created_at, datetime('now'))
+    FROM reports
+    WHERE NOT EXISTS (SELECT 1 FROM report_status_log l WHERE l.report_id = reports.id)
+    ORDER BY id
+    """)
+    cur.execute("""
+    INSERT INTO report_status_log (report_id, old_status, new_status, changed_at)
+    SELECT r.id, 'open', 'done', COALESCE(g.closed_at, r.created_at, datetime('now'))
+    FROM reports r
+    LEFT JOIN report_groups g ON g.id = r.group_id
+    WHERE r.status = 'done'
+    ORDER BY r.id
+    """)
+
+
+def _m006_report_versions(cur) -> None:
+    # מוני גרסה גם לדיווחים (ETag של /api/v1/reports/groups), כמו ב-baseline
+    for table in ("reports", "report_groups"):
+        cur.execute("INSERT OR IGNORE INTO data_versions (name) VALUES (?)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = '{table}';
+            END;
+            """)
+
+
+def _m007_drop_group_bucket(cur) -> None:
+    # הקיבוץ עבר ל-report_groups (חלון נע); ה-bucket השעתי הישן לא נקרא משום מקום
+    cols = [row[1] for row in cur.execute("PRAGMA table_info(reports)")]
+    # DROP COLUMN קיים מ-SQLite 3.35; בגרסה ישנה יותר העמודה פשוט נשארת (לא בשימוש)
+    if "group_bucket" in cols and sqlite3.sqlite_version_info >= (3, 35):
+        cur.execute("DROP INDEX IF EXISTS idx_reports_group")
+        cur.execute("ALTER TABLE reports DROP COLUMN group_bucket")
+
+
+def _m008_kpi_timed_resolutions(cur) -> None:
+    # timed=0: סגירה שזמנה לא ידוע (השלמת היסטוריה ב-5, changed_at = created_at).
+    # עד עכשיו זוהו לפי 0 שניות, ולכן גם טיפול אמיתי של 0 שניות נזרק מההיסטוגרמה.
+    cols = [row[1] for row in cur.execute("PRAGMA table_info(report_status_log)")]
+    if "timed" not in cols:
+        cur.execute("ALTER TABLE report_status_log ADD COLUMN timed INTEGER NOT NULL DEFAULT 1")
+    cur.execute("""
+    UPDATE report_status_log
+    SET timed = 0
+    WHERE old_status = 'open' AND new_status = 'done'
+      AND changed_at = (SELECT created_at FROM reports r WHERE r.id = report_status_log.report_id)
+    """)
+    # resolve_hist עובר לפורמט [count, min, max] לכל דלי -> בונים מחדש מהיומן
+    cur.execute("DELETE FROM report_kpi_daily")
+    cur.execute("UPDATE rollup_watermarks SET last_id = 0 WHERE name = 'report_kpi'")
+
+
+# (גרסה, תיאור, פונקציה) — רק מוסיפים בסוף, לא משנים צעד שכבר שוחרר
+MIGRATIONS = [
+    (1, "baseline schema", _m001_baseline),
+    (2, "hot-path indexes for reservations and reports", _m002_hot_path_indexes),
+    (3, "covering index for home page reservations", _m003_home_covering_indexes),
+    (4, "materialized room usage rollups", _m004_usage_rollups),
+    (5, "report status log and daily KPI rollups", _m005_report_status_log),
+    (6, "version counters for reports", _m006_report_versions),
+    (7, "drop unused reports.group_bucket", _m007_drop_group_bucket),
+    (8, "count zero-second resolutions in KPI histograms", _m008_kpi_timed_resolutions),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(conn, target: int = LATEST_VERSION) -> list[int]:
+    """מריץ את כל הצעדים שחסרים עד target. מחזיר את הגרסאות שהורצו."""
+    applied = []
+    for version, _, step in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # בדיקה שוב בתוך הנעילה: אולי worker אחר כבר הריץ
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="show current and latest schema version")
+    up = sub.add_parser("upgrade", help="apply pending migrations")
+    up.add_argument("--to", type=int, default=LATEST_VERSION, help="target version")
+    up.add_argument("--no-rollups", action="store_true",
+                    help="skip filling analytics rollups after upgrading")
+    args = parser.parse_args()
+
+    conn = db.get_connection()
+    if args.command == "status":
+        version = current_version(conn)
+        print(f"database: {db.DB_PATH}")
+        print(f"schema version: {version} (latest {LATEST_VERSION})")
+        for v, description, _ in MIGRATIONS:
+            print(f"  [{'x' if v <= version else ' '}] {v}: {description}")
+    elif args.command == "upgrade":
+        applied = upgrade(conn, args.to)
+        print(f"applied: {applied or 'nothing'} -> version {current_version(conn)}")
+        if not args.no_rollups and current_version(conn) >= LATEST_VERSION:
+            # מיגרציה שממלאת backlog (4, 5, 8) -> משלימים כאן ולא ב-request הראשון
+            print(f"rollups refreshed: {db.refresh_rollups()}")
+    db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 # seed.py
-from db import get_connection, init_db
+from db import get_connection, close_connection, init_db
 
 ALLOWED = [
     ("123456789", "שילת כהן", "student"),
@@ -87,7 +87,7 @@ def seed_all() -> None:
     """, WEEKLY_SCHEDULE)
 
     conn.commit()
-    conn.close()
+    close_connection()
 
 if __name__ == "__main__":
     seed_all()
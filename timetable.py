@@ -0,0 +1,301 @@
+# timetable.py
+"""
+שיבוץ כיתות לסמסטר (weekly_schedule) בבת אחת.
+
+קלט: רשימת דרישות קורס — משך, חלונות זמן אפשריים (יום בשבוע + שעות)
+ודרישות מהכיתה (מקומות / מקרן / עמדות / סוג), וקטלוג הכיתות.
+פלט: שיבוץ בלי התנגשויות שממקסם את מספר הקורסים המשובצים
+וממזער מקומות מבוזבזים.
+
+אלגוריתם (greedy + local search):
+1. greedy: הדרישות הקשות קודם (הכי מעט כיתות מתאימות, חלונות צרים, משך ארוך),
+   כל אחת לכיתה הקטנה ביותר שמתאימה (catalog.best_fit_key) ובזמן המוקדם שפנוי.
+2. repair: דרישה שלא שובצה — מחפשים מקום שחוסם אותו שיבוץ אחד בלבד,
+   ומנסים להעביר את החוסם למקום אחר.
+3. compaction: שיבוץ בכיתה גדולה מהנדרש עובר לכיתה מתאימה יותר אם יש בה מקום.
+
+התפוסה נשמרת כ-bitmap של דקות לכל (כיתה, יום) — כמו ב-availability,
+כך ש"איפה יש רצף פנוי של k דקות" הוא כמה פעולות על int.
+
+    python timetable.py plan demands.json
+    python timetable.py plan demands.json --apply [--replace]
+"""
+import argparse
+import json
+import time
+from typing import NamedTuple
+
+import availability
+import catalog
+import db
+
+STEP_MINUTES = 30               # רזולוציית שעת התחלה
+MAX_REPAIR_MOVES = 50           # ניסיונות הזזה לכל דרישה שלא שובצה
+
+
+class CourseDemand(NamedTuple):
+    title: str
+    duration: int                                   # דקות
+    windows: tuple[tuple[int, int, int], ...]       # (weekday, start_min, end_min)
+    requirements: catalog.RoomRequirements = catalog.RoomRequirements()
+
+
+class Placement(NamedTuple):
+    demand: int         # אינדקס ברשימת הדרישות
+    room: str
+    weekday: int
+    start: int          # דקות מחצות
+    end: int
+
+
+class TimetableResult(NamedTuple):
+    placements: list[Placement]
+    unplaced: list[int]
+    wasted_seats: int
+    seconds: float
+
+    def schedule_rows(self, demands) -> list[tuple]:
+        """שורות ל-weekly_schedule: (room_code, weekday, start, end, title)."""
+        return [
+            (p.room, p.weekday, availability.to_hhmm(p.start), availability.to_hhmm(p.end),
+             demands[p.demand].title)
+            for p in sorted(self.placements, key=lambda p: (p.room, p.weekday, p.start))
+        ]
+
+
+def demand_from_dict(d: dict) -> CourseDemand:
+    """
+    {"title": ..., "duration": 90,
+     "windows": [{"weekday": 0, "start": "08:00", "end": "14:00"}, ...],
+     "min_seats": 40, "projector": true, "min_stations": null, "room_type": null}
+    """
+    windows = tuple(
+        (int(w["weekday"]), availability.to_min(w["start"]), availability.to_min(w["end"]))
+        for w in d["windows"]
+    )
+    if not windows or any(not 0 <= wd <= 6 or e <= s for wd, s, e in windows):
+        raise ValueError(f"Invalid windows for {d.get('title')!r}")
+    duration = int(d["duration"])
+    if duration <= 0:
+        raise ValueError(f"Invalid duration for {d.get('title')!r}")
+
+    return CourseDemand(
+        title=d.get("title") or "",
+        duration=duration,
+        windows=windows,
+        requirements=catalog.RoomRequirements(
+            min_seats=d.get("min_seats"),
+            projector=bool(d.get("projector")),
+            min_stations=d.get("min_stations"),
+            room_type=d.get("room_type"),
+        ),
+    )
+
+
+class Timetabler:
+    """
+    rooms: dict לכל כיתה (כמו catalog.RoomCatalog.rooms).
+    existing: [(room_code, weekday, start_min, end_min)] — תפוסה קבועה שלא זזה.
+    """
+
+    def __init__(self, rooms, demands, existing=(), step: int = STEP_MINUTES):
+        self.rooms = {r["code"]: r for r in rooms}
+        self.demands = list(demands)
+        self.step = step
+
+        self.fixed = {}         # (code, weekday) -> mask של תפוסה קיימת
+        for code, weekday, s, e in existing:
+            key = (code, weekday)
+            self.fixed[key] = self.fixed.get(key, 0) | availability.interval_mask(s, e)
+        self.busy = dict(self.fixed)     # fixed + השיבוצים שלנו
+        self.placed = {}                 # demand -> Placement
+        self.by_slot = {}                # (code, weekday) -> {demand}
+
+        # כיתות מתאימות לכל דרישה, ממוינות לפי התאמה; מחושב פעם אחת לכל סט דרישות
+        by_req = {}
+        for d in self.demands:
+            if d.requirements not in by_req:
+                by_req[d.requirements] = sorted(
+                    (catalog.best_fit_key(room, d.requirements), code)
+                    for code, room in self.rooms.items()
+                    if catalog.room_matches(room, d.requirements)
+                )
+        self.candidates = [by_req[d.requirements] for d in self.demands]
+        self._starts_cache = {}
+
+    # -------------------------
+    # Bitmaps
+    # -------------------------
+    def _starts_mask(self, start: int, end: int, duration: int) -> int:
+        """ביטים של שעות התחלה מותרות (כל step דקות מתחילת החלון)."""
+        key = (start, end, duration)
+        mask = self._starts_cache.get(key)
+        if mask is None:
+            mask = 0
+            for s in range(max(start, availability.OPEN_MIN),
+                           min(end, availability.CLOSE_MIN) - duration + 1, self.step):
+                mask |= 1 << (s - availability.OPEN_MIN)
+            self._starts_cache[key] = mask
+        return mask
+
+    def _first_fit(self, code: str, demand: CourseDemand):
+        """(weekday, start) המוקדם ביותר שבו יש רצף פנוי בכיתה, או None."""
+        for weekday, ws, we in demand.windows:
+            free = ~self.busy.get((code, weekday), 0) & availability.interval_mask(ws, we)
+            starts = availability.min_run_mask(free, demand.duration) & self._starts_mask(ws, we, demand.duration)
+            if starts:
+                low = (starts & -starts).bit_length() - 1
+                return weekday, availability.OPEN_MIN + low
+        return None
+
+    def _find(self, i: int, better_than=None):
+        """(code, weekday, start) בכיתה הכי מתאימה שיש בה מקום (ורק טובה מ-better_than)."""
+        demand = self.demands[i]
+        for key, code in self.candidates[i]:
+            if better_than is not None and key >= better_than:
+                return None
+            fit = self._first_fit(code, demand)
+            if fit is not None:
+                return code, fit[0], fit[1]
+        return None
+
+    def _place(self, i: int, code: str, weekday: int, start: int) -> None:
+        end = start + self.demands[i].duration
+        key = (code, weekday)
+        self.busy[key] = self.busy.get(key, 0) | availability.interval_mask(start, end)
+        self.placed[i] = Placement(i, code, weekday, start, end)
+        self.by_slot.setdefault(key, set()).add(i)
+
+    def _remove(self, i: int) -> Placement:
+        p = self.placed.pop(i)
+        key = (p.room, p.weekday)
+        self.busy[key] &= ~availability.interval_mask(p.start, p.end)
+        self.by_slot[key].discard(i)
+        return p
+
+    # -------------------------
+    # Phases
+    # -------------------------
+    def _greedy(self) -> None:
+        order = sorted(
+            range(len(self.demands)),
+            key=lambda i: (
+                len(self.candidates[i]),
+                sum(e - s for _, s, e in self.demands[i].windows),
+                -self.demands[i].duration,
+            ),
+        )
+        for i in order:
+            spot = self._find(i)
+            if spot is not None:
+                self._place(i, *spot)
+
+    def _repair(self, i: int) -> bool:
+        """שיבוץ i ע"י הזזת שיבוץ חוסם יחיד למקום אחר."""
+        demand = self.demands[i]
+        moves = 0
+        for _, code in self.candidates[i]:
+            for weekday, ws, we in demand.windows:
+                key = (code, weekday)
+                fixed = self.fixed.get(key, 0)
+                for start in range(max(ws, availability.OPEN_MIN),
+                                   min(we, availability.CLOSE_MIN) - demand.duration + 1, self.step):
+                    end = start + demand.duration
+                    if fixed & availability.interval_mask(start, end):
+                        continue
+                    blockers = [
+                        j for j in self.by_slot.get(key, ())
+                        if self.placed[j].start < end and self.placed[j].end > start
+                    ]
+                    if len(blockers) != 1:
+                        continue
+
+                    moves += 1
+                    old = self._remove(blockers[0])
+                    self._place(i, code, weekday, start)
+                    spot = self._find(old.demand)
+                    if spot is not None:
+                        self._place(old.demand, *spot)
+                        return True
+                    self._remove(i)
+                    self._place(old.demand, old.room, old.weekday, old.start)
+                    if moves >= MAX_REPAIR_MOVES:
+                        return False
+        return False
+
+    def _compact(self) -> None:
+        for i in sorted(self.placed, key=lambda i: -self._waste(self.placed[i])):
+            p = self.placed[i]
+            current = catalog.best_fit_key(self.rooms[p.room], self.demands[i].requirements)
+            self._remove(i)
+            spot = self._find(i, better_than=current)
+            if spot is not None:
+                self._place(i, *spot)
+            else:
+                self._place(i, p.room, p.weekday, p.start)
+
+    def _waste(self, p: Placement) -> int:
+        need = self.demands[p.demand].requirements.min_seats
+        if not need:
+            return 0
+        return max(0, catalog.room_capacity(self.rooms[p.room]) - need)
+
+    def solve(self) -> TimetableResult:
+        t0 = time.perf_counter()
+        self._greedy()
+        for i in range(len(self.demands)):
+            if i not in self.placed and self.candidates[i]:
+                self._repair(i)
+        self._compact()
+
+        placements = sorted(self.placed.values())
+        return TimetableResult(
+            placements=placements,
+            unplaced=[i for i in range(len(self.demands)) if i not in self.placed],
+            wasted_seats=sum(self._waste(p) for p in placements),
+            seconds=time.perf_counter() - t0,
+        )
+
+
+def plan(demands, replace: bool = False) -> TimetableResult:
+    """שיבוץ מול הקטלוג וה-weekly_schedule הנוכחיים (replace=True: מתעלם מהקיים)."""
+    existing = [] if replace else [
+        (r["room_code"], r["weekday"], availability.to_min(r["start_time"]), availability.to_min(r["end_time"]))
+        for r in db.get_weekly_schedule()
+    ]
+    return Timetabler(db.get_active_rooms(), demands, existing).solve()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Semester room assignment")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    plan_p = sub.add_parser("plan", help="assign rooms to a JSON list of course demands")
+    plan_p.add_argument("demands", help="JSON file: [{title, duration, windows, min_seats, ...}]")
+    plan_p.add_argument("--apply", action="store_true", help="write the result to weekly_schedule")
+    plan_p.add_argument("--replace", action="store_true",
+                        help="replace the whole weekly_schedule instead of adding to it")
+
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        with open(args.demands, encoding="utf-8") as f:
+            demands = [demand_from_dict(d) for d in json.load(f)]
+
+        result = plan(demands, replace=args.replace)
+        print(json.dumps({
+            "demands": len(demands),
+            "placed": len(result.placements),
+            "unplaced": [demands[i].title for i in result.unplaced],
+            "wasted_seats": result.wasted_seats,
+            "seconds": round(result.seconds, 3),
+        }, ensure_ascii=False, indent=2))
+
+        if args.apply:
+            written = db.add_weekly_schedule_bulk(result.schedule_rows(demands), replace=args.replace)
+            print(f"Wrote {written} rows to weekly_schedule")
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,809 @@
+# triage.py
+"""
+טריאז' AI לדיווחי תקלות.
+
+- TriageWorkerPool: תור רקע (הנתיב היחיד לסיווג). הדיווח נשמר מיד עם דירוג fallback,
+  והסיווג רץ ב-threads ברקע מול טבלת triage_jobs (עמידה לריסטארט),
+  עם retry + backoff וסטטיסטיקות עומק תור / latency.
+- breaker: circuit breaker סביב הקריאות ל-OpenAI (timeout אדפטיבי + p50/p95/p99).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+
+import db
+
+# ------------------- AI TRIAGE -------------------
+
+CATEGORY_TO_RANK = {
+    "מקרן": 1,
+    "מחשב": 2,
+    "תאורה": 3,
+    "מיזוג": 4,
+    "אחר": 5
+}
+
+FALLBACK_RATIONALE = "סווג אוטומטית לפי הקטגוריה (fallback)."
+
+MODEL = "gpt-4.1-mini"
+REQUEST_TIMEOUT = 15
+
+_JSON_SCHEMA = {
+    "name": "fault_triage",
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "severity_rank": {"type": "integer", "minimum": 1, "maximum": 5},
+            "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+            "rationale": {"type": "string", "maxLength": 220}
+        },
+        "required": ["severity_rank", "confidence", "rationale"]
+    }
+}
+
+# אותו מבנה, כמערך: תשובה אחת לכמה דיווחים (לפי report_id)
+_BATCH_JSON_SCHEMA = {
+    "name": "fault_triage_batch",
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "additionalProperties": False,
+                    "properties": {
+                        "report_id": {"type": "integer"},
+                        **_JSON_SCHEMA["schema"]["properties"],
+                    },
+                    "required": ["report_id", *_JSON_SCHEMA["schema"]["required"]],
+                },
+            }
+        },
+        "required": ["results"]
+    }
+}
+
+# נוצר בפעם הראשונה שצריך אותו (אפשר להחליף ב-fake בבדיקות: triage.client = ...)
+client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    ה-SDK קורא גם OPENAI_BASE_URL, כך שאפשר להפנות את הקריאות לשרת stub מקומי.
+    """
+    global client
+    with _client_lock:
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        return client
+
+
+# ------------------- CIRCUIT BREAKER -------------------
+
+class CircuitOpenError(RuntimeError):
+    """ה-breaker פתוח: לא פונים ל-OpenAI עד retry_at."""
+
+    def __init__(self, retry_at: float):
+        super().__init__("OpenAI circuit is open")
+        self.retry_at = retry_at
+
+
+class CircuitBreaker:
+    """
+    closed -> open אחרי failure_threshold כישלונות/timeouts רצופים.
+    open: כל קריאה נכשלת מיד (CircuitOpenError) -> fallback בלי לחכות ל-timeout.
+    אחרי cooldown -> half_open: עד half_open_max קריאות ניסיון;
+    הצלחה סוגרת, כישלון פותח שוב.
+
+    כל מעבר מצב מקדם את _generation; קריאה זוכרת את הדור שבו התחילה,
+    ותוצאה של דור קודם (קריאה איטית שהסתיימה אחרי מעבר) נספרת בסטטיסטיקה
+    אבל לא משנה את המצב — כך היא לא פותחת/סוגרת מחדש סביב ניסיון half_open.
+
+    בנוסף שומר latency/שגיאות של הקריאות האחרונות, ומחשב timeout לפי
+    ה-p99 הנצפה (timeout_factor * p99), בגבולות min_timeout..max_timeout.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        half_open_max: int = 1,
+        window: int = 200,
+        min_timeout: float = 3.0,
+        max_timeout: float = REQUEST_TIMEOUT,
+        timeout_factor: float = 2.0,
+        min_samples: int = 20,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.half_open_max = half_open_max
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.min_samples = min_samples
+
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._generation = 0
+
+        self._latency = deque(maxlen=window)   # קריאות מוצלחות בלבד (שניות)
+        self._outcomes = deque(maxlen=window)  # True=הצלחה
+        self._calls = 0
+        self._failures = 0
+        self._timeouts = 0
+        self._short_circuited = 0
+        self._opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+            self._set_state("half_open")
+            self._trials = 0
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        """נקרא תחת lock."""
+        self._state = state
+        self._generation += 1
+
+    def _retry_at(self) -> float:
+        """
+        זמן (time.time) שכדאי לנסות שוב. נקרא תחת lock.
+        half_open עם ניסיון שעדיין רץ: עוד cooldown — אחרת ה-workers
+        דוחים ל"עכשיו" ותופסים את העבודה שוב בלולאה עד שהניסיון מסתיים.
+        """
+        if self._state == "closed":
+            return time.time()
+        if self._state == "half_open":
+            return time.time() + self.cooldown
+        return time.time() + max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def timeout(self) -> float:
+        with self._lock:
+            if len(self._latency) < self.min_samples:
+                return self.max_timeout
+            p99 = _percentile(sorted(self._latency), 99)
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_factor))
+
+    def call(self, fn, *args, **kwargs):
+        """מריץ fn(*args, timeout=..., **kwargs) דרך ה-breaker."""
+        with self._lock:
+            state = self._current_state()
+            if state == "open" or (state == "half_open" and self._trials >= self.half_open_max):
+                self._short_circuited += 1
+                raise CircuitOpenError(self._retry_at())
+            if state == "half_open":
+                self._trials += 1
+            generation = self._generation
+
+        t0 = time.monotonic()
+        try:
+            result = fn(*args, timeout=self.timeout(), **kwargs)
+        except Exception as e:
+            self._record_failure(e, generation)
+            raise
+        self._record_success(time.monotonic() - t0, generation)
+        return result
+
+    def _record_success(self, elapsed: float, generation: int) -> None:
+        with self._lock:
+            self._calls += 1
+            self._latency.append(elapsed)
+            self._outcomes.append(True)
+            if generation != self._generation:
+                return      # התחילה לפני מעבר מצב — לא סוגרת מעגל שנפתח אחריה
+            self._consecutive_failures = 0
+            if self._state != "closed":
+                self._set_state("closed")
+
+    def _record_failure(self, error: Exception, generation: int) -> None:
+        with self._lock:
+            self._calls += 1
+            self._failures += 1
+            if "timeout" in type(error).__name__.lower():
+                self._timeouts += 1
+            self._outcomes.append(False)
+            if generation != self._generation:
+                return      # התחילה לפני מעבר מצב — לא מאריכה cooldown ולא מפילה ניסיון half_open
+            self._consecutive_failures += 1
+            if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                self._opened += 1
+                self._set_state("open")
+                self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._set_state("closed")
+            self._consecutive_failures = 0
+            self._trials = 0
+
+    def stats(self) -> dict:
+        timeout = self.timeout()
+        with self._lock:
+            lat = sorted(self._latency)
+            outcomes = list(self._outcomes)
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._consecutive_failures,
+                "calls": self._calls,
+                "failures": self._failures,
+                "timeouts": self._timeouts,
+                "short_circuited": self._short_circuited,
+                "times_opened": self._opened,
+                "error_rate": (outcomes.count(False) / len(outcomes)) if outcomes else None,
+                "timeout_s": timeout,
+                "latency_s": {
+                    "p50": _percentile(lat, 50),
+                    "p95": _percentile(lat, 95),
+                    "p99": _percentile(lat, 99),
+                    "samples": len(lat),
+                },
+            }
+
+
+def _percentile(sorted_values: list, p: float) -> float | None:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+# משותף לכל הקריאות בתהליך (app.py יכול להחליף עם הגדרות מה-env)
+breaker = CircuitBreaker()
+
+
+def fallback_triage(category_user: str) -> dict:
+    # fallback: לפי הבחירה מה-dropdown
+    return {
+        "severity_rank": CATEGORY_TO_RANK.get(category_user, 5),
+        "confidence": 0.0,
+        "rationale": FALLBACK_RATIONALE,
+    }
+
+
+def _build_prompt(category_user: str, room: str, description: str) -> str:
+    return f"""
+את סוכנת טריאז' לתקלות בכיתות.
+סולם חומרה (1 הכי חמור, 5 הכי פחות חמור) לפי קטגוריה:
+מקרן=1, מחשב=2, תאורה=3, מיזוג=4, אחר=5.
+
+כללים:
+- ברירת מחדל: דירוג לפי הקטגוריה שנבחרה.
+- מותר לשנות לכל היותר בדרגה אחת (±1) אם התיאור מצביע על השפעה חריגה.
+- לעולם לא לצאת מהטווח 1..5.
+
+דיווח:
+קטגוריה: {category_user}
+כיתה: {room}
+תיאור: {description}
+
+החזירי JSON בלבד.
+""".strip()
+
+
+def _parse_result(data: dict, fallback_rank: int) -> dict:
+    rank = int(data.get("severity_rank", fallback_rank))
+    if rank < 1 or rank > 5:
+        rank = fallback_rank
+
+    conf = float(data.get("confidence", 0.5))
+    if conf < 0 or conf > 1:
+        conf = 0.5
+
+    rationale = str(data.get("rationale", "")).strip()
+    if not rationale:
+        rationale = "סווג לפי הקטגוריה שנבחרה."
+
+    return {"severity_rank": rank, "confidence": conf, "rationale": rationale}
+
+
+def request_triage(category_user: str, room: str, description: str, client=None) -> dict:
+    """
+    קריאה אחת למודל. זורק חריגה בכישלון (ה-worker מחליט אם לנסות שוב),
+    כולל CircuitOpenError מיידית כשה-breaker פתוח.
+    """
+    fallback_rank = CATEGORY_TO_RANK.get(category_user, 5)
+
+    resp = breaker.call(
+        (client or get_client()).responses.create,
+        model=MODEL,
+        input=_build_prompt(category_user, room, description),
+        temperature=0,
+        text={"format": {"type": "json_schema", "json_schema": _JSON_SCHEMA}},
+    )
+
+    data = json.loads(resp.output_text)
+    return _parse_result(data, fallback_rank)
+
+
+def _build_batch_prompt(items: list[dict]) -> str:
+    reports = "\n\n".join(
+        f"""report_id: {it["report_id"]}
+קטגוריה: {it["category_user"]}
+כיתה: {it["room"]}
+תיאור: {it["description"]}"""
+        for it in items
+    )
+    return f"""
+את סוכנת טריאז' לתקלות בכיתות.
+סולם חומרה (1 הכי חמור, 5 הכי פחות חמור) לפי קטגוריה:
+מקרן=1, מחשב=2, תאורה=3, מיזוג=4, אחר=5.
+
+כללים:
+- ברירת מחדל: דירוג לפי הקטגוריה שנבחרה.
+- מותר לשנות לכל היותר בדרגה אחת (±1) אם התיאור מצביע על השפעה חריגה.
+- לעולם לא לצאת מהטווח 1..5.
+- יש להחזיר תוצאה אחת לכל דיווח, עם אותו report_id.
+
+דיווחים:
+{reports}
+
+החזירי JSON בלבד.
+""".strip()
+
+
+def request_triage_batch(items: list[dict], client=None) -> dict[int, dict]:
+    """
+    קריאה אחת למודל עבור כמה דיווחים.
+    items: [{"report_id", "category_user", "room", "description"}, ...]
+    מחזיר {report_id: result} רק לדיווחים שקיבלו תשובה תקינה —
+    מי שחסר בתשובה צריך לקבל fallback אצל הקורא.
+    זורק חריגה אם הקריאה כולה נכשלה.
+    """
+    resp = breaker.call(
+        (client or get_client()).responses.create,
+        model=MODEL,
+        input=_build_batch_prompt(items),
+        temperature=0,
+        text={"format": {"type": "json_schema", "json_schema": _BATCH_JSON_SCHEMA}},
+    )
+
+    data = json.loads(resp.output_text)
+    by_id = {it["report_id"]: it for it in items}
+    results = {}
+    for entry in data.get("results", []):
+        try:
+            report_id = int(entry["report_id"])
+            item = by_id[report_id]
+            results[report_id] = _parse_result(entry, CATEGORY_TO_RANK.get(item["category_user"], 5))
+        except (KeyError, TypeError, ValueError):
+            continue  # פריט פגום -> fallback לפריט הזה בלבד
+    return results
+
+
+# ------------------- CACHE -------------------
+
+_NIQQUD_RE = re.compile(r"[\u0591-\u05C7]")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_text(text: str) -> str:
+    """
+    נרמול לצורך מפתח מטמון: בלי ניקוד/פיסוק, אותיות קטנות, רווחים מאוחדים.
+    "המקרן  לא עובד!!" ו-"המקרן לא עובד" -> אותו מפתח.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _NIQQUD_RE.sub("", text)
+    text = _PUNCT_RE.sub(" ", text.casefold())
+    return " ".join(text.split())
+
+
+class TriageCache:
+    """
+    מטמון תוצאות טריאז' לפי (קטגוריה, כיתה, תיאור) מנורמלים.
+    LRU חסום בזיכרון + TTL, ואופציונלית טבלת triage_cache ב-SQLite
+    כדי שתוצאות ישרדו ריסטארט (ויחולקו בין workers).
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600.0, persistent: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persistent = persistent
+
+        self._items = OrderedDict()     # key -> (stored_at, result)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def make_key(category_user: str, room: str, description: str) -> str:
+        raw = "|".join((
+            normalize_text(category_user),
+            " ".join((room or "").split()).casefold(),
+            normalize_text(description),
+        ))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                stored_at, result = item
+                if now - stored_at <= self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return dict(result)
+                del self._items[key]
+                self.expired += 1
+
+        if self.persistent:
+            row = db.get_cached_triage(key, now - self.ttl)
+            if row is not None:
+                result = {
+                    "severity_rank": row["severity_rank"],
+                    "confidence": row["confidence"],
+                    "rationale": row["rationale"],
+                }
+                self._remember(key, row["created_at"], result)
+                with self._lock:
+                    self.hits += 1
+                    self.persistent_hits += 1
+                return dict(result)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, result: dict) -> None:
+        now = time.time()
+        self._remember(key, now, result)
+        if self.persistent:
+            db.put_cached_triage(
+                key, result["severity_rank"], result["confidence"], result["rationale"], now
+            )
+
+    def _remember(self, key: str, stored_at: float, result: dict) -> None:
+        with self._lock:
+            self._items[key] = (stored_at, dict(result))
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+                "persistent": self.persistent,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else None,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+# ------------------- BACKGROUND QUEUE -------------------
+
+class TriageWorkerPool:
+    """
+    מאגר threads שמעבד את triage_jobs.
+    התור עצמו ב-SQLite (triage_jobs), כך שעבודות שלא הסתיימו לא הולכות לאיבוד
+    בריסטארט, וכמה workers של gunicorn יכולים לחלוק אותו (claim אטומי).
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: int = 500,
+        max_attempts: int = 4,
+        backoff_base: float = 2.0,
+        backoff_max: float = 300.0,
+        poll_interval: float = 5.0,
+        stale_after: float = 120.0,
+        client=None,
+        cache: TriageCache | None = None,
+        batch_size: int = 1,
+        batch_window: float = 0.5,
+        local_model=None,
+        local_threshold: float = 0.85,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.client = client
+        self.cache = cache
+        # batch_size > 1: אוספים עד batch_size עבודות (או עד batch_window שניות)
+        # ושולחים אותן בבקשה אחת
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        # מודל מקומי (triage_model.LocalTriageModel): מעל הסף -> לא פונים ל-OpenAI בכלל
+        self.local_model = local_model
+        self.local_threshold = local_threshold
+
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        self._processed = 0
+        self._failed = 0
+        self._retried = 0
+        self._rejected = 0
+        self._batches = 0
+        self._batch_fallbacks = 0
+        self._fast_path = 0
+        self._escalated = 0
+        self._deferred = 0
+        self._queue_latency = deque(maxlen=500)    # enqueue -> done (שניות)
+        self._call_latency = deque(maxlen=500)     # זמן קריאה למודל (שניות)
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            db.requeue_stale_triage_jobs(self.stale_after)
+            if self.cache is not None and self.cache.persistent:
+                db.prune_triage_cache(time.time() - self.cache.ttl)
+            self._threads = [
+                threading.Thread(target=self._run, name=f"triage-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # -------------------------
+    # Producer side
+    # -------------------------
+    def local_triage(self, category_user: str, description: str) -> dict | None:
+        """
+        סיווג מקומי מיידי. מחזיר תוצאה אם המודל בטוח מספיק,
+        אחרת None (והדיווח צריך לעבור ל-submit).
+        """
+        if self.local_model is None:
+            return None
+
+        rank, conf = self.local_model.predict(category_user, description)
+        with self._lock:
+            if conf < self.local_threshold:
+                self._escalated += 1
+                return None
+            self._fast_path += 1
+
+        from triage_model import LOCAL_RATIONALE
+        return {"severity_rank": rank, "confidence": conf, "rationale": LOCAL_RATIONALE}
+
+    def submit(self, report_id: int) -> bool:
+        """
+        מכניס עבודת טריאז' לתור. מחזיר False אם התור מלא
+        (הדיווח נשאר עם דירוג ה-fallback).
+        """
+        # גם כשהתור מלא — ה-workers חייבים לרוץ, אחרת הוא לא יתרוקן לעולם
+        self.start()
+        if db.count_pending_triage_jobs() >= self.max_pending:
+            with self._lock:
+                self._rejected += 1
+            return False
+
+        db.enqueue_triage_job(report_id)
+        self._wake.set()
+        return True
+
+    # -------------------------
+    # Worker side
+    # -------------------------
+    def _run(self) -> None:
+        next_stale_check = time.monotonic() + self.stale_after
+        try:
+            while not self._stop.is_set():
+                jobs = []
+                try:
+                    if time.monotonic() >= next_stale_check:
+                        # worker בתהליך אחר שנפל באמצע — העבודות שלו חוזרות לתור
+                        db.requeue_stale_triage_jobs(self.stale_after)
+                        next_stale_check = time.monotonic() + self.stale_after
+                    jobs = db.claim_triage_jobs(self.batch_size)
+                    if not jobs:
+                        self._wake.wait(self.poll_interval)
+                        self._wake.clear()
+                        continue
+                    if self.batch_size > 1:
+                        jobs += self._collect_more(self.batch_size - len(jobs))
+                    self._process(jobs)
+                except Exception as e:
+                    # שגיאה (למשל database is locked) לא הורגת את ה-worker
+                    print("AI triage worker error:", e)
+                    self._release(jobs, e)
+                    self._stop.wait(self.poll_interval)
+        finally:
+            db.close_connection()
+
+    def _release(self, jobs: list, error: Exception) -> None:
+        """עבודות שנשארו running אחרי שגיאה -> retry/failed (שכבר הושלמו לא נוגעים)."""
+        for job in jobs:
+            try:
+                self._retry_or_fail(job, error)
+            except Exception as e:
+                # יחזרו לתור ב-requeue_stale_triage_jobs
+                print(f"AI triage: could not release job {job['id']}:", e)
+
+    def _collect_more(self, limit: int) -> list:
+        """ממתין עד batch_window שניות לעוד עבודות כדי לאחד אותן לבקשה אחת."""
+        extra = []
+        deadline = time.monotonic() + self.batch_window
+        while len(extra) < limit and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wake.wait(min(remaining, 0.05))
+            self._wake.clear()
+            extra += db.claim_triage_jobs(limit - len(extra))
+        return extra
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+
+    def _process(self, jobs: list) -> None:
+        pending = []
+        for job in jobs:
+            key = None
+            if self.cache is not None:
+                key = self.cache.make_key(job["category_user"], job["room"], job["description"])
+                hit = self.cache.get(key)
+                if hit is not None:
+                    self._complete(job, hit)
+                    continue
+            pending.append((job, key))
+
+        if not pending:
+            return
+
+        t0 = time.monotonic()
+        try:
+            if len(pending) == 1:
+                job = pending[0][0]
+                results = {job["report_id"]: request_triage(
+                    job["category_user"], job["room"], job["description"], client=self.client
+                )}
+            else:
+                results = request_triage_batch(
+                    [
+                        {
+                            "report_id": job["report_id"],
+                            "category_user": job["category_user"],
+                            "room": job["room"],
+                            "description": job["description"],
+                        }
+                        for job, _ in pending
+                    ],
+                    client=self.client,
+                )
+        except CircuitOpenError as e:
+            # OpenAI לא זמין: לא שורפים ניסיון, רק דוחים עד שה-breaker ינסה שוב
+            deferred = sum(db.defer_triage_job(job["id"], e.retry_at) for job, _ in pending)
+            with self._lock:
+                self._deferred += deferred
+            return
+        except Exception as e:
+            for job, _ in pending:
+                self._retry_or_fail(job, e)
+            return
+
+        with self._lock:
+            self._call_latency.append(time.monotonic() - t0)
+            if len(pending) > 1:
+                self._batches += 1
+
+        for job, key in pending:
+            result = results.get(job["report_id"])
+            if result is None:
+                # כשל חלקי: רק הפריט הזה מקבל דירוג לפי קטגוריה
+                with self._lock:
+                    self._batch_fallbacks += 1
+                self._complete(job, fallback_triage(job["category_user"]))
+                continue
+            if self.cache is not None:
+                self.cache.put(key, result)
+            self._complete(job, result)
+
+    def _retry_or_fail(self, job, error: Exception) -> None:
+        if job["attempts"] >= self.max_attempts:
+            if db.fail_triage_job(job["id"], str(error)):
+                with self._lock:
+                    self._failed += 1
+                print(f"AI triage failed for report {job['report_id']} (giving up):", error)
+        elif db.retry_triage_job(job["id"], str(error), time.time() + self._backoff(job["attempts"])):
+            with self._lock:
+                self._retried += 1
+
+    def _complete(self, job, result: dict) -> None:
+        db.complete_triage_job(
+            job["id"],
+            job["report_id"],
+            severity_rank=result["severity_rank"],
+            ai_confidence=result["confidence"],
+            ai_rationale=result["rationale"],
+        )
+        with self._lock:
+            self._processed += 1
+            self._queue_latency.append(time.time() - job["enqueued_at"])
+
+    # -------------------------
+    # Stats
+    # -------------------------
+    def stats(self) -> dict:
+        counts = db.count_triage_jobs()
+        with self._lock:
+            queue_lat = sorted(self._queue_latency)
+            call_lat = sorted(self._call_latency)
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queue_depth": counts.get("queued", 0),
+                "in_progress": counts.get("running", 0),
+                "jobs_by_status": counts,
+                "processed": self._processed,
+                "failed": self._failed,
+                "retried": self._retried,
+                "rejected": self._rejected,
+                "deferred_circuit_open": self._deferred,
+                "batch_size": self.batch_size,
+                "batches": self._batches,
+                "batch_fallbacks": self._batch_fallbacks,
+                "local_model": self.local_model is not None,
+                "fast_path": self._fast_path,
+                "escalated": self._escalated,
+                "fast_path_rate": (
+                    self._fast_path / (self._fast_path + self._escalated)
+                    if self._fast_path + self._escalated else None
+                ),
+                "queue_latency_s": {
+                    "p50": _percentile(queue_lat, 50),
+                    "p95": _percentile(queue_lat, 95),
+                    "max": queue_lat[-1] if queue_lat else None,
+                },
+                "call_latency_s": {
+                    "p50": _percentile(call_lat, 50),
+                    "p95": _percentile(call_lat, 95),
+                    "max": call_lat[-1] if call_lat else None,
+                },
+            }
@@ -0,0 +1,204 @@
+# triage_model.py
+"""
+מסווג טריאז' מקומי (Naive Bayes על מילים מהתיאור + הקטגוריה שנבחרה).
+
+מאומן על דיווחים קודמים בטבלת reports (תיאור -> severity_rank שה-AI קבע),
+מחזיר דירוג + ביטחון במיקרו-שניות. רק מקרים בביטחון נמוך ממשיכים ל-OpenAI.
+
+אימון (offline):
+    python triage_model.py train
+    python triage_model.py train --out instance/triage_model.json --min-ai-confidence 0.5
+"""
+import argparse
+import json
+import math
+from collections import Counter
+from pathlib import Path
+
+import db
+from triage import normalize_text
+
+MODEL_PATH = Path("instance") / "triage_model.json"
+MODEL_VERSION = 1
+
+LOCAL_RATIONALE = "סווג מקומית לפי דיווחים דומים קודמים."
+
+
+def tokenize(category_user: str, description: str) -> list[str]:
+    words = normalize_text(description).split()
+    tokens = [f"cat:{normalize_text(category_user)}"]
+    tokens += words
+    tokens += [f"{a}_{b}" for a, b in zip(words, words[1:])]
+    return tokens
+
+
+class LocalTriageModel:
+    def __init__(self, classes: list[int], log_prior: dict, log_prob: dict, trained_on: int):
+        self.classes = classes
+        self.log_prior = log_prior          # rank -> log P(rank)
+        self.log_prob = log_prob            # token -> {rank: log P(token | rank)}
+        self.trained_on = trained_on
+
+    @classmethod
+    def train(cls, samples, alpha: float = 1.0) -> "LocalTriageModel":
+        """samples: [(category_user, description, severity_rank), ...]"""
+        class_counts = Counter()
+        token_counts = {}
+        vocab = set()
+
+        for category_user, description, rank in samples:
+            rank = int(rank)
+            class_counts[rank] += 1
+            counts = token_counts.setdefault(rank, Counter())
+            for tok in tokenize(category_user, description):
+                counts[tok] += 1
+                vocab.add(tok)
+
+        if not class_counts:
+            raise ValueError("No training samples")
+
+        total = sum(class_counts.values())
+        classes = sorted(class_counts)
+        log_prior = {c: math.log(class_counts[c] / total) for c in classes}
+
+        log_prob = {}
+        for c in classes:
+            counts = token_counts[c]
+            denom = sum(counts.values()) + alpha * len(vocab)
+            for tok in vocab:
+                log_prob.setdefault(tok, {})[c] = math.log((counts[tok] + alpha) / denom)
+
+        return cls(classes, log_prior, log_prob, trained_on=total)
+
+    def predict(self, category_user: str, description: str) -> tuple[int, float]:
+        """מחזיר (rank, confidence) — confidence = הסתברות ה-posterior של הדירוג שנבחר."""
+        scores = dict(self.log_prior)
+        for tok in tokenize(category_user, description):
+            probs = self.log_prob.get(tok)
+            if probs is None:
+                continue  # מילה שלא נראתה באימון לא משנה את ההשוואה
+            for c in self.classes:
+                scores[c] += probs[c]
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        norm = sum(math.exp(s - top) for s in scores.values())
+        return best, 1.0 / norm
+
+    # -------------------------
+    # Serialization
+    # -------------------------
+    def to_dict(self) -> dict:
+        return {
+            "version": MODEL_VERSION,
+            "classes": self.classes,
+            "log_prior": {str(c): v for c, v in self.log_prior.items()},
+            "log_prob": {
+                tok: {str(c): v for c, v in probs.items()} for tok, probs in self.log_prob.items()
+            },
+            "trained_on": self.trained_on,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LocalTriageModel":
+        if data.get("version") != MODEL_VERSION:
+            raise ValueError("Unsupported triage model version")
+        return cls(
+            classes=[int(c) for c in data["classes"]],
+            log_prior={int(c): v for c, v in data["log_prior"].items()},
+            log_prob={
+                tok: {int(c): v for c, v in probs.items()} for tok, probs in data["log_prob"].items()
+            },
+            trained_on=data["trained_on"],
+        )
+
+    def save(self, path=MODEL_PATH) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+
+def load_model(path=MODEL_PATH) -> LocalTriageModel | None:
+    """טוען מודל שמור; אם אין קובץ (עוד לא אומן) -> None."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        return LocalTriageModel.from_dict(json.loads(path.read_text(encoding="utf-8")))
+    except (OSError, ValueError, KeyError) as e:
+        print("Local triage model not loaded:", e)
+        return None
+
+
+# -------------------------
+# Offline training
+# -------------------------
+def training_samples(min_ai_confidence: float = 0.5) -> list[tuple[str, str, int]]:
+    """
+    דיווחים שה-AI סיווג בביטחון מספיק (דיווחי fallback עם confidence=0 לא נכנסים,
+    אחרת המודל רק היה לומד את טבלת הקטגוריות). גם דיווחים שהמודל עצמו סיווג לא נכנסים.
+    """
+    conn = db.get_connection()
+    rows = conn.execute("""
+        SELECT category_user, description, severity_rank
+        FROM reports
+        WHERE severity_rank IS NOT NULL
+          AND ai_confidence >= ?
+          AND ai_rationale IS NOT ?
+        ORDER BY id
+    """, (min_ai_confidence, LOCAL_RATIONALE)).fetchall()
+    return [(r["category_user"], r["description"], r["severity_rank"]) for r in rows]
+
+
+def evaluate(samples, threshold: float, holdout_every: int = 5) -> dict:
+    """הערכה פשוטה: כל דיווח חמישי בצד, אימון על השאר."""
+    train = [s for i, s in enumerate(samples) if i % holdout_every]
+    test = [s for i, s in enumerate(samples) if not i % holdout_every]
+    if not train or not test:
+        return {}
+
+    model = LocalTriageModel.train(train)
+    confident = correct = 0
+    for category_user, description, rank in test:
+        pred, conf = model.predict(category_user, description)
+        if conf >= threshold:
+            confident += 1
+            correct += pred == int(rank)
+    return {
+        "holdout": len(test),
+        "fast_path_rate": confident / len(test),
+        "fast_path_accuracy": (correct / confident) if confident else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local triage model")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train_p = sub.add_parser("train", help="train from historical reports")
+    train_p.add_argument("--out", default=str(MODEL_PATH))
+    train_p.add_argument("--min-ai-confidence", type=float, default=0.5)
+    train_p.add_argument("--threshold", type=float, default=0.85,
+                         help="confidence threshold used for the evaluation report")
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        samples = training_samples(args.min_ai_confidence)
+        if not samples:
+            raise SystemExit("No AI-labelled reports to train on yet.")
+
+        metrics = evaluate(samples, args.threshold)
+        model = LocalTriageModel.train(samples)
+        model.save(args.out)
+        db.close_connection()
+
+        print(f"Trained on {model.trained_on} reports -> {args.out}")
+        if metrics:
+            print(json.dumps(metrics, indent=2))
+
+
+if __name__ == "__main__":
+    main()